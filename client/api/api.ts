@@ -5,8 +5,8 @@ import { UserProfile } from '@/app/(tabs)/profile';
 export const getMealPlanData = async(email: string, userData: UserProfile, update: boolean = false): Promise<DailyMealPlan | null> => {
   try {
     if(update){
-        // Updating Meal
-        const { data } = await axios.post(`${process.env.EXPO_PUBLIC_SERVER_URL}/DailyMealPlan/${email}`, {
+        // Updating Meal: fresh=true so the changed profile gets a new plan, not a cached one for a similar profile
+        const { data } = await axios.post(`${process.env.EXPO_PUBLIC_SERVER_URL}/DailyMealPlan/${email}?fresh=true`, {
           age: userData.age,
           weight: userData.weight,
           targetWeight: userData.targetWeight,
@@ -0,0 +1,256 @@
+"""Shared plumbing for the benchmark scripts.
+
+Benchmarks run the real FastAPI app in-process (httpx ``ASGITransport``)
+against a throwaway SQLite database and a stubbed Groq model, so no
+Postgres server or API key is needed. ``use_database`` points them at a
+real Postgres instead, and ``use_fake_models`` swaps in the recorded-response
+stand-in from ``services/fake_llm.py``.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Any, List, Optional
+
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from sqlmodel import Session, create_engine, delete
+
+from .. import db
+from ..main import app
+from ..migrations import migrate
+from ..models import MealPlanJob, MealPlanVersion, User, UserMealPlan, WeeklyPlanDay
+
+SAMPLE_PLAN = {
+    "total_calories": 2261,
+    "breakfast": {
+        "name": "Oats Bowl",
+        "foods": [
+            {"name": "Rolled oats", "portion": "80g", "emoji": "🥣"},
+            {"name": "Banana", "portion": "120g", "emoji": "🍌"},
+            {"name": "Milk", "portion": "250ml", "emoji": "🥛"},
+        ],
+        "calories": 567, "protein": 20, "carbs": 94, "fats": 14,
+    },
+    "morning_snack": {
+        "name": "Greek Yogurt",
+        "foods": [{"name": "Greek yogurt", "portion": "170g", "emoji": "🥛"}],
+        "calories": 165, "protein": 15, "carbs": 6, "fats": 8,
+    },
+    "lunch": {
+        "name": "Chicken Rice Bowl",
+        "foods": [
+            {"name": "Chicken breast", "portion": "150g", "emoji": "🍗"},
+            {"name": "Brown rice", "portion": "250g", "emoji": "🍚"},
+            {"name": "Broccoli", "portion": "100g", "emoji": "🥦"},
+        ],
+        "calories": 562, "protein": 55, "carbs": 65, "fats": 8,
+    },
+    "afternoon_snack": {
+        "name": "Almonds and Apple",
+        "foods": [
+            {"name": "Almonds", "portion": "40g", "emoji": "🌰"},
+            {"name": "Apple", "portion": "150g", "emoji": "🍎"},
+        ],
+        "calories": 310, "protein": 9, "carbs": 29, "fats": 20,
+    },
+    "dinner": {
+        "name": "Salmon with Quinoa",
+        "foods": [
+            {"name": "Salmon", "portion": "180g", "emoji": "🐟"},
+            {"name": "Quinoa", "portion": "220g", "emoji": "🍚"},
+            {"name": "Spinach", "portion": "80g", "emoji": "🥬"},
+        ],
+        "calories": 657, "protein": 49, "carbs": 50, "fats": 29,
+    },
+    "hydration": "Drink at least 3 litres of water across the day.",
+    "notes": "Benchmark fixture plan.",
+}
+
+PROFILE = {
+    "age": 30,
+    "weight": 80,
+    "targetWeight": 75,
+    "height": 180,
+    "gender": "male",
+    "daily_physical_activity": "moderate",
+    "dietary_preferences": [],
+    "allergies": [],
+}
+
+
+class StubGroq(BaseChatModel):
+    """Chat model that answers with ``SAMPLE_PLAN`` after a fixed delay."""
+
+    latency: float = 0.5
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-groq"
+
+    def _result(self) -> ChatResult:
+        self.calls += 1
+        content = json.dumps(SAMPLE_PLAN)
+        usage = {"input_tokens": 1500, "output_tokens": len(content) // 4}
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        message = AIMessage(content=content, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return self._result()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._result()
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        # Spread the same response over ``latency`` seconds in small chunks
+        self.calls += 1
+        content = json.dumps(SAMPLE_PLAN)
+        chunks = [content[i:i + 32] for i in range(0, len(content), 32)]
+        for chunk in chunks:
+            await asyncio.sleep(self.latency / len(chunks))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
+
+
+def use_sqlite(users: int = 1, pool_size: int = 5, max_overflow: int = 10, asynchronous: bool = False):
+    """
+    Point the app at a fresh SQLite file seeded with ``users`` accounts,
+    through an instrumented pool of ``pool_size`` connections. With
+    ``asynchronous`` requests use an aiosqlite ``AsyncSession`` instead.
+    """
+    path = os.path.join(tempfile.mkdtemp(prefix="nutritrack-bench-"), "bench.db")
+    pool = dict(pool_size=pool_size, max_overflow=max_overflow, pool_timeout=60)
+    engine = create_engine(
+        f"sqlite:///{path}",
+        poolclass=db.TimedQueuePool,
+        connect_args={"check_same_thread": False, "timeout": 30},
+        **pool,
+    )
+    migrate(engine)
+    with Session(engine) as session:
+        for i in range(users):
+            session.add(User(email=f"user{i}@bench.local", password="secret", **PROFILE))
+        session.commit()
+
+    # Fresh counters so the seeding above does not show up in them
+    db.pool_metrics.reset()
+    async_engine = None
+    if asynchronous:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        async_engine = create_async_engine(
+            f"sqlite+aiosqlite:///{path}",
+            poolclass=db.TimedAsyncQueuePool,
+            connect_args={"timeout": 30},
+            **pool,
+        )
+        db.instrument(async_engine.sync_engine, db.pool_metrics)
+    else:
+        db.instrument(engine, db.pool_metrics)
+    db.use_engine(engine, async_engine)
+    return engine
+
+
+def use_database(url: str, asynchronous: bool = False):
+    """
+    Point the app at an existing database, e.g. a local Postgres, with the
+    pool settings from ``DB_POOL_*``. Rows left by earlier benchmark runs
+    (``@bench.local`` emails) are deleted first; nothing else is touched.
+    """
+    engine = create_engine(url, **db.engine_options(url))
+    migrate(engine)
+    with Session(engine) as session:
+        for table in (User, UserMealPlan, MealPlanVersion, WeeklyPlanDay, MealPlanJob):
+            session.exec(delete(table).where(table.email.like("%@bench.local")))
+        session.commit()
+
+    db.pool_metrics.reset()
+    async_engine = None
+    if asynchronous:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        async_url = url.replace("postgresql://", "postgresql+asyncpg://", 1)
+        async_engine = create_async_engine(async_url, **db.engine_options(async_url, asynchronous=True))
+        db.instrument(async_engine.sync_engine, db.pool_metrics)
+    else:
+        db.instrument(engine, db.pool_metrics)
+    db.use_engine(engine, async_engine)
+    return engine
+
+
+def use_stub_models(latency: float, rate_limits: bool = False) -> List[StubGroq]:
+    """
+    Replace every Groq model in the fallback list with a ``StubGroq``.
+    Groq's per-minute quotas are lifted unless ``rate_limits`` is set.
+    """
+    from ..services import groq_ai
+    from ..services.rate_limiter import rate_limiter
+
+    stubs = []
+    for i, (name, _) in enumerate(groq_ai.llm_models):
+        stub = StubGroq(latency=latency)
+        groq_ai.llm_models[i] = (name, stub)
+        stubs.append(stub)
+        if not rate_limits:
+            rate_limiter.budgets.pop(name, None)
+    return stubs
+
+
+def use_fake_models(rate_limits: bool = False, **settings) -> list:
+    """
+    Replace every Groq model with a ``FakeChatModel`` replaying recorded
+    plans; ``settings`` (latency, tokens_per_second, rate_limit_rate, ...)
+    override its ``FAKE_LLM_*`` defaults.
+    """
+    from ..services import groq_ai
+    from ..services.fake_llm import fake_model
+    from ..services.rate_limiter import rate_limiter
+
+    fakes = []
+    for i, (name, _) in enumerate(groq_ai.llm_models):
+        fake = fake_model(name, **settings)
+        groq_ai.llm_models[i] = (name, fake)
+        fakes.append(fake)
+        if not rate_limits:
+            rate_limiter.budgets.pop(name, None)
+    return fakes
+
+
+def client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None
+    )
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def report(label: str, samples: List[float], elapsed: Optional[float] = None) -> None:
+    line = (
+        f"{label:<48} n={len(samples):<6} "
+        f"p50={percentile(samples, 50) * 1000:8.2f}ms "
+        f"p99={percentile(samples, 99) * 1000:8.2f}ms"
+    )
+    if elapsed:
+        line += f"  {len(samples) / elapsed:8.1f} req/s"
+    print(line)
+
+
+async def timed(samples: List[float], call: Any) -> Any:
+    start = time.perf_counter()
+    response = await call
+    samples.append(time.perf_counter() - start)
+    return response
@@ -0,0 +1,63 @@
+"""Event-loop responsiveness while meal plans are being generated.
+
+Fires N parallel ``POST /DailyMealPlan/{email}`` requests against a stubbed
+Groq model and, at the same time, keeps hitting the login and get-meal-plan
+endpoints. If plan generation blocked the loop, the p99 of the other
+endpoints would approach the stub latency.
+
+    python -m server.benchmarks.concurrency --plans 50 --latency 1.0
+"""
+import argparse
+import asyncio
+import time
+
+from ._harness import PROFILE, SAMPLE_PLAN, client, report, timed, use_sqlite, use_stub_models
+
+
+async def run(plans: int, latency: float, pollers: int) -> None:
+    use_sqlite(users=plans)
+    use_stub_models(latency)
+
+    generate, login, fetch = [], [], []
+    done = asyncio.Event()
+
+    async with client() as http:
+        await http.post("/user-meal-plan/add-meal-plan/user0@bench.local", json=SAMPLE_PLAN)
+
+        async def poll():
+            while not done.is_set():
+                await timed(login, http.post(
+                    "/user/login", json={"email": "user0@bench.local", "password": "secret"}
+                ))
+                await timed(fetch, http.get("/user-meal-plan/get-meal-plan/user0@bench.local"))
+
+        poll_tasks = [asyncio.create_task(poll()) for _ in range(pollers)]
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            # distinct weights so the requests are not coalesced into one LLM call
+            timed(generate, http.post(
+                f"/DailyMealPlan/user{i}@bench.local?fresh=true", json=dict(PROFILE, weight=50 + 3 * i)
+            ))
+            for i in range(plans)
+        ))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await asyncio.gather(*poll_tasks)
+
+    print(f"{plans} parallel generations, stub latency {latency:.2f}s, wall {elapsed:.2f}s")
+    report("POST /DailyMealPlan/{email}", generate)
+    report("POST /user/login (concurrent)", login)
+    report("GET /user-meal-plan/get-meal-plan (concurrent)", fetch)
+
+
+def main() -> None:
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--plans", type=int, default=50)
+    cli.add_argument("--latency", type=float, default=1.0)
+    cli.add_argument("--pollers", type=int, default=4)
+    args = cli.parse_args()
+    asyncio.run(run(args.plans, args.latency, args.pollers))
+
+
+if __name__ == "__main__":
+    main()
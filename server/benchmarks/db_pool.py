@@ -0,0 +1,114 @@
+"""Connection-pool saturation under several hundred concurrent requests.
+
+Fires N concurrent ``GET /user-meal-plan/get-meal-plan/{email}/lunch`` requests
+(one uncached DB read each; the whole-plan route is served from cached
+bytes) at the app for each pool configuration, with every SQL statement delayed by
+--statement-latency to stand in for a network round trip to Postgres. For
+each run it reports throughput, request latency and how long requests queued
+for a pooled connection (from ``db.pool_stats()``).
+
+"threaded" runs the sync engine behind the threadpool (the default), "async"
+the aiosqlite ``AsyncSession`` path that DB_ASYNC enables for asyncpg. A
+pool of size P can serve at most P / (statements per request x latency)
+requests per second, but requests also queue for the CPU, threads and the
+event loop, so how close a run gets to that ceiling does not say which one
+limits it. Each configuration is therefore also run with twice the pool: it
+is pool-bound when that buys more than --bound-gain throughput. Pool waits
+count only checkouts that found every connection taken. Fails if the last
+configuration is pool-bound.
+
+    python -m server.benchmarks.db_pool --requests 500 --configs threaded:5 async:100
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from sqlalchemy import event
+from sqlalchemy.util import await_only
+
+from .. import db
+from ._harness import SAMPLE_PLAN, client, percentile, report, timed, use_sqlite
+
+
+def add_statement_latency(seconds: float, asynchronous: bool, counter: list) -> None:
+    engine = db.async_engine.sync_engine if asynchronous else db.engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def slow_down(*args):
+        counter[0] += 1
+        # The async engine runs events on the event loop, so it must not block it
+        if asynchronous:
+            await_only(asyncio.sleep(seconds))
+        else:
+            time.sleep(seconds)
+
+
+async def run(mode: str, size: int, requests: int, latency: float, quiet: bool = False) -> float:
+    """Throughput of one burst with a pool of ``size``; reported unless ``quiet``."""
+    asynchronous = mode == "async"
+    use_sqlite(users=1, pool_size=size, max_overflow=0, asynchronous=asynchronous)
+
+    samples = []
+    statements = [0]
+    async with client() as http:
+        await http.post("/user-meal-plan/add-meal-plan/user0@bench.local", json=SAMPLE_PLAN)
+        add_statement_latency(latency, asynchronous, statements)
+
+        def burst(samples):
+            return asyncio.gather(*(
+                timed(samples, http.get("/user-meal-plan/get-meal-plan/user0@bench.local/lunch"))
+                for _ in range(requests)
+            ))
+
+        # An untimed burst first, so connections are already open as in a running server
+        await burst([])
+        db.pool_metrics.reset()
+        statements[0] = 0
+
+        start = time.perf_counter()
+        responses = await burst(samples)
+        elapsed = time.perf_counter() - start
+
+    throughput = requests / elapsed
+    if quiet:
+        return throughput
+    stats = db.pool_stats()
+    ceiling = size / (statements[0] / requests * latency)
+    report(f"{mode}, pool {size}", samples, elapsed)
+    print(f"    p95={percentile(samples, 95) * 1000:.2f}ms, pool ceiling {ceiling:,.0f} req/s ({throughput / ceiling:.0%} used)")
+    print(
+        f"    pool wait avg={stats['wait_ms_avg']:.2f}ms p95={stats['wait_ms_p95']:.2f}ms "
+        f"max={stats['wait_ms_max']:.2f}ms, queued {stats['waited']}/{stats['checkouts']} checkouts, "
+        f"statuses: {sorted({response.status_code for response in responses})}"
+    )
+    return throughput
+
+
+def main() -> None:
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--requests", type=int, default=500)
+    cli.add_argument("--statement-latency", type=float, default=0.02, help="seconds added to every SQL statement")
+    cli.add_argument(
+        "--configs", nargs="+", default=["threaded:5", "threaded:20", "threaded:40", "async:20", "async:200"],
+        help="mode:pool_size pairs, mode being threaded or async",
+    )
+    cli.add_argument("--bound-gain", type=float, default=0.2, help="throughput gain from doubling the pool that makes it the bottleneck")
+    args = cli.parse_args()
+
+    print(f"{args.requests} concurrent requests, {args.statement_latency * 1000:.0f}ms per statement")
+    bound = False
+    for config in args.configs:
+        mode, size = config.split(":")
+        throughput = asyncio.run(run(mode, int(size), args.requests, args.statement_latency))
+        doubled = asyncio.run(run(mode, 2 * int(size), args.requests, args.statement_latency, quiet=True))
+        gain = doubled / throughput - 1
+        bound = gain > args.bound_gain
+        print(f"    pool {2 * int(size)}: {doubled:.1f} req/s ({gain:+.0%}){'  <- pool-bound' if bound else ''}")
+
+    print(f"FAIL: {args.configs[-1]} is still pool-bound" if bound else "PASS")
+    sys.exit(1 if bound else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Local macro recomputation throughput against the bundled food table.
+
+Builds N variants of the fixture plan with randomized gram portions and
+times ``food_table.meal_nutrients`` over the whole batch (one vectorized
+pass), then ``food_table.recompute`` one plan at a time as the request path
+calls it. Fails if the batch rate is below --target plans per second.
+
+    python -m server.benchmarks.food_recompute --plans 10000
+"""
+import argparse
+import copy
+import random
+import sys
+import time
+
+from ._harness import SAMPLE_PLAN
+from ..services.food_db import food_table
+from ..services.plan_patch import MEAL_SLOTS
+
+
+def make_plans(count: int, seed: int = 7):
+    rng = random.Random(seed)
+    plans = []
+    for _ in range(count):
+        plan = copy.deepcopy(SAMPLE_PLAN)
+        for slot in MEAL_SLOTS:
+            for food in plan[slot]["foods"]:
+                # Models tend to round portions, so 10 g steps keep the variety realistic
+                food["portion"] = f"{rng.randrange(30, 300, 10)}g"
+        plans.append(plan)
+    return plans
+
+
+def rate(count: int, seconds: float) -> str:
+    return f"{count / seconds:12,.0f} plans/s  ({seconds / count * 1e6:7.1f} us/plan)"
+
+
+def main() -> None:
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--plans", type=int, default=10000)
+    cli.add_argument("--target", type=float, default=10000, help="minimum batch plans per second")
+    args = cli.parse_args()
+
+    plans = make_plans(args.plans)
+    foods = sum(len(plan[slot]["foods"]) for plan in plans for slot in MEAL_SLOTS)
+
+    start = time.perf_counter()
+    food_table.meal_nutrients(plans)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    totals = food_table.meal_nutrients(plans)
+    batch = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for plan in plans:
+        food_table.recompute([plan])
+    single = time.perf_counter() - start
+
+    print(f"{args.plans} plans, {foods} foods, {totals.shape[0] * totals.shape[1]} meals")
+    print(f"  batch, cold name cache  {rate(args.plans, cold)}")
+    print(f"  batch, warm             {rate(args.plans, batch)}")
+    print(f"  recompute one at a time {rate(args.plans, single)}")
+    print(f"  lookups: {food_table.stats}")
+
+    ok = args.plans / batch >= args.target
+    print("PASS" if ok else f"FAIL: below {args.target:,.0f} plans/s")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
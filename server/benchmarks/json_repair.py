@@ -0,0 +1,76 @@
+"""Model calls per meal plan when some responses are malformed, with and without repair.
+
+Generates --plans plans through the fake Groq provider with --malformed-rate
+of its responses broken the ways real ones are (trailing commas, truncation,
+single quotes, surrounding prose), once with LangChain's plain
+``JsonOutputParser`` and once with the repairing parser. Every response the
+plain parser rejects costs a fallback call on the next model. Fails unless
+repair needs fewer calls per plan and no request fails.
+
+    python -m server.benchmarks.json_repair --plans 200 --malformed-rate 0.2
+"""
+import argparse
+import asyncio
+import logging
+import sys
+
+from langchain_core.output_parsers import JsonOutputParser
+
+from ._harness import PROFILE, client, use_fake_models, use_sqlite
+from ..schemas import DailyPlan, MealPlanPatch
+from ..services import groq_ai
+from ..services.json_repair import repair_stats
+from ..services.plan_synth import plan_synthesizer
+
+
+async def run(plans: int, malformed_rate: float, concurrency: int) -> bool:
+    use_sqlite(users=plans)
+    plan_synthesizer.mode = "off"
+    repaired_templates = dict(groq_ai._templates)
+    plain_templates = {
+        "generate": (groq_ai.prompt, JsonOutputParser(pydantic_object=DailyPlan)),
+        "update": (groq_ai.update_prompt, JsonOutputParser(pydantic_object=DailyPlan)),
+        "patch": (groq_ai.patch_prompt, JsonOutputParser(pydantic_object=MealPlanPatch)),
+    }
+
+    results = {}
+    for label, templates in (("plain JsonOutputParser", plain_templates), ("repairing parser", repaired_templates)):
+        groq_ai._templates.update(templates)
+        groq_ai._chains.clear()
+        # Same seed, so both runs see the same malformed responses
+        fakes = use_fake_models(latency="fixed:0.05", tokens_per_second=0, malformed_rate=malformed_rate, seed="repair")
+        slots = asyncio.Semaphore(concurrency)
+        async with client() as http:
+            async def generate(i):
+                async with slots:
+                    response = await http.post(
+                        f"/DailyMealPlan/user{i}@bench.local?fresh=true", json=dict(PROFILE, weight=50 + i % 60)
+                    )
+                    return response.status_code
+
+            statuses = await asyncio.gather(*(generate(i) for i in range(plans)))
+        calls = sum(fake.calls for fake in fakes)
+        failed = sum(status != 200 for status in statuses)
+        results[label] = (calls / plans, failed)
+        print(f"{label:<24} model calls per plan: {calls / plans:.3f}  failed requests: {failed}")
+
+    print(f"repair stats: {repair_stats.snapshot()}")
+    (plain_calls, _), (repaired_calls, repaired_failed) = results.values()
+    return repaired_calls < plain_calls and repaired_failed == 0
+
+
+def main() -> None:
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--plans", type=int, default=200)
+    cli.add_argument("--malformed-rate", type=float, default=0.2)
+    cli.add_argument("--concurrency", type=int, default=16)
+    args = cli.parse_args()
+    for name in ("httpx", "server"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    ok = asyncio.run(run(args.plans, args.malformed_rate, args.concurrency))
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Throughput and tail latency of the users, mealList and userMealPlan routers.
+
+Seeds --users accounts, each with a stored plan and its first history
+version, then drives one scenario at a time with --concurrency clients in
+flight until --requests have completed, and reports req/s with p50, p95
+and p99. Meal plan generation goes through the fake Groq provider
+(``services/fake_llm.py``), which replays recorded plans with the given
+time to first token, token rate and injected 429s, timeouts and malformed
+JSON, seeded so two runs see the same sequence.
+
+Runs against a throwaway SQLite file by default, or a local Postgres with
+--database-url. --output saves the results as JSON; --baseline compares a
+run with saved results and fails when a scenario's p95 got more than
+--max-regression slower or its throughput dropped by as much, so a
+regression is caught before deploy.
+
+    python -m server.benchmarks.load --concurrency 32 --requests 400 --output load.json
+    python -m server.benchmarks.load --database-url postgresql://postgres:pw@localhost/nutritrack_bench --baseline load.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from typing import Callable, Dict, List
+
+from sqlmodel import Session
+
+from ._harness import PROFILE, SAMPLE_PLAN, client, percentile, use_database, use_fake_models, use_sqlite
+from ..models import MealPlanVersion, User, UserMealPlan
+from ..services.fake_llm import FAKE_LLM_RECORDINGS, load_recordings
+from ..services.passwords import hash_password
+from ..services.plan_synth import plan_synthesizer
+
+UPDATE_PROMPT = "Swap the afternoon snack for something with more protein"
+
+
+def seed(engine, users: int) -> None:
+    """Accounts with one shared scrypt hash; every third is vegetarian and gets a vegetarian plan."""
+    password = hash_password("secret")
+    vegetarian_plan = json.loads(load_recordings(FAKE_LLM_RECORDINGS)[1])
+    now = time.time()
+    with Session(engine) as session:
+        for i in range(users):
+            email = f"user{i}@bench.local"
+            vegetarian = i % 3 == 0
+            plan = vegetarian_plan if vegetarian else SAMPLE_PLAN
+            session.add(User(email=email, password=password, **dict(PROFILE, dietary_preferences=["vegetarian"] if vegetarian else [])))
+            session.add(UserMealPlan(email=email, meal_plan=plan, version=1))
+            session.add(MealPlanVersion(email=email, version=1, kind="snapshot", payload=plan, source="generate", created_at=now))
+        session.commit()
+
+
+def scenarios(users: int) -> Dict[str, Callable]:
+    """Scenario name -> ``request(http, i)`` for the i-th request of a run."""
+    emails = [f"user{i}@bench.local" for i in range(users)]
+    # The recorded plans are not all vegetarian, so model-backed scenarios use the other users
+    omnivores = [email for i, email in enumerate(emails) if i % 3]
+
+    def pick(pool: List[str], i: int) -> str:
+        return pool[i % len(pool)]
+
+    return {
+        "users.login": lambda http, i: http.post("/user/login", json={"email": pick(emails, i), "password": "secret"}),
+        "users.showAll": lambda http, i: http.get("/user/showAll", params={"limit": 100}),
+        "users.search": lambda http, i: http.get("/user/search", params={"dietary_preference": "vegetarian"}),
+        # Distinct weights so concurrent requests are not coalesced into one model call
+        "mealList.generate": lambda http, i: http.post(
+            f"/DailyMealPlan/{pick(omnivores, i)}?fresh=true", json=dict(PROFILE, weight=60 + i % 40)
+        ),
+        "mealList.update": lambda http, i: http.post(
+            f"/DailyMealPlan/UpdateMealPlan/{pick(omnivores, i)}",
+            json={"prompt": UPDATE_PROMPT, "previousMealPlan": SAMPLE_PLAN, "mode": "patch"},
+        ),
+        "userMealPlan.get": lambda http, i: http.get(f"/user-meal-plan/get-meal-plan/{pick(emails, i)}"),
+        "userMealPlan.meal": lambda http, i: http.get(f"/user-meal-plan/get-meal-plan/{pick(emails, i)}/lunch"),
+        "userMealPlan.history": lambda http, i: http.get(f"/user-meal-plan/history/{pick(emails, i)}"),
+    }
+
+
+async def drive(http, request: Callable, total: int, concurrency: int) -> dict:
+    """``total`` requests with ``concurrency`` of them in flight at any time."""
+    samples: List[float] = []
+    statuses: Dict[int, int] = {}
+    issued = iter(range(total))
+
+    async def worker():
+        for i in issued:
+            start = time.perf_counter()
+            try:
+                status = (await request(http, i)).status_code
+            except Exception:
+                status = 0
+            samples.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    errors = sum(count for status, count in statuses.items() if not 200 <= status < 300)
+    return {
+        "requests": total,
+        "errors": errors,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "throughput": round(total / elapsed, 2),
+        **{f"p{pct}_ms": round(percentile(samples, pct) * 1000, 2) for pct in (50, 95, 99)},
+    }
+
+
+def regressions(results: dict, baseline: dict, max_regression: float, min_delta_ms: float) -> List[str]:
+    found = []
+    for name, result in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        # The absolute floor keeps sub-millisecond jitter on fast endpoints from failing a run
+        slower = result["p95_ms"] - before["p95_ms"]
+        if slower > min_delta_ms and result["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            found.append(f"{name}: p95 {before['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms")
+        if result["throughput"] < before["throughput"] * (1 - max_regression):
+            found.append(f"{name}: {before['throughput']:.1f} -> {result['throughput']:.1f} req/s")
+    return found
+
+
+async def run(args) -> dict:
+    if args.database_url:
+        engine = use_database(args.database_url, asynchronous=args.asynchronous)
+    else:
+        engine = use_sqlite(users=0, pool_size=args.pool_size, max_overflow=args.pool_size, asynchronous=args.asynchronous)
+    seed(engine, args.users)
+    # Without --synth the meal library built from the seeded plans stays out of the way of the model calls
+    plan_synthesizer.mode = "first" if args.synth else "off"
+    fakes = use_fake_models(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        rate_limit_rate=args.rate_limit_rate,
+        timeout_rate=args.timeout_rate,
+        malformed_rate=args.malformed_rate,
+        timeout=args.timeout,
+        seed=str(args.seed),
+    )
+
+    table = scenarios(args.users)
+    names = args.scenarios.split(",") if args.scenarios else list(table)
+    unknown = [name for name in names if name not in table]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)} (choose from {', '.join(table)})")
+
+    results = {}
+    async with client() as http:
+        for name in names:
+            if args.warmup:
+                await drive(http, table[name], args.warmup, min(args.concurrency, args.warmup))
+            result = results[name] = await drive(http, table[name], args.requests, args.concurrency)
+            print(
+                f"{name:<22} {result['throughput']:8.1f} req/s  p50={result['p50_ms']:8.1f}ms  "
+                f"p95={result['p95_ms']:8.1f}ms  p99={result['p99_ms']:8.1f}ms  errors={result['errors']} {result['statuses']}"
+            )
+
+    outcomes: Dict[str, int] = {}
+    for fake in fakes:
+        for outcome, count in fake.outcomes.items():
+            outcomes[outcome] = outcomes.get(outcome, 0) + count
+    print(f"fake model calls: {sum(fake.calls for fake in fakes)} {outcomes}")
+    settings = {
+        key: value for key, value in vars(args).items()
+        if key not in ("output", "baseline", "max_regression", "min_delta_ms", "max_error_rate")
+    }
+    # The URL may carry a password
+    settings["database_url"] = "postgres" if args.database_url else "sqlite"
+    return {"settings": settings, "scenarios": results, "model_outcomes": outcomes}
+
+
+def main() -> None:
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--scenarios", help="comma-separated subset of the scenarios, all by default")
+    cli.add_argument("--concurrency", type=int, default=32, help="requests in flight")
+    cli.add_argument("--requests", type=int, default=400, help="measured requests per scenario")
+    cli.add_argument("--warmup", type=int, default=20, help="unmeasured requests before each scenario")
+    cli.add_argument("--users", type=int, default=300)
+    cli.add_argument("--database-url", help="e.g. a local Postgres; a throwaway SQLite file when omitted")
+    cli.add_argument("--async", dest="asynchronous", action="store_true", help="serve through the async engine (DB_ASYNC)")
+    cli.add_argument("--pool-size", type=int, default=20, help="SQLite pool size; Postgres uses DB_POOL_SIZE")
+    cli.add_argument("--synth", action="store_true", help="let the meal library answer generations")
+    cli.add_argument("--latency", default="lognormal:0.4:0.5", help="fake model time to first token distribution")
+    cli.add_argument("--tokens-per-second", type=float, default=250)
+    cli.add_argument("--rate-limit-rate", type=float, default=0.0)
+    cli.add_argument("--timeout-rate", type=float, default=0.0)
+    cli.add_argument("--malformed-rate", type=float, default=0.0)
+    cli.add_argument("--timeout", type=float, default=10.0, help="seconds a fake timeout hangs")
+    cli.add_argument("--seed", type=int, default=1)
+    cli.add_argument("--output", help="write the results as JSON")
+    cli.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    cli.add_argument("--max-regression", type=float, default=0.2, help="allowed p95 / throughput change, 0.2 = 20%%")
+    cli.add_argument("--min-delta-ms", type=float, default=5.0, help="p95 changes below this never count")
+    cli.add_argument("--max-error-rate", type=float, default=0.01, help="allowed share of non-2xx responses per scenario")
+    args = cli.parse_args()
+    # Per-request INFO lines from the client and the app would bury the report
+    for name in ("httpx", "server"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    failures = [
+        f"{name}: {result['errors']}/{result['requests']} errors"
+        for name, result in results["scenarios"].items()
+        if result["errors"] > result["requests"] * args.max_error_rate
+    ]
+    if args.baseline:
+        with open(args.baseline) as file:
+            failures += regressions(results, json.load(file), args.max_regression, args.min_delta_ms)
+    for failure in failures:
+        print(f"  {failure}")
+    print("FAIL" if failures else "PASS")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Login throughput and event-loop responsiveness under a login storm.
+
+Seeds N accounts, most with a scrypt hash and the first few still in
+plaintext (to be upgraded on their first login), then fires ``--logins``
+``POST /user/login`` requests ``--concurrency`` at a time, verifying on
+the hashing pool and inline on the event loop as the baseline.
+
+Each way runs twice. First with a ticker measuring how late the event
+loop wakes it up and a probe calling a cheap endpoint: the probe gets far
+more requests served while the pool hashes, which costs logins CPU on a
+single core. Then with logins alone, for their throughput. Fails if any
+login is refused, if the loop's p99 lag exceeds --max-lag with the pool,
+or if the pool's login throughput falls more than --max-throughput-drop
+below the baseline's.
+
+    python -m server.benchmarks.login_storm --logins 200 --concurrency 32
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from sqlalchemy import insert, update
+
+from .. import db
+from ..controllers import users as users_controller
+from ..models import User
+from ..services.passwords import PASSWORD_HASH_WORKERS, PasswordHasher, hash_password
+from ._harness import PROFILE, client, percentile, report, timed, use_sqlite
+
+TICK = 0.005
+
+
+def seed(accounts: int, legacy: int):
+    hashed = hash_password("secret")
+    rows = [dict(PROFILE, email=f"user{i}@bench.local", password="secret") for i in range(1, accounts)]
+    with db.engine.begin() as connection:
+        connection.execute(insert(User), rows)
+        connection.execute(update(User).where(User.id > legacy).values(password=hashed))
+
+
+async def ticker(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def storm(label: str, workers: int, logins: int, concurrency: int, accounts: int, probing: bool = True) -> tuple:
+    hasher = PasswordHasher(workers=workers)
+    users_controller.password_hasher = hasher
+    lags, probes, samples, statuses = [], [], [], []
+    stop = asyncio.Event()
+    gate = asyncio.Semaphore(concurrency)
+
+    async with client() as http:
+        async def login(i: int):
+            async with gate:
+                body = {"email": f"user{i % accounts}@bench.local", "password": "secret"}
+                statuses.append((await timed(samples, http.post("/user/login", json=body))).status_code)
+
+        async def probe():
+            while not stop.is_set():
+                await timed(probes, http.get("/diagnostics/db-pool"))
+                await asyncio.sleep(TICK)
+
+        background = [asyncio.create_task(ticker(lags, stop)), asyncio.create_task(probe())] if probing else []
+        start = time.perf_counter()
+        await asyncio.gather(*(login(i) for i in range(logins)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await asyncio.gather(*background)
+
+    print(f"{label}")
+    report("  POST /user/login", samples, elapsed)
+    if probing:
+        report("  GET /diagnostics/db-pool (probe)", probes)
+        print(f"  event-loop lag: p50={percentile(lags, 50) * 1000:.2f}ms p99={percentile(lags, 99) * 1000:.2f}ms max={max(lags) * 1000:.2f}ms")
+    print(f"  statuses: {sorted(set(statuses))}, hasher: {hasher.stats()}")
+    return percentile(lags, 99) if probing else None, len(samples) / elapsed, set(statuses)
+
+
+async def run(args) -> bool:
+    use_sqlite(users=1)
+    seed(args.accounts, args.legacy)
+    pool = f"hashing pool ({PASSWORD_HASH_WORKERS} workers)"
+    inline = "inline on the event loop (baseline)"
+    common = (args.logins, args.concurrency, args.accounts)
+    pooled_lag, _, pooled = await storm(f"{pool}, with probe", PASSWORD_HASH_WORKERS, *common)
+    _, _, baseline = await storm(f"{inline}, with probe", 0, *common)
+    _, pooled_rate, pooled_quiet = await storm(f"{pool}, logins only", PASSWORD_HASH_WORKERS, *common, probing=False)
+    _, inline_rate, baseline_quiet = await storm(f"{inline}, logins only", 0, *common, probing=False)
+
+    drop = 1 - pooled_rate / inline_rate
+    print(f"login throughput with the pool: {pooled_rate:.1f} vs {inline_rate:.1f} req/s inline ({-drop:+.1%})")
+    statuses_ok = pooled == baseline == pooled_quiet == baseline_quiet == {200}
+    return statuses_ok and pooled_lag <= args.max_lag and drop <= args.max_throughput_drop
+
+
+def main() -> None:
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--logins", type=int, default=200)
+    cli.add_argument("--concurrency", type=int, default=32)
+    cli.add_argument("--accounts", type=int, default=50)
+    cli.add_argument("--legacy", type=int, default=10, help="accounts left with plaintext passwords")
+    cli.add_argument("--max-lag", type=float, default=0.05, help="p99 event-loop lag, seconds")
+    cli.add_argument(
+        "--max-throughput-drop", type=float, default=0.1,
+        help="login throughput the pool may lose against inline hashing, as a fraction",
+    )
+    args = cli.parse_args()
+    ok = asyncio.run(run(args))
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
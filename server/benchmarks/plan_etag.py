@@ -0,0 +1,96 @@
+"""Cost of re-reading a stored plan: uncached, cached bytes, and 304.
+
+Times N sequential ``GET /user-meal-plan/get-meal-plan/{email}`` requests
+three ways: with the response cache invalidated before each one (the old
+path: DB read plus serialization), served from the cached bytes, and with
+a matching ``If-None-Match`` so the answer is an empty 304. Counts the SQL
+statements each phase runs. Then saves a new version straight to the
+database, as another worker would, without invalidating this worker's
+cache. Fails if the cached or 304 phases run more than one version probe
+per ``PLAN_VERSION_TTL`` seconds, or if the other worker's save is not
+served once that long has passed.
+
+    python -m server.benchmarks.plan_etag --requests 2000
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from sqlalchemy import event
+from sqlmodel import Session
+
+from .. import db
+from ..models import UserMealPlan
+from ..services.response_cache import plan_responses
+from ._harness import SAMPLE_PLAN, client, report, timed, use_sqlite
+
+EMAIL = "user0@bench.local"
+
+
+async def run(requests: int) -> bool:
+    use_sqlite(users=1)
+    statements = [0]
+
+    @event.listens_for(db.engine, "before_cursor_execute")
+    def count(*args):
+        statements[0] += 1
+
+    ok = True
+    async with client() as http:
+        await http.post(f"/user-meal-plan/add-meal-plan/{EMAIL}", json=SAMPLE_PLAN)
+        url = f"/user-meal-plan/get-meal-plan/{EMAIL}"
+        etag = (await http.get(url)).headers["etag"]
+
+        async def uncached():
+            plan_responses.invalidate(EMAIL)
+            return await http.get(url)
+
+        phases = [
+            ("uncached (DB read + serialize)", uncached, 200, True),
+            ("cached bytes", lambda: http.get(url), 200, False),
+            ("If-None-Match -> 304", lambda: http.get(url, headers={"If-None-Match": etag}), 304, False),
+        ]
+        for label, call, expected, reads_plan in phases:
+            samples = []
+            statements[0] = 0
+            statuses = set()
+            start = time.perf_counter()
+            for _ in range(requests):
+                statuses.add((await timed(samples, call())).status_code)
+            elapsed = time.perf_counter() - start
+            report(label, samples, elapsed)
+            print(f"    statuses: {sorted(statuses)}, SQL statements: {statements[0]}")
+            # Only a version probe once the checked version is PLAN_VERSION_TTL old
+            probes = elapsed / plan_responses.version_ttl + 1
+            ok = ok and statuses == {expected} and (reads_plan or statements[0] <= probes)
+
+        # Another worker's save: nothing here is invalidated, the next version probe has to notice
+        with Session(db.engine) as session:
+            row = session.get(UserMealPlan, EMAIL)
+            row.meal_plan = dict(SAMPLE_PLAN, notes="saved by another worker")
+            row.version += 1
+            session.add(row)
+            session.commit()
+            saved = row.version
+        await asyncio.sleep(plan_responses.version_ttl)
+        response = await http.get(url, headers={"If-None-Match": etag})
+        fresh = response.status_code == 200 and response.json()["version"] == saved
+        print(f"after another worker's save: {response.status_code}, version {response.json().get('version')} (saved {saved})")
+        ok = ok and fresh
+
+    print(f"response cache: {plan_responses.stats()}")
+    return ok
+
+
+def main() -> None:
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--requests", type=int, default=2000)
+    args = cli.parse_args()
+    ok = asyncio.run(run(args.requests))
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Template-first plan synthesis: hit rate and latency.
+
+Seeds the meal library with N variants of the fixture plan (randomized
+portions, foods dropped) and asks the synthesizer for plans for M random
+profiles and diets, as ``meal_plan_generator`` does before calling Groq.
+
+    python -m server.benchmarks.plan_synth --library 300 --profiles 500
+"""
+import argparse
+import copy
+import random
+import time
+
+from ._harness import SAMPLE_PLAN, percentile
+from ..services.food_db import food_table
+from ..services.nutrition import compute_targets
+from ..services.plan_patch import MEAL_SLOTS
+from ..services.plan_synth import MealLibrary, PlanSynthesizer
+
+ACTIVITY = ["sedentary", "lightly active", "moderately active", "very active"]
+DIETS = [[], [], ["vegetarian"], ["vegan"]]
+
+
+def seed(library: MealLibrary, count: int, rng: random.Random):
+    for index in range(count):
+        plan = copy.deepcopy(SAMPLE_PLAN)
+        for slot in MEAL_SLOTS:
+            meal = plan[slot]
+            meal["name"] = f"{meal['name']} #{index}"
+            if len(meal["foods"]) > 1 and rng.random() < 0.3:
+                meal["foods"].pop(rng.randrange(len(meal["foods"])))
+            for food in meal["foods"]:
+                food["portion"] = f"{rng.randrange(30, 300, 10)}g"
+        # The table numbers stand in for what plan validation stores
+        food_table.recompute([plan])
+        library.add_plan(plan)
+
+
+def main() -> None:
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--library", type=int, default=300, help="plans seeded into the library")
+    cli.add_argument("--profiles", type=int, default=500)
+    args = cli.parse_args()
+
+    rng = random.Random(11)
+    library = MealLibrary()
+    seed(library, args.library, rng)
+    synthesizer = PlanSynthesizer(library, mode="first")
+
+    samples = []
+    for _ in range(args.profiles):
+        weight = rng.uniform(50, 110)
+        targets = compute_targets(
+            rng.randint(18, 65), weight, weight + rng.uniform(-10, 10),
+            rng.uniform(150, 195), rng.choice(["male", "female"]), rng.choice(ACTIVITY),
+        )
+        start = time.perf_counter()
+        synthesizer.synthesize(targets, weight, rng.choice(DIETS))
+        samples.append(time.perf_counter() - start)
+
+    stats = synthesizer.stats()
+    print(f"library {stats['library']}")
+    print(
+        f"{args.profiles} profiles: hit rate {stats['hit_rate']:.1%}, misses {stats['miss_reasons']}"
+    )
+    print(
+        f"  latency p50 {percentile(samples, 50) * 1000:6.2f} ms   p95 {percentile(samples, 95) * 1000:6.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
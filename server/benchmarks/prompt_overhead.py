@@ -0,0 +1,74 @@
+"""Per-call prompt CPU overhead and prompt token counts.
+
+"before" rebuilds the update PromptTemplate, re-dumps the DailyPlan JSON
+schema and composes a new ``prompt | model | parser`` runnable on every
+call, as the generators used to. "after" reuses the module-level templates
+and cached chains. Token counts compare SCHEMA_INSTRUCTIONS=full and compact.
+
+    python -m server.benchmarks.prompt_overhead --iterations 2000
+"""
+import argparse
+import time
+
+from langchain_core.prompts import PromptTemplate
+
+from ._harness import PROFILE, SAMPLE_PLAN, StubGroq
+from ..schemas import DailyPlan
+from ..services import groq_ai
+from ..services.rate_limiter import estimate_tokens
+
+USER_DATA = dict(PROFILE, dietary_preferences=["vegetarian"], allergies=["peanuts"])
+
+
+def per_call_us(fn, iterations: int) -> float:
+    start = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - start) / iterations * 1e6
+
+
+def main() -> None:
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--iterations", type=int, default=2000)
+    args = cli.parse_args()
+
+    model = StubGroq()
+    previous = DailyPlan.model_validate(SAMPLE_PLAN)
+
+    def before():
+        inputs = groq_ai.build_update_request("swap my afternoon snack", previous, USER_DATA)
+        template = PromptTemplate(
+            template=groq_ai.update_prompt.template,
+            input_variables=groq_ai.update_prompt.input_variables,
+            partial_variables={"format_instructions": groq_ai.parser.get_format_instructions()},
+        )
+        chain = template | model | groq_ai.parser
+        return chain, template.format(**inputs)
+
+    def after():
+        inputs = groq_ai.build_update_request("swap my afternoon snack", previous, USER_DATA)
+        chain = groq_ai.chain_for("update", "stub", model)
+        return chain, groq_ai.update_prompt.format(**inputs)
+
+    print(f"per-call prompt/chain CPU, {args.iterations} iterations")
+    print(f"  before: {per_call_us(before, args.iterations):8.1f} us")
+    print(f"  after:  {per_call_us(after, args.iterations):8.1f} us")
+
+    query = groq_ai.build_meal_plan_query(30, 80, 75, 180, "male", "moderate", ["vegetarian"], ["peanuts"])
+    update_inputs = groq_ai.build_update_request("swap my afternoon snack", previous, USER_DATA)
+    instructions = {
+        "full": groq_ai.parser.get_format_instructions(),
+        "compact": groq_ai.compact_format_instructions(DailyPlan),
+    }
+    print("estimated prompt tokens (~4 chars/token)")
+    for mode, text in instructions.items():
+        generate = groq_ai.prompt.template.format(format_instructions=text, query=query)
+        update = groq_ai.update_prompt.template.format(format_instructions=text, **update_inputs)
+        print(
+            f"  {mode:<8} format instructions {estimate_tokens(text):5d}"
+            f"   generate prompt {estimate_tokens(generate):5d}   update prompt {estimate_tokens(update):5d}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Token-bucket rate limiting end to end against a fake clock: reroute, 429 and refund.
+
+Drives ``POST /DailyMealPlan`` and ``/DailyMealPlan/UpdateMealPlan`` through
+the app with stub models under Groq's per-model quotas. The limiter's clock
+and sleep are swapped for a fake that jumps ahead instead of waiting, so
+every wait is exact and a run takes a second or two. Checks that:
+
+* a full plan update fits llama70's 6000 tokens/minute quota (reserving
+  prompt + max_tokens never did, so the model was silently skipped);
+* a model's unused reservation is refunded once the call reports its usage;
+* with llama70's bucket drained, a generation is rerouted to a model with
+  headroom;
+* with every bucket drained, the request gets a 429 whose Retry-After is
+  long enough: once the clock moves past it, the same request succeeds.
+
+    python -m server.benchmarks.rate_limits
+"""
+import asyncio
+import json
+import logging
+import sys
+
+from ._harness import PROFILE, SAMPLE_PLAN, client, use_sqlite, use_stub_models
+from ..services import groq_ai
+from ..services.plan_synth import plan_synthesizer
+from ..services.rate_limiter import rate_limiter
+
+
+class FakeClock:
+    """``time.monotonic`` and ``asyncio.sleep`` stand-ins; sleeping advances the clock instantly."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.slept.append(seconds)
+        # A float-rounding sliver of a wait would not move a clock at t=72 at all
+        self.now += max(seconds, 0.001)
+        await asyncio.sleep(0)
+
+
+def check(label: str, ok: bool, detail: str) -> bool:
+    print(f"{'ok  ' if ok else 'FAIL'} {label}: {detail}")
+    return ok
+
+
+async def run() -> bool:
+    use_sqlite(users=4)
+    plan_synthesizer.mode = "off"
+    clock = FakeClock()
+    rate_limiter.clock, rate_limiter.sleep = clock, clock.sleep
+    stubs = dict(zip((name for name, _ in groq_ai.llm_models), use_stub_models(latency=0, rate_limits=True)))
+    # Rebuilt so the buckets read the fake clock
+    for name, (tokens, requests) in groq_ai.model_limits.items():
+        rate_limiter.set_limits(name, tokens, requests)
+    llama70 = rate_limiter.budgets["llama70_llm"]
+
+    reservations = []
+    try_reserve = rate_limiter.try_reserve
+
+    def recording(model_name, prompt_tokens):
+        reservation = try_reserve(model_name, prompt_tokens)
+        if reservation is not None:
+            reservations.append(reservation)
+        return reservation
+
+    rate_limiter.try_reserve = recording
+
+    def calls() -> dict:
+        return {name: stub.calls for name, stub in stubs.items()}
+
+    passed = True
+    async with client() as http:
+        response = await http.post(
+            "/DailyMealPlan/UpdateMealPlan/user0@bench.local",
+            json={"prompt": "More protein at breakfast", "previousMealPlan": SAMPLE_PLAN, "mode": "full"},
+        )
+        reserved = reservations[-1] if reservations else None
+        passed &= check(
+            "update fits llama70",
+            response.status_code == 200 and reserved is not None and reserved.model_name == "llama70_llm",
+            f"status {response.status_code}, reserved {reserved.tokens if reserved else 0:.0f} of "
+            f"{llama70.tokens.capacity:.0f} tokens on {reserved.model_name if reserved else None}",
+        )
+
+        stub = stubs["llama70_llm"]
+        # What StubGroq reports for every call
+        used = 1500 + len(json.dumps(SAMPLE_PLAN)) // 4
+        level = llama70.tokens.level
+        passed &= check(
+            "refund after usage",
+            stub.calls == 1 and round(llama70.tokens.capacity - level) == used,
+            f"bucket at {level:.0f} after one call that used {used} tokens",
+        )
+
+        llama70.tokens.take(llama70.tokens.level)
+        before = calls()
+        response = await http.post("/DailyMealPlan/user1@bench.local?fresh=true", json=PROFILE)
+        served = [name for name, count in calls().items() if count > before[name]]
+        passed &= check(
+            "reroute past a drained model",
+            response.status_code == 200 and served and "llama70_llm" not in served,
+            f"status {response.status_code}, llama70 drained, served by {served}",
+        )
+
+        # Twice the quota in debt, so the shortest refill is longer than RATE_LIMIT_MAX_WAIT
+        for budget in rate_limiter.budgets.values():
+            budget.tokens.take(budget.tokens.level + budget.tokens.capacity)
+        before = calls()
+        rejected = await http.post("/DailyMealPlan/user2@bench.local?fresh=true", json=dict(PROFILE, weight=71))
+        retry_after = int(rejected.headers.get("Retry-After", 0))
+        passed &= check(
+            "429 with Retry-After",
+            rejected.status_code == 429 and retry_after > 0 and calls() == before and not clock.slept,
+            f"status {rejected.status_code}, Retry-After {retry_after}s, no model called",
+        )
+
+        clock.now += retry_after
+        response = await http.post("/DailyMealPlan/user2@bench.local?fresh=true", json=dict(PROFILE, weight=71))
+        passed &= check(
+            "retry after Retry-After",
+            response.status_code == 200,
+            f"status {response.status_code} at t={clock.now:.0f}s, queued {sum(clock.slept):.1f}s",
+        )
+    return passed
+
+
+def main() -> None:
+    for name in ("httpx", "server"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    ok = asyncio.run(run())
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
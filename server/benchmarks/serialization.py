@@ -0,0 +1,116 @@
+"""Encode time of plan and user-list responses, before and after the orjson paths.
+
+Times, in-process and per response, how the old and new code turn a large
+meal plan and a page of users into bytes:
+
+* get-meal-plan on a cache miss: re-validating the row through
+  ``UserMealPlanSchema`` vs splicing the stored JSON text into the body;
+* POST /DailyMealPlan: ``jsonable_encoder`` + ``JSONResponse`` on the ORM
+  row vs ``plan_response`` (orjson);
+* /user/showAll: stdlib ``JSONResponse`` vs ``ORJSONResponse``.
+
+Then serves the same plan and user page through the app, with the response
+cache off so every get-meal-plan renders. Fails unless each new path encodes
+faster than the old one.
+
+    python -m server.benchmarks.serialization --foods 20 --users 1000
+"""
+import argparse
+import asyncio
+import copy
+import json
+import logging
+import sys
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlmodel import Session
+
+from ._harness import PROFILE, SAMPLE_PLAN, client, report, timed, use_sqlite
+from ..models import UserMealPlan
+from ..schemas import UserMealPlanSchema
+from ..services.json_response import ORJSONResponse, plan_document, plan_response
+from ..services.response_cache import plan_responses
+
+EMAIL = "user0@bench.local"
+
+
+def large_plan(foods: int) -> dict:
+    """``SAMPLE_PLAN`` with ``foods`` items in every meal."""
+    plan = copy.deepcopy(SAMPLE_PLAN)
+    for slot in ("breakfast", "morning_snack", "lunch", "afternoon_snack", "dinner"):
+        template = plan[slot]["foods"]
+        plan[slot]["foods"] = [
+            dict(template[i % len(template)], name=f"{template[i % len(template)]['name']} {i}") for i in range(foods)
+        ]
+    return plan
+
+
+def per_call(function, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return (time.perf_counter() - start) / rounds
+
+
+async def run(foods: int, users: int, rounds: int, requests: int) -> bool:
+    engine = use_sqlite(users=users)
+    plan = large_plan(foods)
+    with Session(engine) as session:
+        session.add(UserMealPlan(email=EMAIL, meal_plan=plan, version=1))
+        session.commit()
+        row = session.get(UserMealPlan, EMAIL)
+        session.expunge(row)
+    stored_text = json.dumps(plan)
+    user_rows = [dict(PROFILE, id=i, email=f"user{i}@bench.local") for i in range(users)]
+    print(f"plan: {len(stored_text) / 1024:.1f} KiB ({foods} foods per meal), user page: {users} rows")
+
+    pairs = {
+        "get-meal-plan (cache miss)": (
+            lambda: UserMealPlanSchema.model_validate(row, from_attributes=True).model_dump_json().encode(),
+            lambda: plan_document(EMAIL, stored_text, 1),
+        ),
+        "POST /DailyMealPlan": (
+            lambda: JSONResponse(jsonable_encoder(row)).body,
+            lambda: plan_response(row).body,
+        ),
+        "/user/showAll": (
+            lambda: JSONResponse(user_rows).body,
+            lambda: ORJSONResponse(user_rows).body,
+        ),
+    }
+    faster = True
+    for label, (before, after) in pairs.items():
+        old, new = per_call(before, rounds) * 1e6, per_call(after, rounds) * 1e6
+        faster = faster and new < old
+        print(f"{label:<28} before {old:9.1f}us  after {new:9.1f}us  {old / new:6.1f}x")
+
+    # Every get-meal-plan renders from the database instead of the cached bytes
+    plan_responses.max_entries = 0
+    fetch, listing = [], []
+    async with client() as http:
+        for _ in range(requests):
+            await timed(fetch, http.get(f"/user-meal-plan/get-meal-plan/{EMAIL}"))
+            await timed(listing, http.get("/user/showAll", params={"limit": min(users, 1000)}))
+    report("GET /user-meal-plan/get-meal-plan (uncached)", fetch)
+    report(f"GET /user/showAll?limit={min(users, 1000)}", listing)
+    return faster
+
+
+def main() -> None:
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--foods", type=int, default=20, help="foods per meal in the large plan")
+    cli.add_argument("--users", type=int, default=1000)
+    cli.add_argument("--rounds", type=int, default=300, help="encodes timed per path")
+    cli.add_argument("--requests", type=int, default=100, help="requests per endpoint")
+    args = cli.parse_args()
+    for name in ("httpx", "server"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    ok = asyncio.run(run(args.foods, args.users, args.rounds, args.requests))
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Request coalescing for concurrent identical plan generations.
+
+Sends N concurrent identical ``POST /DailyMealPlan/{email}`` requests and
+checks that the stubbed Groq model was called exactly once, then repeats
+with N different users sharing one profile.
+
+    python -m server.benchmarks.single_flight --requests 50
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from ._harness import PROFILE, client, report, timed, use_sqlite, use_stub_models
+
+
+async def burst(http, emails, samples):
+    responses = await asyncio.gather(*(
+        timed(samples, http.post(f"/DailyMealPlan/{email}?fresh=true", json=PROFILE))
+        for email in emails
+    ))
+    return [response.status_code for response in responses]
+
+
+async def run(requests: int, latency: float) -> bool:
+    use_sqlite(users=requests)
+    stubs = use_stub_models(latency)
+    ok = True
+
+    async with client() as http:
+        for label, emails in (
+            ("same user, double submits", ["user0@bench.local"] * requests),
+            ("different users, same profile", [f"user{i}@bench.local" for i in range(requests)]),
+        ):
+            before = sum(stub.calls for stub in stubs)
+            samples = []
+            start = time.perf_counter()
+            statuses = await burst(http, emails, samples)
+            elapsed = time.perf_counter() - start
+            calls = sum(stub.calls for stub in stubs) - before
+
+            report(f"{label} ({requests} requests)", samples, elapsed)
+            print(f"    upstream LLM calls: {calls}, statuses: {sorted(set(statuses))}")
+            ok = ok and calls == 1 and statuses == [200] * requests
+
+    print("PASS" if ok else "FAIL: expected exactly one upstream call per burst")
+    return ok
+
+
+def main() -> None:
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--requests", type=int, default=50)
+    cli.add_argument("--latency", type=float, default=0.5)
+    args = cli.parse_args()
+    sys.exit(0 if asyncio.run(run(args.requests, args.latency)) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Time-to-first-meal of the streaming endpoint versus the blocking one.
+
+The stub model streams its answer over ``--latency`` seconds. The blocking
+endpoint can only answer after the last token, while the streaming one
+should deliver breakfast after roughly a fifth of that.
+
+    python -m server.benchmarks.streaming --runs 20 --latency 2.0
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from ._harness import PROFILE, app, client, report, use_sqlite, use_stub_models
+
+
+async def post_stream(path: str, body: dict):
+    """
+    Calls the ASGI app directly and yields body chunks as they are sent.
+    (httpx's ASGITransport buffers the whole response, which would hide streaming.)
+    """
+    payload = json.dumps(body).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "server": ("bench", 80), "client": ("bench", 1),
+        "headers": [(b"content-type", b"application/json"), (b"host", b"bench")],
+    }
+    chunks: asyncio.Queue = asyncio.Queue()
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            await chunks.put(message.get("body", b""))
+            if not message.get("more_body"):
+                await chunks.put(None)
+
+    task = asyncio.create_task(app(scope, receive, send))
+    while (chunk := await chunks.get()) is not None:
+        yield chunk
+    await task
+
+
+async def run(runs: int, latency: float) -> None:
+    use_sqlite(users=1)
+    use_stub_models(latency)
+    blocking, first_meal, full_stream = [], [], []
+
+    async with client() as http:
+        for i in range(runs):
+            body = dict(PROFILE, weight=50 + 3 * i)
+
+            start = time.perf_counter()
+            response = await http.post("/DailyMealPlan/user0@bench.local?fresh=true", json=body)
+            response.raise_for_status()
+            blocking.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            async for chunk in post_stream("/DailyMealPlan/stream/user0@bench.local", body):
+                for line in filter(None, chunk.splitlines()):
+                    event = json.loads(line)
+                    if event["event"] == "meal" and len(first_meal) <= i:
+                        first_meal.append(time.perf_counter() - start)
+                    elif event["event"] == "error":
+                        raise RuntimeError(event["detail"])
+            full_stream.append(time.perf_counter() - start)
+
+    print(f"{runs} runs, stub streams its answer over {latency:.2f}s")
+    report("blocking POST /DailyMealPlan/{email}", blocking)
+    report("stream: time to first meal", first_meal)
+    report("stream: time to final plan", full_stream)
+
+
+def main() -> None:
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--runs", type=int, default=20)
+    cli.add_argument("--latency", type=float, default=2.0)
+    args = cli.parse_args()
+    asyncio.run(run(args.runs, args.latency))
+
+
+if __name__ == "__main__":
+    main()
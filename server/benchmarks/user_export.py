@@ -0,0 +1,93 @@
+"""Memory and time to list every user, old path vs keyset pages vs NDJSON.
+
+Seeds N users, then lists them three ways while ``tracemalloc`` tracks the
+peak Python heap: the old ``select(User)`` + ``.all()`` serialized as one
+list, walking ``/user/showAll`` page by page, and streaming
+``/user/showAll?format=ndjson`` (consumed chunk by chunk and discarded).
+The export is driven straight from ``exportUsers``, the generator behind
+that response, because httpx's ASGITransport buffers whole bodies.
+Fails if the export's peak is above --max-ratio of the old path's.
+
+    python -m server.benchmarks.user_export --users 100000
+"""
+import argparse
+import asyncio
+import sys
+import time
+import tracemalloc
+
+from sqlalchemy import insert
+from sqlmodel import Session, select
+
+from .. import db
+from ..controllers.users import exportUsers, userColumns
+from ..models import User
+from ..schemas import responseUserSchema
+from ._harness import PROFILE, client, use_sqlite
+
+
+def seed(count: int):
+    rows = [
+        dict(PROFILE, email=f"user{i}@bench.local", password="secret", dietary_preferences=["vegetarian"], allergies=[])
+        for i in range(1, count)
+    ]
+    with db.engine.begin() as connection:
+        connection.execute(insert(User), rows)
+
+
+def measure(label: str, run, count: int):
+    tracemalloc.start()
+    start = time.perf_counter()
+    listed = run()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<34} {listed:>8} users  {elapsed:7.2f}s  {count / elapsed:10,.0f} users/s  peak {peak / 2**20:8.1f} MiB")
+    return peak
+
+
+def old_path() -> int:
+    # What showAll did before: every row as an ORM object, then one big list
+    with Session(db.engine) as session:
+        users = session.exec(select(User)).all()
+        body = b"[" + b",".join(responseUserSchema.model_validate(user, from_attributes=True).model_dump_json().encode() for user in users) + b"]"
+    return body.count(b'"id"')
+
+
+async def pages(limit: int) -> int:
+    listed, cursor = 0, "0"
+    async with client() as http:
+        while cursor:
+            response = await http.get(f"/user/showAll?limit={limit}&after_id={cursor}")
+            listed += len(response.json())
+            cursor = response.headers.get("x-next-cursor")
+    return listed
+
+
+async def export() -> int:
+    listed = 0
+    async for chunk in exportUsers(userColumns(None)):
+        listed += chunk.count(b"\n")
+    return listed
+
+
+def main() -> None:
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--users", type=int, default=100000)
+    cli.add_argument("--page", type=int, default=1000)
+    cli.add_argument("--max-ratio", type=float, default=0.05, help="export peak / old path peak")
+    args = cli.parse_args()
+
+    use_sqlite(users=1)
+    seed(args.users)
+    old = measure("select(User).all() as one list", old_path, args.users)
+    measure(f"keyset pages of {args.page}", lambda: asyncio.run(pages(args.page)), args.users)
+    streamed = measure("NDJSON export", lambda: asyncio.run(export()), args.users)
+
+    ok = streamed <= old * args.max_ratio
+    print("PASS" if ok else f"FAIL: export peak is {streamed / old:.0%} of the old path's")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Weekly plan wall time: seven daily calls vs one parallel fan-out.
+
+With every Groq model stubbed at a fixed latency, times building a week the
+old way (seven ``POST /DailyMealPlan/{email}?fresh=true`` calls in a row),
+with one ``POST /WeeklyMealPlan/{email}``, and regenerating a single day
+with ``POST /WeeklyMealPlan/{email}/{day}``, counting the model calls each
+makes. Fails unless the week takes under --max-ratio of one day's time
+times two and a single-day regeneration makes exactly one model call.
+The stub answers every day with the same plan, so the repeat pass that
+regenerates days sharing meals is turned off here.
+
+    python -m server.benchmarks.weekly_plan --latency 1.0
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from ._harness import PROFILE, client, use_sqlite, use_stub_models
+from ..services import weekly_plan
+
+EMAIL = "user0@bench.local"
+
+
+async def run(latency: float, max_ratio: float) -> bool:
+    use_sqlite(users=1)
+    stubs = use_stub_models(latency)
+    weekly_plan.WEEKLY_PLAN_REPEAT_ROUNDS = 0
+
+    def calls() -> int:
+        return sum(stub.calls for stub in stubs)
+
+    async with client() as http:
+        async def phase(label: str, requests):
+            before = calls()
+            start = time.perf_counter()
+            statuses = [(await request()).status_code for request in requests]
+            elapsed = time.perf_counter() - start
+            print(f"{label:<40} {elapsed:6.2f}s  model calls: {calls() - before:<3} statuses: {sorted(set(statuses))}")
+            return elapsed, calls() - before, set(statuses)
+
+        daily = [lambda: http.post(f"/DailyMealPlan/{EMAIL}?fresh=true", json=PROFILE) for _ in range(7)]
+        sequential, _, daily_statuses = await phase("7 x /DailyMealPlan, one after another", daily)
+        weekly, _, weekly_statuses = await phase("/WeeklyMealPlan, days in parallel", [lambda: http.post(f"/WeeklyMealPlan/{EMAIL}", json=PROFILE)])
+        _, regenerated, regen_statuses = await phase("/WeeklyMealPlan/wednesday", [lambda: http.post(f"/WeeklyMealPlan/{EMAIL}/wednesday", json=PROFILE)])
+        stored = (await http.get(f"/WeeklyMealPlan/{EMAIL}")).json()
+        stats = (await http.get("/diagnostics/weekly-plans")).json()
+
+    print(f"stored days: {list(stored['days'])}")
+    print(f"weekly stats: {stats}")
+    one_day = sequential / 7
+    print(f"week / one day: {weekly / one_day:.2f}x (sequential week: {sequential / one_day:.2f}x)")
+    return (
+        daily_statuses == weekly_statuses == regen_statuses == {200}
+        and weekly <= one_day * 2 * max_ratio
+        and regenerated == 1
+        and len(stored["days"]) == 7
+    )
+
+
+def main() -> None:
+    cli = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli.add_argument("--latency", type=float, default=1.0, help="stub model latency, seconds")
+    cli.add_argument("--max-ratio", type=float, default=1.0)
+    args = cli.parse_args()
+    ok = asyncio.run(run(args.latency, args.max_ratio))
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Optional
+from sqlmodel import select, func, update
+from fastapi import HTTPException
+from ..db import session_scope
+from ..models import MealPlanJob
+from ..schemas import promptInput, UpdateMealPlan
+from ..services.job_queue import JobQueue, PRIORITY_GENERATE, PRIORITY_UPDATE
+from .mealList import generateDailyMealPlan, generateUpdatedDailyMealPlan
+
+logger = logging.getLogger(__name__)
+
+# A running job's worker refreshes heartbeat_at this often; a job whose heartbeat
+# is older than the lease belongs to a dead process and is queued again
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "15"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+
+def jobSession():
+    # Workers outlive the request that queued the job, so they open their own session
+    return session_scope()
+
+
+async def saveJob(job, session):
+    session.add(job)
+    await session.commit()
+    await session.refresh(job)
+    return job
+
+
+async def createJob(kind, email, request, session):
+    job = MealPlanJob(
+        id=uuid.uuid4().hex,
+        email=email,
+        kind=kind,
+        request=request,
+        created_at=time.time(),
+    )
+    job = await saveJob(job, session)
+    jobQueue.submit(job.id, PRIORITY_UPDATE if kind == "update" else PRIORITY_GENERATE)
+    return {"id": job.id, "status": job.status}
+
+
+async def getJob(jobId, session):
+    job = await session.get(MealPlanJob, jobId)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+async def claimJob(jobId, session):
+    # One conditional UPDATE, so only one worker in any process moves a job out of "queued"
+    now = time.time()
+    claimed = await session.exec(
+        update(MealPlanJob)
+        .where(MealPlanJob.id == jobId, MealPlanJob.status == "queued")
+        .values(status="running", started_at=now, heartbeat_at=now)
+    )
+    await session.commit()
+    return claimed.rowcount == 1
+
+
+async def beat(jobId):
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+        try:
+            async with jobSession() as session:
+                await session.exec(
+                    update(MealPlanJob)
+                    .where(MealPlanJob.id == jobId, MealPlanJob.status == "running")
+                    .values(heartbeat_at=time.time())
+                )
+                await session.commit()
+        except Exception as e:
+            logger.warning("Heartbeat for job %s failed: %s", jobId, e)
+
+
+async def runJob(jobId):
+    async with jobSession() as session:
+        if not await claimJob(jobId, session):
+            return
+        job = await session.get(MealPlanJob, jobId)
+        # Don't hold a pooled connection while the plan is generated
+        await session.commit()
+
+        heartbeat = asyncio.create_task(beat(jobId))
+        try:
+            if job.kind == "update":
+                result = await generateUpdatedDailyMealPlan(job.email, UpdateMealPlan(**job.request), session)
+                job.result = result if isinstance(result, dict) else result.model_dump()
+            else:
+                body = promptInput(**job.request)
+                plan = await generateDailyMealPlan(job.email, body, session, job.request.get("fresh", False))
+                job.result = plan.meal_plan
+            job.status = "succeeded"
+        except HTTPException as e:
+            job.status = "failed"
+            job.error = str(e.detail)
+        except Exception as e:
+            logger.warning("Job %s failed: %s", jobId, e)
+            job.status = "failed"
+            job.error = "Meal plan generation failed"
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+
+        job.finished_at = time.time()
+        await saveJob(job, session)
+
+
+async def queuedJobIds(session):
+    statement = select(MealPlanJob.id, MealPlanJob.kind).where(MealPlanJob.status == "queued")
+    return (await session.exec(statement.order_by(MealPlanJob.created_at))).all()
+
+
+async def recoverStaleJobs(session):
+    # Only jobs whose worker stopped beating start over; a running job in another live process keeps its lease
+    expired = time.time() - JOB_LEASE_SECONDS
+    stale = (await session.exec(
+        select(MealPlanJob.id, MealPlanJob.kind).where(
+            MealPlanJob.status == "running",
+            func.coalesce(MealPlanJob.heartbeat_at, MealPlanJob.started_at, 0) < expired,
+        )
+    )).all()
+    requeued = []
+    for jobId, kind in stale:
+        # Conditional, so two processes recovering at once requeue a job only once
+        reset = await session.exec(
+            update(MealPlanJob)
+            .where(
+                MealPlanJob.id == jobId,
+                MealPlanJob.status == "running",
+                func.coalesce(MealPlanJob.heartbeat_at, MealPlanJob.started_at, 0) < expired,
+            )
+            .values(status="queued", started_at=None, heartbeat_at=None)
+        )
+        if reset.rowcount == 1:
+            requeued.append((jobId, kind))
+    await session.commit()
+    if requeued:
+        logger.warning("Requeued %d jobs whose lease expired", len(requeued))
+    return requeued
+
+
+async def resumeJobs():
+    async with jobSession() as session:
+        await recoverStaleJobs(session)
+        for jobId, kind in await queuedJobIds(session):
+            jobQueue.submit(jobId, PRIORITY_UPDATE if kind == "update" else PRIORITY_GENERATE)
+
+
+class JobRecovery:
+    """Requeues jobs with an expired lease every JOB_HEARTBEAT_INTERVAL seconds, e.g. after another process died."""
+
+    def __init__(self, interval: float = JOB_HEARTBEAT_INTERVAL):
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.interval > 0:
+            self.task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def run_once(self):
+        async with jobSession() as session:
+            for jobId, kind in await recoverStaleJobs(session):
+                jobQueue.submit(jobId, PRIORITY_UPDATE if kind == "update" else PRIORITY_GENERATE)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.exception("Job recovery failed: %s", e)
+
+
+async def countQueuedJobs(session):
+    return (await session.exec(select(func.count()).select_from(MealPlanJob).where(MealPlanJob.status == "queued"))).one()
+
+
+async def getJobMetrics(session):
+    stats = jobQueue.stats()
+    stats["queued_in_db"] = await countQueuedJobs(session)
+    return stats
+
+
+jobQueue = JobQueue(runJob)
+jobRecovery = JobRecovery()
@@ -1,12 +1,99 @@
-from sqlmodel import Session, select
+from sqlmodel import select
 from fastapi import HTTPException
-from ..services.groq_ai import meal_plan_generator, updated_meal_plan_generator
+from ..services.groq_ai import meal_plan_generator, updated_meal_plan_generator, patched_meal_plan_generator, meal_plan_stream, updated_meal_plan_stream
+from ..services.plan_stream import meal_events, encode_event
+from ..services.rate_limiter import RateLimitExceeded
+from ..services.plan_cache import plan_cache, cache_key
+from ..services.single_flight import SingleFlight
+from ..services.nutrition import fix_arithmetic
+from ..services.plan_history import save_plan_version
+from ..services.response_cache import plan_responses
+from ..services.dietary_constraints import DietaryConstraintViolation, plan_violations
+from ..services.weekly_plan import WEEKDAYS, generate_week, load_week, save_days, repeated_meals, weekly_stats
+import os
 import json
+import logging
+import copy
+import hashlib
+import time
+from ..db import session_scope
 from ..models import UserMealPlan, User
 
+logger = logging.getLogger(__name__)
 
-async def generateDailyMealPlan(email, requestBody, session):
-    dailyMealPlan = await meal_plan_generator(
+# in-flight generations keyed on (flow, email, normalized input)
+mealPlanFlights = SingleFlight()
+
+# default update style when the request does not say: "patch" (changed meals only) or "full"
+UPDATE_MEAL_PLAN_MODE = os.getenv("UPDATE_MEAL_PLAN_MODE", "patch")
+
+
+async def saveUserMealPlan(email, mealPlan, session, source="generate"):
+    # Appends a version to the user's plan history and moves the current pointer to it
+    userMealPlan = await save_plan_version(session, email, mealPlan, source)
+    plan_responses.invalidate(email)
+    return userMealPlan
+
+
+async def getUserByEmail(email, session):
+    return (await session.exec(select(User).where(User.email == email))).first()
+
+
+def userDataFrom(user):
+    return {
+        "age": user.age,
+        "targetWeight": user.targetWeight,
+        "gender": user.gender,
+        "dietary_preferences": user.dietary_preferences,
+        "weight": user.weight,
+        "height": user.height,
+        "daily_physical_activity": user.daily_physical_activity,
+        "allergies": user.allergies,
+    }
+
+
+async def generateDailyMealPlan(email, requestBody, fresh=False):
+    # A double-submit joins the request already in flight instead of racing it to the row
+    key = ("generate", email, cache_key(requestBody), fresh)
+    savedPlan = await mealPlanFlights.do(key, lambda: _generateDailyMealPlan(email, requestBody, fresh))
+    # Every caller that joined the flight gets its own detached row
+    return UserMealPlan(**copy.deepcopy(savedPlan))
+
+
+async def _generateDailyMealPlan(email, requestBody, fresh):
+    def generate():
+        return meal_plan_generator(
+            requestBody.age,
+            requestBody.weight,
+            requestBody.targetWeight,
+            requestBody.height,
+            requestBody.gender,
+            requestBody.daily_physical_activity,
+            requestBody.dietary_preferences,
+            requestBody.allergies,
+        )
+
+    try:
+        # Near-identical profiles share a plan instead of paying for another LLM call
+        dailyMealPlan = await plan_cache.get_or_generate(requestBody, generate, fresh=fresh)
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except DietaryConstraintViolation as e:
+        raise HTTPException(status_code=502, detail={"message": str(e), "violations": e.violations})
+    logger.debug("Generated meal plan for %s", requestBody)
+
+    # The flight opens its own session and returns plain data: it outlives the
+    # leader's request, whose session and ORM objects its followers must not share
+    async with session_scope() as session:
+        userMealPlan = await saveUserMealPlan(email, dailyMealPlan, session)
+        return {"email": userMealPlan.email, "meal_plan": userMealPlan.meal_plan, "version": userMealPlan.version}
+
+
+async def streamDailyMealPlan(email, requestBody, sse=False):
+    started = time.perf_counter()
+    partials = meal_plan_stream(
         requestBody.age,
         requestBody.weight,
         requestBody.targetWeight,
@@ -16,56 +103,131 @@ async def generateDailyMealPlan(email, requestBody, session):
         requestBody.dietary_preferences,
         requestBody.allergies,
     )
-    print(requestBody)
-    # Check if meal plan already exists
-    existing_plan = session.get(UserMealPlan, email)
-
-    if existing_plan:
-        # Update existing meal plan
-        existing_plan.meal_plan = dailyMealPlan
-    else:
-        # Create new meal plan
-        existing_plan = UserMealPlan(email=email, meal_plan=dailyMealPlan)
-        session.add(existing_plan)
-
-    session.commit()
-    session.refresh(existing_plan)
-    return existing_plan
-
-
-async def generateUpdatedDailyMealPlan(email, requestBody, session):
-    
-    user = session.exec(select(User).where(User.email == email)).first()  
+
+    async def onPlan(mealPlan):
+        await plan_cache.set(cache_key(requestBody), mealPlan)
+        # Opens its own session: the request's one is closed before a streamed body is sent
+        async with session_scope() as session:
+            await saveUserMealPlan(email, mealPlan, session)
+
+    return _streamEvents(partials, onPlan, started, sse, requestBody.dietary_preferences, requestBody.allergies)
+
+
+async def _streamEvents(partials, onPlan, started, sse, dietaryPreferences=None, allergies=None):
+    # Meals go out as soon as they are complete; the plan is persisted only once the stream ends
+    try:
+        async for event in meal_events(partials):
+            if event["event"] == "plan":
+                # Meals already went out as streamed, but the stored plan still gets its arithmetic fixed
+                fix_arithmetic(event["meal_plan"])
+                violations = plan_violations(event["meal_plan"], dietaryPreferences, allergies)
+                if violations:
+                    # Too late to repair mid-stream; tell the client and keep it out of storage
+                    raise DietaryConstraintViolation(violations)
+                await onPlan(event["meal_plan"])
+            yield encode_event(event, started, sse)
+    except RateLimitExceeded as e:
+        yield encode_event({"event": "error", "status_code": 429, "detail": str(e), "retry_after": e.retry_after}, started, sse)
+    except TimeoutError as e:
+        yield encode_event({"event": "error", "status_code": 504, "detail": str(e)}, started, sse)
+    except DietaryConstraintViolation as e:
+        yield encode_event({"event": "error", "status_code": 502, "detail": str(e), "violations": e.violations}, started, sse)
+    except Exception as e:
+        logger.exception("Meal plan stream failed: %s", e)
+        yield encode_event({"event": "error", "status_code": 502, "detail": "Meal plan generation failed"}, started, sse)
+
+
+async def generateUpdatedDailyMealPlan(email, requestBody):
+    previousPlanHash = hashlib.sha256(requestBody.previousMealPlan.model_dump_json().encode()).hexdigest()
+    key = ("update", email, requestBody.prompt, previousPlanHash, requestBody.mode)
+    dailyMealPlan = await mealPlanFlights.do(key, lambda: _generateUpdatedDailyMealPlan(email, requestBody))
+    return copy.deepcopy(dailyMealPlan)
+
+
+async def _generateUpdatedDailyMealPlan(email, requestBody):
+    # Short sessions of its own on both sides of the LLM call, none held through it
+    async with session_scope() as session:
+        user = await getUserByEmail(email, session)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+
+    userData = userDataFrom(user)
+    patch = (requestBody.mode or UPDATE_MEAL_PLAN_MODE) == "patch"
+
+    try:
+        if patch:
+            # Both modes start from the plan the client is looking at, as the prompt is about that plan
+            dailyMealPlan = await patched_meal_plan_generator(requestBody.prompt, requestBody.previousMealPlan, userData)
+        else:
+            dailyMealPlan = await updated_meal_plan_generator(
+                requestBody.prompt,
+                requestBody.previousMealPlan,
+                userData
+            )
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except DietaryConstraintViolation as e:
+        raise HTTPException(status_code=502, detail={"message": str(e), "violations": e.violations})
+
+    async with session_scope() as session:
+        await saveUserMealPlan(email, dailyMealPlan, session, "update")
+    return dailyMealPlan
+
+
+async def streamUpdatedDailyMealPlan(email, requestBody, session, sse=False):
+    started = time.perf_counter()
+    user = await getUserByEmail(email, session)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    userData = {
-        "targetWeight": user.targetWeight,
-        "gender": user.gender,
-        "dietary_preferences": user.dietary_preferences,
-        "weight": user.weight,
-        "height": user.height,
-        "daily_physical_activity": user.daily_physical_activity,
-        "allergies": user.allergies,
-    }
-    
-    dailyMealPlan = await updated_meal_plan_generator(
-        requestBody.prompt,
-        requestBody.previousMealPlan,
-        userData
-    )
-    
-    # Check if meal plan already exists
-    existing_plan = session.get(UserMealPlan, email)
-
-    if existing_plan:
-        # Update existing meal plan
-        existing_plan.meal_plan = dailyMealPlan
-    else:
-        # Create new meal plan
-        existing_plan = UserMealPlan(email=email, meal_plan=dailyMealPlan)
-        session.add(existing_plan)
-
-    session.commit()
-    session.refresh(existing_plan)
-    return dailyMealPlan
+    await session.commit()
+
+    partials = updated_meal_plan_stream(requestBody.prompt, requestBody.previousMealPlan, userDataFrom(user))
+
+    async def onPlan(mealPlan):
+        async with session_scope() as session:
+            await saveUserMealPlan(email, mealPlan, session, "update")
+
+    return _streamEvents(partials, onPlan, started, sse, user.dietary_preferences, user.allergies)
+
+
+async def getWeeklyMealPlan(email, session):
+    week = await load_week(session, email)
+    if not week:
+        raise HTTPException(status_code=404, detail="Weekly meal plan not found")
+    return {"email": email, "days": {day: week[day] for day in WEEKDAYS if day in week}}
+
+
+async def generateWeeklyMealPlan(email, requestBody):
+    days = [day for day in WEEKDAYS if day in requestBody.days] if requestBody.days else list(WEEKDAYS)
+    key = ("week", email, cache_key(requestBody), tuple(days))
+    week = await mealPlanFlights.do(key, lambda: _generateWeeklyMealPlan(email, requestBody, days))
+    return copy.deepcopy(week)
+
+
+async def _generateWeeklyMealPlan(email, requestBody, days):
+    # Days not asked for are reused, and keep the regenerated ones from repeating their meals
+    async with session_scope() as session:
+        stored = await load_week(session, email)
+    reused = {day: plan for day, plan in stored.items() if day not in days}
+
+    plans, failures = await generate_week(requestBody, days, reused)
+    # Days that did succeed are kept, so a retry only needs the failed ones
+    if plans:
+        async with session_scope() as session:
+            await save_days(session, email, plans)
+    if failures:
+        e = next(iter(failures.values()))
+        detail = {"message": str(e), "failed_days": list(failures), "generated_days": list(plans)}
+        if isinstance(e, RateLimitExceeded):
+            raise HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(e.retry_after)})
+        if isinstance(e, TimeoutError):
+            raise HTTPException(status_code=504, detail=detail)
+        if isinstance(e, DietaryConstraintViolation):
+            raise HTTPException(status_code=502, detail={**detail, "violations": e.violations})
+        raise HTTPException(status_code=502, detail=detail)
+
+    week = {day: plans.get(day, reused.get(day)) for day in WEEKDAYS if day in plans or day in reused}
+    weekly_stats["repeated_meals"] += repeated_meals(week.values())
+    return {"email": email, "days": week, "generated": days}
@@ -1,30 +1,100 @@
-from sqlmodel import Session, select
+import os
+from sqlmodel import select
+from ..db import session_scope, stream_partitions
 from ..models import User
+from ..jsonb import json_array_contains
+from ..services.passwords import PasswordHasherBusy, password_hasher
+from ..services.metrics import stage
+from ..services.json_response import dumps
 from fastapi import HTTPException
 
+# Rows fetched per round trip by the NDJSON export
+USER_EXPORT_BATCH = int(os.getenv("USER_EXPORT_BATCH", "1000"))
 
-def getAllUsers(session):
+# Columns a listing may project; never the password
+PUBLIC_USER_FIELDS = (
+    "id", "email", "age", "weight", "targetWeight", "height", "gender",
+    "daily_physical_activity", "dietary_preferences", "allergies",
+)
+
+
+def userColumns(fields):
+    # "email,age" -> the id (the pagination key) plus those columns
+    names = [name.strip() for name in fields.split(",") if name.strip()] if fields else list(PUBLIC_USER_FIELDS)
+    unknown = [name for name in names if name not in PUBLIC_USER_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown fields: {', '.join(unknown)}")
+    return [User.id] + [getattr(User, name) for name in dict.fromkeys(names) if name != "id"]
+
+
+def usersAfter(columns, afterId):
+    return select(*columns).where(User.id > afterId).order_by(User.id)
+
+
+async def getAllUsers(session, afterId=0, limit=None, columns=None):
+    # Rows with an id above the cursor, in id order; a keyset page when limit is given
+    statement = usersAfter(columns or userColumns(None), afterId).limit(limit)
+    rows = (await session.exec(statement)).all()
+    return [dict(row._mapping) for row in rows]
+
+
+async def exportUsers(columns, afterId=0):
+    # Opens its own session: the request's one is closed before a streamed body is sent
+    async with session_scope() as session:
+        async for rows in stream_partitions(session, usersAfter(columns, afterId), USER_EXPORT_BATCH):
+            with stage("serialize"):
+                chunk = b"".join(dumps(dict(row._mapping)) + b"\n" for row in rows)
+            yield chunk
+
+
+async def findUsers(dietaryPreference, allergy, session):
     statement = select(User)
-    results = session.exec(statement)
-    return results.all()
+    if dietaryPreference:
+        statement = statement.where(json_array_contains(User.dietary_preferences, dietaryPreference))
+    if allergy:
+        statement = statement.where(json_array_contains(User.allergies, allergy))
+    return (await session.exec(statement)).all()
 
 
-def getSingleUsers(userdata, session):
-    user = session.exec(select(User).where(User.email == userdata.email)).first()  
+async def getSingleUsers(userdata, session):
+    user = (await session.exec(select(User).where(User.email == userdata.email))).first()  
+    # Release the connection: verifying takes tens of milliseconds on the hashing pool
+    await session.commit()
+    try:
+        matches, needsRehash = await password_hasher.verify(userdata.password, user.password if user else None)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Too many logins, try again shortly", headers={"Retry-After": "1"})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    if user.password != userdata.password: 
+    if not matches: 
         raise HTTPException(status_code=401, detail="Incorrect password")  # Handle incorrect password
+
+    # Plaintext from before hashing, or hashed with an older cost: upgrade while we know the password
+    if needsRehash:
+        try:
+            user.password = await password_hasher.hash(userdata.password)
+        except PasswordHasherBusy:
+            return user  # the next login upgrades it
+        session.add(user)
+        await session.commit()
+        password_hasher.upgrades += 1
     
     return user
 
 
 
-def addNewUsers(user, session):
+async def hashPassword(password):
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Too many requests, try again shortly", headers={"Retry-After": "1"})
+
+
+async def addNewUsers(user, session):
     db_user = User(
         email=user.email,
-        password=user.password,
+        password=await hashPassword(user.password),
         age=user.age,
         weight=user.weight,
         targetWeight=user.targetWeight,
@@ -35,6 +105,6 @@ def addNewUsers(user, session):
         allergies=user.allergies,
     )
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    await session.commit()
+    await session.refresh(db_user)
     return db_user
@@ -0,0 +1,40 @@
+from sqlalchemy import Boolean, Text, cast
+from sqlalchemy.dialects.postgresql import JSON, JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+# JSONB on Postgres, plain JSON (text) elsewhere so SQLite keeps working
+JSONDocument = JSON().with_variant(JSONB(), "postgresql")
+
+
+def json_text(column):
+    """The document as JSON text, rendered by the database instead of decoded by the driver."""
+    return cast(column, Text)
+
+
+class json_array_contains(FunctionElement):
+    """
+    ``json_array_contains(column, value)``: the JSON array in ``column`` has
+    ``value`` as an element. On Postgres this is ``@>``, which the GIN
+    indexes on the user list columns serve.
+    """
+
+    type = Boolean()
+    inherit_cache = True
+    name = "json_array_contains"
+
+
+@compiles(json_array_contains, "postgresql")
+def _contains_postgresql(element, compiler, **kw):
+    column, value = list(element.clauses)
+    # Typed, or asyncpg cannot infer the parameter of a variadic "any" function
+    return f"{compiler.process(column, **kw)} @> jsonb_build_array(CAST({compiler.process(value, **kw)} AS TEXT))"
+
+
+@compiles(json_array_contains)
+def _contains_default(element, compiler, **kw):
+    column, value = list(element.clauses)
+    return (
+        f"EXISTS (SELECT 1 FROM json_each({compiler.process(column, **kw)}) "
+        f"WHERE json_each.value = {compiler.process(value, **kw)})"
+    )
@@ -1,12 +1,32 @@
+import asyncio
+import os
+import logging
 from fastapi import FastAPI, Depends
-from sqlmodel import SQLModel, Session
-from .db import engine, get_session
+from . import db
+from .db import get_async_session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import Annotated
-from .routers import mealList, users, userMealPlan
+from .routers import mealList, users, userMealPlan, diagnostics, jobs, weeklyMealPlan, metrics
+from .controllers.jobs import jobQueue, jobRecovery, resumeJobs
+from .services.plan_synth import plan_synthesizer
+from .services.plan_history import history_compactor
+from .services.metrics import MetricsMiddleware
+from .services.profiler import PROFILER_ENABLED, profiler
+from .migrations import migrate
 from fastapi.middleware.cors import CORSMiddleware
 
+# DEBUG also logs every request's stage breakdown, not only the slow ones
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
+# "0" when migrations run as a deploy step (python -m server.migrations) instead
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "1") == "1"
+
 origins = [
     "http://localhost:8081"
 ]
@@ -19,15 +39,67 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Added last, so it is outermost and request timings include CORS handling
+app.add_middleware(MetricsMiddleware)
+
 
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+    applied = migrate(db.engine)
+    if applied:
+        logger.info("Applied migrations: %s", ", ".join(applied))
 
-SessionDep = Annotated[Session, Depends(get_session)]
+SessionDep = Annotated[AsyncSession, Depends(get_async_session)]
 
 @app.on_event("startup")
 def on_startup():
-    create_db_and_tables()
+    if MIGRATE_ON_STARTUP:
+        create_db_and_tables()
+
+async def load_plan_library():
+    try:
+        plans = await plan_synthesizer.library.load(db.engine)
+        logger.info("Seeded the meal library from %d stored plans", plans)
+    except Exception as e:
+        logger.exception("Seeding the meal library failed: %s", e)
+
+# Referenced here so the task is not garbage collected while it runs
+library_seeding = None
+
+@app.on_event("startup")
+async def seed_plan_library():
+    global library_seeding
+    # In the background: start-up doesn't wait on it, and until it is done generations just call the LLM
+    if plan_synthesizer.mode != "off":
+        library_seeding = asyncio.create_task(load_plan_library())
+
+@app.on_event("startup")
+async def start_job_workers():
+    jobQueue.start()
+    await resumeJobs()
+    jobRecovery.start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await jobRecovery.stop()
+    await jobQueue.stop()
+
+@app.on_event("startup")
+async def start_profiler():
+    # Started from the event loop, so it samples the loop's thread
+    if PROFILER_ENABLED:
+        profiler.start()
+
+@app.on_event("shutdown")
+def stop_profiler():
+    profiler.stop()
+
+@app.on_event("startup")
+def start_history_compaction():
+    history_compactor.start()
+
+@app.on_event("shutdown")
+async def stop_history_compaction():
+    await history_compactor.stop()
 
 #including the users router
 app.include_router(users.router)
@@ -35,5 +107,17 @@ app.include_router(users.router)
 #including the mealList router
 app.include_router(mealList.router)
 
+#including the weeklyMealPlan router
+app.include_router(weeklyMealPlan.router)
+
 #including the userMealPlan router
-app.include_router(userMealPlan.router)
\ No newline at end of file
+app.include_router(userMealPlan.router)
+
+#including the diagnostics router
+app.include_router(diagnostics.router)
+
+#including the jobs router
+app.include_router(jobs.router)
+
+#including the metrics router
+app.include_router(metrics.router)
@@ -0,0 +1,52 @@
+"""
+Versioned schema migrations, replacing ``SQLModel.metadata.create_all``.
+
+Each ``vNNNN_<name>.py`` module in this package defines ``upgrade(connection)``
+and runs once per database, in version order. Applied versions are recorded
+in ``schema_migrations``, so a start-up with nothing pending costs one query
+instead of an inspection of every table.
+"""
+import importlib
+import pkgutil
+import re
+import time
+from typing import List, Tuple
+
+from sqlalchemy import text
+
+_MODULE = re.compile(r"v(\d{4})_\w+$")
+# Arbitrary key for the Postgres advisory lock that serializes workers starting together
+_LOCK_KEY = 721_004_016
+
+
+def migrations() -> List[Tuple[int, str, object]]:
+    """``(version, name, module)`` of every migration, oldest first."""
+    found = []
+    for module in pkgutil.iter_modules(__path__):
+        match = _MODULE.match(module.name)
+        if match:
+            found.append((int(match.group(1)), module.name, importlib.import_module(f"{__name__}.{module.name}")))
+    return sorted(found, key=lambda migration: migration[0])
+
+
+def migrate(engine) -> List[str]:
+    """Applies pending migrations in one transaction; returns their names."""
+    applied = []
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _LOCK_KEY})
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations "
+            "(version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at FLOAT NOT NULL)"
+        ))
+        done = set(connection.execute(text("SELECT version FROM schema_migrations")).scalars())
+        for version, name, module in migrations():
+            if version in done:
+                continue
+            module.upgrade(connection)
+            connection.execute(
+                text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+                {"version": version, "name": name, "applied_at": time.time()},
+            )
+            applied.append(name)
+    return applied
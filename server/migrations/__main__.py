@@ -0,0 +1,6 @@
+"""Run pending migrations as a deploy step: ``python -m server.migrations``."""
+from ..db import engine
+from . import migrate
+
+applied = migrate(engine)
+print(f"Applied {', '.join(applied)}" if applied else "Schema is up to date")
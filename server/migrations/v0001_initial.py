@@ -0,0 +1,58 @@
+"""
+The schema as ``create_all`` built it before migrations existed. Tables are
+created only if missing, so databases from that era adopt this history.
+Frozen here on purpose: later model changes belong in new migrations.
+"""
+from sqlalchemy import JSON, Column, Float, Index, Integer, MetaData, String, Table
+
+metadata = MetaData()
+
+Table(
+    "user", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("email", String, nullable=False),
+    Column("password", String, nullable=False),
+    Column("age", Integer, nullable=False),
+    Column("weight", Integer, nullable=False),
+    Column("targetWeight", Integer, nullable=False),
+    Column("height", Integer, nullable=False),
+    Column("gender", String, nullable=False),
+    Column("daily_physical_activity", String, nullable=False),
+    Column("dietary_preferences", JSON),
+    Column("allergies", JSON),
+    Index("ix_user_email", "email", unique=True),
+)
+
+Table(
+    "usermealplan", metadata,
+    Column("email", String, primary_key=True),
+    Column("meal_plan", JSON),
+)
+
+Table(
+    "mealplancache", metadata,
+    Column("key", String, primary_key=True),
+    Column("meal_plan", JSON),
+    Column("created_at", Float, nullable=False),
+    Index("ix_mealplancache_created_at", "created_at"),
+)
+
+Table(
+    "mealplanjob", metadata,
+    Column("id", String, primary_key=True),
+    Column("email", String, nullable=False),
+    Column("kind", String, nullable=False),
+    Column("status", String, nullable=False),
+    Column("request", JSON),
+    Column("result", JSON),
+    Column("error", String),
+    Column("created_at", Float, nullable=False),
+    Column("started_at", Float),
+    Column("finished_at", Float),
+    Index("ix_mealplanjob_email", "email"),
+    Index("ix_mealplanjob_status", "status"),
+)
+
+
+def upgrade(connection):
+    metadata.create_all(connection, checkfirst=True)
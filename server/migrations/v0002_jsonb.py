@@ -0,0 +1,18 @@
+"""
+Meal plans and the user preference/allergy lists become JSONB, with GIN
+indexes so containment queries (``@>``) stop scanning every user. SQLite
+keeps its text JSON, which its json functions read as is.
+"""
+from sqlalchemy import text
+
+COLUMNS = (("usermealplan", "meal_plan"), ("user", "dietary_preferences"), ("user", "allergies"))
+
+
+def upgrade(connection):
+    if connection.dialect.name != "postgresql":
+        return
+    for table, column in COLUMNS:
+        connection.execute(text(f'ALTER TABLE "{table}" ALTER COLUMN {column} TYPE JSONB USING {column}::jsonb'))
+    # Plain CREATE INDEX (not CONCURRENTLY) so it can run inside the migration's transaction
+    connection.execute(text('CREATE INDEX IF NOT EXISTS ix_user_dietary_preferences ON "user" USING gin (dietary_preferences)'))
+    connection.execute(text('CREATE INDEX IF NOT EXISTS ix_user_allergies ON "user" USING gin (allergies)'))
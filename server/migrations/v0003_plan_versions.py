@@ -0,0 +1,36 @@
+"""
+Append-only plan history. ``usermealplan`` keeps the current plan and gains
+the version it holds; every saved plan also lands in ``meal_plan_versions``
+as a snapshot or a delta. Existing plans become version 1 snapshots.
+"""
+import time
+
+from sqlalchemy import JSON, Column, Float, Integer, MetaData, String, Table, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import JSONB
+
+metadata = MetaData()
+
+Table(
+    "meal_plan_versions", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("email", String, nullable=False),
+    Column("version", Integer, nullable=False),
+    Column("kind", String, nullable=False),
+    Column("payload", JSON().with_variant(JSONB(), "postgresql")),
+    Column("source", String, nullable=False),
+    Column("created_at", Float, nullable=False),
+    UniqueConstraint("email", "version"),
+)
+
+
+def upgrade(connection):
+    metadata.create_all(connection)
+    connection.execute(text("ALTER TABLE usermealplan ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+    connection.execute(
+        text(
+            "INSERT INTO meal_plan_versions (email, version, kind, payload, source, created_at) "
+            "SELECT email, 1, 'snapshot', meal_plan, 'import', :now FROM usermealplan"
+        ),
+        {"now": time.time()},
+    )
+    connection.execute(text("UPDATE usermealplan SET version = 1"))
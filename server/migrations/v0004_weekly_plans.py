@@ -0,0 +1,20 @@
+"""
+Weekly plans: one ``DailyPlan`` per (email, day) next to ``usermealplan``,
+so regenerating a single day rewrites one small row.
+"""
+from sqlalchemy import JSON, Column, Float, MetaData, String, Table
+from sqlalchemy.dialects.postgresql import JSONB
+
+metadata = MetaData()
+
+Table(
+    "weekly_plan_days", metadata,
+    Column("email", String, primary_key=True),
+    Column("day", String, primary_key=True),
+    Column("meal_plan", JSON().with_variant(JSONB(), "postgresql")),
+    Column("updated_at", Float, nullable=False),
+)
+
+
+def upgrade(connection):
+    metadata.create_all(connection)
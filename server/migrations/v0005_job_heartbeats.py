@@ -0,0 +1,10 @@
+"""
+``mealplanjob.heartbeat_at``: refreshed while a worker runs the job, so a
+restart re-queues only jobs whose worker stopped beating rather than every
+``running`` row.
+"""
+from sqlalchemy import text
+
+
+def upgrade(connection):
+    connection.execute(text("ALTER TABLE mealplanjob ADD COLUMN heartbeat_at FLOAT"))
@@ -1,6 +1,8 @@
 from typing import Optional, List
 from sqlmodel import SQLModel, Field, Column
+from sqlalchemy import Index, UniqueConstraint
 from sqlalchemy.dialects.postgresql import JSON
+from .jsonb import JSONDocument
 
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -12,8 +14,14 @@ class User(SQLModel, table=True):
     height: int
     gender: str
     daily_physical_activity: str
-    dietary_preferences: List[str] = Field(sa_column=Column(JSON)) 
-    allergies: List[str] = Field(sa_column=Column(JSON)) 
+    dietary_preferences: List[str] = Field(sa_column=Column(JSONDocument)) 
+    allergies: List[str] = Field(sa_column=Column(JSONDocument)) 
+
+    # Containment lookups on the list columns (see migrations/v0002_jsonb.py)
+    __table_args__ = (
+        Index("ix_user_dietary_preferences", "dietary_preferences", postgresql_using="gin"),
+        Index("ix_user_allergies", "allergies", postgresql_using="gin"),
+    )
     
 
 class FoodItem(SQLModel):
@@ -41,4 +49,45 @@ class MealPlan(SQLModel):
 
 class UserMealPlan(SQLModel, table=True):
     email: str = Field(primary_key=True)
-    meal_plan: dict = Field(sa_column=Column(JSON))
\ No newline at end of file
+    meal_plan: dict = Field(sa_column=Column(JSONDocument))  # materialized current version
+    version: int = 0  # MealPlanVersion.version the row holds
+
+class MealPlanVersion(SQLModel, table=True):
+    __tablename__ = "meal_plan_versions"
+    __table_args__ = (UniqueConstraint("email", "version"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    email: str
+    version: int
+    kind: str  # "snapshot" holds the whole plan, "delta" only the top-level keys that changed
+    payload: dict = Field(sa_column=Column(JSONDocument))
+    source: str  # generate, update, manual, rollback:<version>
+    created_at: float
+
+class WeeklyPlanDay(SQLModel, table=True):
+    # One row per day, so regenerating a day rewrites only that day
+    __tablename__ = "weekly_plan_days"
+
+    email: str = Field(primary_key=True)
+    day: str = Field(primary_key=True)  # monday .. sunday
+    meal_plan: dict = Field(sa_column=Column(JSONDocument))
+    updated_at: float
+
+class MealPlanCache(SQLModel, table=True):
+    key: str = Field(primary_key=True)  # hash of the normalized promptInput
+    meal_plan: dict = Field(sa_column=Column(JSON))
+    created_at: float = Field(index=True)
+
+
+class MealPlanJob(SQLModel, table=True):
+    id: str = Field(primary_key=True)
+    email: str = Field(index=True)
+    kind: str  # "generate" or "update"
+    status: str = Field(default="queued", index=True)  # queued, running, succeeded, failed
+    request: dict = Field(sa_column=Column(JSON))
+    result: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    heartbeat_at: Optional[float] = None  # last sign of life from the worker running it
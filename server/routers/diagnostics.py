@@ -0,0 +1,102 @@
+from fastapi import APIRouter, Query
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from ..db import pool_stats
+from ..services.model_health import health_registry
+from ..services.rate_limiter import rate_limiter
+from ..services.plan_cache import plan_cache
+from ..services.nutrition import nutrition_stats
+from ..services.food_db import food_table
+from ..services.plan_synth import plan_synthesizer
+from ..services.dietary_constraints import constraint_stats
+from ..services.json_repair import repair_stats
+from ..services.plan_history import history_compactor
+from ..services.response_cache import plan_responses
+from ..services.passwords import password_hasher
+from ..services.weekly_plan import weekly_stats
+from ..services.profiler import PROFILER_MIN_INTERVAL, profiler
+from ..services.metrics import TimedRoute
+
+router = APIRouter(
+    prefix="/diagnostics",
+    tags=["diagnostics"],
+    route_class=TimedRoute
+)
+
+# read-only view of the Groq model pool health
+@router.get("/model-health")
+def getModelHealth():
+    return health_registry.snapshot()
+
+# remaining per-model token/request budget and queue depth
+@router.get("/rate-limits")
+def getRateLimits():
+    return rate_limiter.snapshot()
+
+# meal-plan cache hit/miss counters
+@router.get("/plan-cache")
+def getPlanCacheStats():
+    return plan_cache.stats()
+
+# plan validation and targeted repair counters, food-table name lookups by match kind,
+# diet/allergy scans
+@router.get("/nutrition")
+def getNutritionStats():
+    return {**nutrition_stats.snapshot(), "food_lookups": food_table.stats, "dietary_constraints": constraint_stats}
+
+# model responses parsed cleanly, repaired locally (a fallback call saved) or beyond repair, by kind of fix
+@router.get("/llm-output")
+def getLlmOutputStats():
+    return repair_stats.snapshot()
+
+# template-first synthesis: library size and how often it spares an LLM call
+@router.get("/plan-synth")
+def getPlanSynthStats():
+    return plan_synthesizer.stats()
+
+# connection pool checkouts, wait times and current occupancy
+@router.get("/db-pool")
+def getDbPoolStats():
+    return pool_stats()
+
+# result of the last plan-history compaction run
+@router.get("/plan-history")
+def getPlanHistoryStats():
+    return {"interval": history_compactor.interval, "last_run": history_compactor.last_run}
+
+# cached get-meal-plan responses and how many were answered with 304
+@router.get("/response-cache")
+def getResponseCacheStats():
+    return plan_responses.stats()
+
+# password hashing pool: queue depth, verify cost, plaintext/old-cost hashes upgraded on login
+@router.get("/passwords")
+def getPasswordStats():
+    return password_hasher.stats()
+
+# weekly plans: days generated, served from the meal library, reused or failed, and meal names repeated across a week
+@router.get("/weekly-plans")
+def getWeeklyPlanStats():
+    return weekly_stats
+
+# sampling profiler, switched on and off at runtime; async so it samples the event loop's thread
+@router.post("/profiler/start")
+async def startProfiler(interval: Optional[float] = Query(default=None, ge=PROFILER_MIN_INTERVAL), all_threads: bool = False, reset: bool = True):
+    if reset and not profiler.running:
+        profiler.reset()
+    profiler.start(interval, all_threads)
+    return profiler.stats()
+
+@router.post("/profiler/stop")
+def stopProfiler():
+    profiler.stop()
+    return profiler.stats()
+
+# sampled stacks in collapsed format (flamegraph.pl, speedscope), most frequent first
+@router.get("/profiler", response_class=PlainTextResponse)
+def getProfile(limit: Optional[int] = None):
+    return profiler.collapsed(limit)
+
+@router.get("/profiler/stats")
+def getProfilerStats():
+    return profiler.stats()
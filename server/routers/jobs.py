@@ -0,0 +1,36 @@
+from fastapi import Depends, APIRouter
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ..db import get_async_session
+from typing import Annotated
+from ..controllers.jobs import createJob, getJob, getJobMetrics
+from ..schemas import promptInput, UpdateMealPlan
+from ..services.metrics import TimedRoute
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"],
+    route_class=TimedRoute
+)
+
+SessionDep = Annotated[AsyncSession, Depends(get_async_session)]
+
+#queue a daily meal plan generation, returns the job id straight away
+@router.post("/DailyMealPlan/{email}", status_code=202)
+async def queueDailyMealPlan(email: str, requestBody: promptInput, session: SessionDep, fresh: bool = False):
+    request = {**requestBody.model_dump(), "fresh": fresh}
+    return await createJob("generate", email, request, session)
+
+#queue a meal plan update (runs ahead of fresh generations)
+@router.post("/UpdateMealPlan/{email}", status_code=202)
+async def queueUpdatedMealPlan(email: str, requestBody: UpdateMealPlan, session: SessionDep):
+    return await createJob("update", email, requestBody.model_dump(), session)
+
+#worker pool and backlog depth
+@router.get("/metrics")
+async def jobMetrics(session: SessionDep):
+    return await getJobMetrics(session)
+
+#poll a job for its status and result
+@router.get("/{job_id}")
+async def jobStatus(job_id: str, session: SessionDep):
+    return await getJob(job_id, session)
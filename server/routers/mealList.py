@@ -1,27 +1,45 @@
-from fastapi import Depends, APIRouter
-from sqlmodel import  Session
-from ..db import get_session
+from fastapi import Depends, APIRouter, Request
+from fastapi.responses import StreamingResponse
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ..db import get_async_session
 from typing import Annotated
-from ..controllers.mealList import generateDailyMealPlan, generateUpdatedDailyMealPlan
-from ..schemas import promptInput, DailyPlan
-from pydantic import BaseModel
+from ..controllers.mealList import generateDailyMealPlan, generateUpdatedDailyMealPlan, streamDailyMealPlan, streamUpdatedDailyMealPlan
+from ..schemas import promptInput, UpdateMealPlan
+from ..services.metrics import TimedRoute
+from ..services.json_response import ORJSONResponse, plan_response
 
 router = APIRouter(
     prefix="/DailyMealPlan",
-    tags=["DailyMealPlan"]
+    tags=["DailyMealPlan"],
+    route_class=TimedRoute
 )
 
-SessionDep = Annotated[Session, Depends(get_session)]
+SessionDep = Annotated[AsyncSession, Depends(get_async_session)]
 
 #generate daily meal plan
 @router.post("/{email}")
-async def getDailyMealPlan( email: str, requestBody: promptInput,session: SessionDep):
-    return await generateDailyMealPlan(email,requestBody,session)
+async def getDailyMealPlan( email: str, requestBody: promptInput, fresh: bool = False):
+    # ?fresh=true skips the plan cache and always asks the LLM
+    return plan_response(await generateDailyMealPlan(email,requestBody,fresh))
 
-class UpdateMealPlan(BaseModel):
-    prompt: str
-    previousMealPlan:DailyPlan
+def wantsSSE(request: Request):
+    # NDJSON by default, Server-Sent Events when the client asks for them
+    return "text/event-stream" in request.headers.get("accept", "")
+
+def streamingResponse(events, sse):
+    return StreamingResponse(events, media_type="text/event-stream" if sse else "application/x-ndjson")
+
+#stream the daily meal plan meal by meal
+@router.post("/stream/{email}")
+async def getDailyMealPlanStream( email: str, requestBody: promptInput, request: Request):
+    sse = wantsSSE(request)
+    return streamingResponse(await streamDailyMealPlan(email,requestBody,sse), sse)
 
 @router.post("/UpdateMealPlan/{email}")
-async def upadateDailyMealPlan( email: str, requestBody: UpdateMealPlan,session: SessionDep):
-    return await generateUpdatedDailyMealPlan(email,requestBody,session)
+async def upadateDailyMealPlan( email: str, requestBody: UpdateMealPlan):
+    return ORJSONResponse(await generateUpdatedDailyMealPlan(email,requestBody))
+
+@router.post("/UpdateMealPlan/stream/{email}")
+async def updateDailyMealPlanStream( email: str, requestBody: UpdateMealPlan,session: SessionDep, request: Request):
+    sse = wantsSSE(request)
+    return streamingResponse(await streamUpdatedDailyMealPlan(email,requestBody,session,sse), sse)
@@ -0,0 +1,30 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from .. import db
+from ..services.metrics import CONTENT_TYPE, Gauge, TimedRoute, registry
+from ..services.passwords import password_hasher
+from ..services.rate_limiter import rate_limiter
+from ..controllers.jobs import jobQueue
+
+router = APIRouter(
+    tags=["metrics"],
+    route_class=TimedRoute
+)
+
+
+def poolGauge(key):
+    # Read through db.pool_stats so a swapped engine is picked up; SQLAlchemy's overflow is negative until the pool fills
+    return lambda: [({}, max(0, db.pool_stats().get(key, 0)))]
+
+
+registry.register(Gauge("db_pool_checked_out", "Pooled DB connections in use", poolGauge("checked_out")))
+registry.register(Gauge("db_pool_overflow", "DB connections open beyond the pool size", poolGauge("overflow")))
+registry.register(Gauge("llm_rate_limit_waiting", "Requests queued for model token headroom", lambda: rate_limiter.waiting))
+registry.register(Gauge("password_hash_pending", "Password hashes queued or running", lambda: password_hasher.pending))
+registry.register(Gauge("job_queue_backlog", "Background jobs waiting for a worker", lambda: jobQueue.stats()["backlog"]))
+registry.register(Gauge("job_queue_running", "Background jobs being worked on", lambda: jobQueue.running))
+
+# Prometheus scrape endpoint: request/stage/LLM histograms and counters, pool and queue gauges
+@router.get("/metrics")
+def getMetrics():
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
@@ -1,37 +1,96 @@
-from fastapi import Depends, APIRouter, HTTPException
-from sqlmodel import  Session
-from ..db import get_session
-from typing import Annotated
-from ..schemas import DailyPlan, UserMealPlanSchema
-from ..models import UserMealPlan
+from fastapi import Depends, APIRouter, Header, HTTPException, Response
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ..db import get_async_session
+from ..jsonb import json_text
+from typing import Annotated, Optional
+from ..schemas import DailyPlan, Meal, MealSlot, MealPlanVersionSchema, UserMealPlanSchema
+from ..models import UserMealPlan, User
+from ..controllers.mealList import saveUserMealPlan
+from ..services.dietary_constraints import plan_violations
+from ..services.plan_history import PlanVersionNotFound, plan_at_version, plan_history, rollback_plan
+from ..services.response_cache import etag_matches, plan_responses
+from ..services.metrics import TimedRoute, stage
+from ..services.json_response import plan_document
 
 router = APIRouter(
     prefix="/user-meal-plan",
-    tags=["ADD or GET User Meal Plan"]
+    tags=["ADD or GET User Meal Plan"],
+    route_class=TimedRoute
 )
 
-SessionDep = Annotated[Session, Depends(get_session)]
+SessionDep = Annotated[AsyncSession, Depends(get_async_session)]
 
+# served from cached response bytes, built from the stored JSON text on a miss; a matching If-None-Match gets 304.
+# A cached plan whose version was checked in the last PLAN_VERSION_TTL seconds is served without touching the
+# database (saves on this worker invalidate it); after that the stored version is read again, so a plan saved
+# by another worker is served within PLAN_VERSION_TTL
 @router.get("/get-meal-plan/{email}", response_model=UserMealPlanSchema)
-def getUserMealPlan(email: str, session: SessionDep):
-    user_meal_plan = session.get(UserMealPlan, email)
-    if not user_meal_plan:
-        raise HTTPException(status_code=404, detail="User meal plan not found")
-    return user_meal_plan
+async def getUserMealPlan(email: str, session: SessionDep, if_none_match: Optional[str] = Header(default=None)):
+    cached = plan_responses.recent(email)
+    if cached is None:
+        version = (await session.exec(select(UserMealPlan.version).where(UserMealPlan.email == email))).first()
+        if version is None:
+            raise HTTPException(status_code=404, detail="User meal plan not found")
+        cached = plan_responses.get(email, version)
+    if cached is None:
+        epoch = plan_responses.epoch
+        # The stored JSON text goes into the body as is; it was validated when it was saved
+        row = (await session.exec(
+            select(json_text(UserMealPlan.meal_plan), UserMealPlan.version).where(UserMealPlan.email == email)
+        )).first()
+        if not row:
+            raise HTTPException(status_code=404, detail="User meal plan not found")
+        meal_plan, version = row
+        with stage("serialize"):
+            body = plan_document(email, meal_plan, version)
+        cached = plan_responses.put(email, version, body, epoch)
+
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, cached.etag):
+        plan_responses.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+# one meal of the stored plan, extracted by the database instead of loading the whole document
+@router.get("/get-meal-plan/{email}/{meal}", response_model=Meal)
+async def getUserMeal(email: str, meal: MealSlot, session: SessionDep):
+    user_meal = (await session.exec(select(UserMealPlan.meal_plan[meal]).where(UserMealPlan.email == email))).first()
+    if not user_meal:
+        raise HTTPException(status_code=404, detail="User meal not found")
+    return user_meal
 
 @router.post("/add-meal-plan/{email}", response_model=UserMealPlanSchema)
-def addUserMealPlan(email: str, meal_plan: DailyPlan, session: SessionDep):
-    # Check if meal plan already exists
-    existing_plan = session.get(UserMealPlan, email)
-
-    if existing_plan:
-        # Update existing meal plan
-        existing_plan.meal_plan = meal_plan.model_dump()
-    else:
-        # Create new meal plan
-        existing_plan = UserMealPlan(email=email, meal_plan=meal_plan.model_dump())
-        session.add(existing_plan)
-
-    session.commit()
-    session.refresh(existing_plan)
-    return existing_plan
\ No newline at end of file
+async def addUserMealPlan(email: str, meal_plan: DailyPlan, session: SessionDep):
+    # Refuse plans that break the user's diet or allergies
+    user = (await session.exec(select(User).where(User.email == email))).first()
+    if user:
+        violations = plan_violations(meal_plan.model_dump(), user.dietary_preferences, user.allergies)
+        if violations:
+            raise HTTPException(status_code=422, detail={"message": "Meal plan breaks the user's dietary constraints", "violations": violations})
+
+    return await saveUserMealPlan(email, meal_plan.model_dump(), session, "manual")
+
+# newest-first list of saved versions; page with ?before=<oldest version seen>
+@router.get("/history/{email}", response_model=list[MealPlanVersionSchema])
+async def getUserMealPlanHistory(email: str, session: SessionDep, limit: int = 20, before: Optional[int] = None):
+    return await plan_history(session, email, min(limit, 100), before)
+
+# the plan as it was at one version
+@router.get("/history/{email}/{version}", response_model=UserMealPlanSchema)
+async def getUserMealPlanVersion(email: str, version: int, session: SessionDep):
+    try:
+        plan = await plan_at_version(session, email, version)
+    except PlanVersionNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"email": email, "meal_plan": plan, "version": version}
+
+# make an old version current again (saved as a new version, so it can be undone too)
+@router.post("/rollback/{email}/{version}", response_model=UserMealPlanSchema)
+async def rollbackUserMealPlan(email: str, version: int, session: SessionDep):
+    try:
+        user_meal_plan = await rollback_plan(session, email, version)
+    except PlanVersionNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    plan_responses.invalidate(email)
+    return user_meal_plan
@@ -1,52 +1,81 @@
-from fastapi import Depends, APIRouter, HTTPException
-from sqlmodel import  Session
-from ..db import get_session
-from typing import Annotated
-from ..schemas import userschema, responseUserSchema
-from ..controllers.users import getAllUsers, getSingleUsers, addNewUsers
+from fastapi import Depends, APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ..db import get_async_session
+from typing import Annotated, Literal, Optional
+from ..schemas import userschema, userEditSchema, responseUserSchema
+from ..controllers.users import getAllUsers, exportUsers, findUsers, getSingleUsers, addNewUsers, hashPassword, userColumns
 from ..models import User
+from ..services.metrics import TimedRoute
+from ..services.json_response import ORJSONResponse
 from pydantic import BaseModel
-from sqlmodel import Session, select
+from sqlmodel import select
 
 router = APIRouter(
     prefix="/user",
-    tags=["users"]
+    tags=["users"],
+    route_class=TimedRoute
 )
 
-SessionDep = Annotated[Session, Depends(get_session)]
+SessionDep = Annotated[AsyncSession, Depends(get_async_session)]
 
-#get all users
-@router.get("/showAll", response_model=list[responseUserSchema])
-def getUsers(session: SessionDep):
-    return getAllUsers(session)
+#get all users. With limit (and after_id) it returns a keyset page at a time: pass the X-Next-Cursor of one
+# page as after_id for the next. Without either it still returns every user, as it always has.
+# fields=email,age projects columns; format=ndjson streams every user after after_id instead
+@router.get("/showAll")
+async def getUsers(
+    session: SessionDep,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(default=None, ge=1, le=1000),
+    fields: Optional[str] = None,
+    format: Literal["json", "ndjson"] = "json",
+):
+    columns = userColumns(fields)
+    if format == "ndjson":
+        return StreamingResponse(exportUsers(columns, after_id or 0), media_type="application/x-ndjson")
+    if after_id is not None and limit is None:
+        limit = 100
+    users = await getAllUsers(session, after_id or 0, limit, columns)
+    # Rows are plain JSON values already, so skip jsonable_encoder and let orjson encode them
+    headers = {"X-Next-Cursor": str(users[-1]["id"])} if limit and len(users) == limit else None
+    return ORJSONResponse(users, headers=headers)
+
+# users whose preferences/allergies include the given values (GIN-indexed on Postgres)
+@router.get("/search", response_model=list[responseUserSchema])
+async def searchUsers(session: SessionDep, dietary_preference: Optional[str] = None, allergy: Optional[str] = None):
+    return await findUsers(dietary_preference, allergy, session)
 
 class usersLogin(BaseModel):
     email: str
     password: str
 # get single user
 @router.post("/login", response_model=responseUserSchema)
-def getUser(userdata: usersLogin, session: SessionDep):
-    return getSingleUsers(userdata,session)
+async def getUser(userdata: usersLogin, session: SessionDep):
+    return await getSingleUsers(userdata,session)
 
 # add user
 @router.post("/addUser", response_model=responseUserSchema)
-def addUser(user: userschema, session: SessionDep):
-    return addNewUsers(user,session)
+async def addUser(user: userschema, session: SessionDep):
+    return await addNewUsers(user,session)
 
 @router.put("/edit/{email}", response_model=responseUserSchema)
-def editUser(email: str, user_data: userschema, session: SessionDep):
-    user = session.exec(select(User).where(User.email == email)).first()
+async def editUser(email: str, user_data: userEditSchema, session: SessionDep):
+    user = (await session.exec(select(User).where(User.email == email))).first()
     
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
     # Explicitly updating fields
     update_data = user_data.model_dump(exclude_unset=True)  # Get only the provided fields
+    if update_data.get("password") is None:
+        update_data.pop("password", None)
+    else:
+        update_data["password"] = await hashPassword(update_data["password"])
     for key, value in update_data.items():
         setattr(user, key, value)  # Dynamically update the user object
 
     session.add(user)  # Mark the object as "dirty"
-    session.commit()  # Save changes to the DB
-    session.refresh(user)  # Refresh to get the latest data
+    await session.commit()  # Save changes to the DB
+    await session.refresh(user)  # Refresh to get the latest data
     
     return user
\ No newline at end of file
@@ -0,0 +1,30 @@
+from fastapi import Depends, APIRouter
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ..db import get_async_session
+from typing import Annotated
+from ..controllers.mealList import generateWeeklyMealPlan, getWeeklyMealPlan
+from ..schemas import promptInput, weeklyPromptInput, WeeklyPlanSchema, Weekday
+from ..services.metrics import TimedRoute
+
+router = APIRouter(
+    prefix="/WeeklyMealPlan",
+    tags=["WeeklyMealPlan"],
+    route_class=TimedRoute
+)
+
+SessionDep = Annotated[AsyncSession, Depends(get_async_session)]
+
+#generate a weekly meal plan, the days in parallel; "days" limits it to those days and reuses the rest
+@router.post("/{email}", response_model=WeeklyPlanSchema)
+async def getNewWeeklyMealPlan(email: str, requestBody: weeklyPromptInput):
+    return await generateWeeklyMealPlan(email, requestBody)
+
+#regenerate a single day of the stored week
+@router.post("/{email}/{day}", response_model=WeeklyPlanSchema)
+async def regenerateWeeklyMealPlanDay(email: str, day: Weekday, requestBody: promptInput):
+    return await generateWeeklyMealPlan(email, weeklyPromptInput(**requestBody.model_dump(), days=[day]))
+
+#get the stored weekly meal plan
+@router.get("/{email}", response_model=WeeklyPlanSchema)
+async def getStoredWeeklyMealPlan(email: str, session: SessionDep):
+    return await getWeeklyMealPlan(email, session)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Literal
 
 class userschema(BaseModel):
     email: str
@@ -13,10 +13,13 @@ class userschema(BaseModel):
     dietary_preferences: List[str]
     allergies: List[str]
 
+class userEditSchema(userschema):
+    # Responses no longer carry the password, so profiles sent back without one keep theirs
+    password: Optional[str] = None
+
 class responseUserSchema(BaseModel):
     id:int
     email: str
-    password: str
     age: int
     weight: int
     targetWeight: int
@@ -50,9 +53,35 @@ class DailyPlan(BaseModel):
     hydration: str = Field(description="Daily hydration recommendation")
     notes: Optional[str] = Field(description="Additional nutritional notes")
 
+class MealPlanPatch(BaseModel):
+    breakfast: Optional[Meal] = Field(default=None, description="Replacement breakfast, only if it changes")
+    morning_snack: Optional[Meal] = Field(default=None, description="Replacement morning snack, only if it changes")
+    lunch: Optional[Meal] = Field(default=None, description="Replacement lunch, only if it changes")
+    afternoon_snack: Optional[Meal] = Field(default=None, description="Replacement afternoon snack, only if it changes")
+    dinner: Optional[Meal] = Field(default=None, description="Replacement dinner, only if it changes")
+    hydration: Optional[str] = Field(default=None, description="New hydration recommendation, only if it changes")
+    notes: Optional[str] = Field(default=None, description="New nutritional notes, only if they change")
+
+MealSlot = Literal["breakfast", "morning_snack", "lunch", "afternoon_snack", "dinner"]
+
 class UserMealPlanSchema(BaseModel):
     email: str
     meal_plan: DailyPlan
+    version: Optional[int] = None
+
+class MealPlanVersionSchema(BaseModel):
+    version: int
+    kind: str
+    source: str
+    created_at: float
+    changed: List[str]
+
+Weekday = Literal["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+class WeeklyPlanSchema(BaseModel):
+    email: str
+    days: Dict[Weekday, DailyPlan]
+    generated: List[Weekday] = []  # days this request produced; the rest were reused
 
 class promptInput(BaseModel):
     age:float
@@ -63,4 +92,13 @@ class promptInput(BaseModel):
     daily_physical_activity: str
     dietary_preferences: Optional[List[str]] = None
     allergies: Optional[List[str]] = None
-    
\ No newline at end of file
+
+class UpdateMealPlan(BaseModel):
+    prompt: str
+    previousMealPlan:DailyPlan
+    # "patch" asks the model for the changed meals only, "full" for the whole plan
+    mode: Optional[Literal["patch", "full"]] = None
+
+class weeklyPromptInput(promptInput):
+    # Days to (re)generate; the others are reused from the stored week. All seven when omitted
+    days: Optional[List[Weekday]] = None
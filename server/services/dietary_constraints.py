@@ -0,0 +1,295 @@
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .food_db import singular
+from .plan_patch import MEAL_SLOTS
+
+# Ingredient phrases per category. Matching is on whole words after
+# singularizing, so "eggs" hits "egg" but "eggplant" does not.
+CATEGORY_TERMS: Dict[str, Tuple[str, ...]] = {
+    "meat": (
+        "beef", "steak", "pork", "bacon", "ham", "sausage", "salami", "pepperoni", "lamb", "mutton",
+        "goat", "veal", "venison", "meat", "meatball", "keema", "mince", "gelatin", "lard", "prosciutto",
+    ),
+    "pork": ("pork", "bacon", "ham", "sausage", "salami", "pepperoni", "lard", "prosciutto", "chorizo"),
+    "poultry": ("chicken", "turkey", "duck", "quail", "tandoori chicken", "chicken breast"),
+    "fish": (
+        "fish", "salmon", "tuna", "cod", "tilapia", "sardine", "mackerel", "anchovy", "trout",
+        "halibut", "pomfret", "rohu", "basa", "fish sauce", "surimi",
+    ),
+    "shellfish": ("shrimp", "prawn", "crab", "lobster", "oyster", "mussel", "clam", "scallop", "squid", "calamari"),
+    "dairy": (
+        "milk", "cheese", "paneer", "yogurt", "yoghurt", "curd", "dahi", "butter", "ghee", "cream",
+        "whey", "casein", "buttermilk", "chaas", "lassi", "kefir", "raita", "khoa", "mozzarella",
+        "cheddar", "feta", "parmesan", "ricotta", "cottage cheese", "ice cream", "custard",
+    ),
+    "egg": ("egg", "omelette", "omelet", "mayonnaise", "mayo", "meringue"),
+    "honey": ("honey",),
+    "peanut": ("peanut", "groundnut", "peanut butter", "satay"),
+    "tree_nut": (
+        "almond", "cashew", "walnut", "pistachio", "pecan", "hazelnut", "macadamia", "brazil nut",
+        "pine nut", "nut", "mixed nut", "praline", "marzipan", "nutella",
+    ),
+    "gluten": (
+        "wheat", "whole wheat", "bread", "toast", "roti", "chapati", "chapathi", "phulka", "naan",
+        "paratha", "pasta", "spaghetti", "penne", "noodle", "semolina", "rava", "sooji", "upma",
+        "couscous", "barley", "rye", "seitan", "bagel", "tortilla", "wrap", "cracker", "muesli",
+        "granola", "flour", "maida", "atta", "dalia", "bulgur", "cereal", "biscuit", "cookie",
+    ),
+    "soy": ("soy", "soya", "tofu", "tempeh", "edamame", "miso", "soy sauce", "soy milk"),
+    "sesame": ("sesame", "tahini", "hummus", "til"),
+    "mustard": ("mustard",),
+    "alcohol": ("wine", "beer", "rum", "vodka", "whiskey", "liqueur"),
+    "high_carb": (
+        "rice", "bread", "toast", "roti", "chapati", "naan", "paratha", "pasta", "noodle", "potato",
+        "sweet potato", "oat", "oatmeal", "poha", "upma", "idli", "dosa", "quinoa", "couscous",
+        "banana", "mango", "date", "raisin", "sugar", "jaggery", "honey", "juice", "cornflake",
+        "muesli", "granola", "corn", "millet", "bagel", "tortilla", "cereal", "lentil", "dal",
+        "chickpea", "chana", "rajma", "kidney bean", "black bean",
+    ),
+    "grain": (
+        "rice", "oat", "oatmeal", "wheat", "whole wheat", "corn", "cornflake", "barley", "rye", "millet",
+        "quinoa", "bread", "toast", "roti", "chapati", "chapathi", "phulka", "naan", "paratha", "pasta",
+        "spaghetti", "penne", "noodle", "poha", "upma", "idli", "dosa", "couscous", "muesli", "granola",
+        "cereal", "bagel", "tortilla", "cracker", "flour", "maida", "atta", "semolina", "rava", "sooji",
+        "dalia", "bulgur", "biscuit", "cookie",
+    ),
+    "legume": (
+        "lentil", "dal", "chickpea", "chana", "rajma", "kidney bean", "black bean", "pinto bean",
+        "navy bean", "baked bean", "mung bean", "moong", "urad", "besan", "hummus",
+    ),
+    "added_sugar": ("sugar", "brown sugar", "jaggery", "corn syrup", "candy", "soda", "soft drink"),
+    "root_vegetable": ("potato", "onion", "garlic", "carrot", "beetroot", "radish", "ginger", "sweet potato"),
+}
+
+# Phrases that contain a trigger word but mean something else. Being longer,
+# they win over the word inside them and map to these categories instead.
+OVERRIDES: Dict[str, Tuple[str, ...]] = {
+    "almond milk": ("tree_nut",),
+    "cashew milk": ("tree_nut",),
+    "coconut milk": (),
+    "oat milk": ("grain",),
+    "rice milk": ("high_carb", "grain"),
+    "soy milk": ("soy",),
+    "peanut butter": ("peanut",),
+    "almond butter": ("tree_nut",),
+    "cashew butter": ("tree_nut",),
+    "cocoa butter": (),
+    "nut butter": ("tree_nut",),
+    "coconut cream": (),
+    "vegan cheese": (),
+    "vegan butter": (),
+    "egg free": (),
+    "eggless": (),
+    "dairy free": (),
+    "gluten free": (),
+    "gluten free bread": ("high_carb", "grain"),
+    "gluten free pasta": ("high_carb", "grain"),
+    "nut free": (),
+    "lettuce wrap": (),
+    "rice cake": ("high_carb", "grain"),
+    "cauliflower rice": (),
+    # A squeeze of citrus is not a glass of juice
+    "lemon juice": (),
+    "lime juice": (),
+    "tofu scramble": ("soy",),
+    "soy chunk": ("soy",),
+}
+
+# What each dietary preference rules out. Every option the client offers
+# (veg, non-veg, vegan, keto, paleo) must be a key here
+DIET_CATEGORIES: Dict[str, Tuple[str, ...]] = {
+    "vegetarian": ("meat", "poultry", "fish", "shellfish"),
+    "veg": ("meat", "poultry", "fish", "shellfish"),
+    "non veg": (),
+    "non vegetarian": (),
+    "eggetarian": ("meat", "poultry", "fish", "shellfish"),
+    "lacto vegetarian": ("meat", "poultry", "fish", "shellfish", "egg"),
+    "vegan": ("meat", "poultry", "fish", "shellfish", "dairy", "egg", "honey"),
+    "pescatarian": ("meat", "poultry"),
+    "keto": ("high_carb",),
+    "ketogenic": ("high_carb",),
+    "low carb": ("high_carb",),
+    "paleo": ("grain", "gluten", "legume", "peanut", "soy", "dairy", "added_sugar"),
+    "gluten free": ("gluten",),
+    "celiac": ("gluten",),
+    "dairy free": ("dairy",),
+    "lactose free": ("dairy",),
+    "lactose intolerant": ("dairy",),
+    "lactose intolerance": ("dairy",),
+    "nut free": ("peanut", "tree_nut"),
+    "halal": ("pork", "alcohol"),
+    "jain": ("meat", "poultry", "fish", "shellfish", "egg", "root_vegetable"),
+}
+
+# Allergy names users type, mapped to categories
+ALLERGY_CATEGORIES: Dict[str, Tuple[str, ...]] = {
+    "peanut": ("peanut",),
+    "groundnut": ("peanut",),
+    "nut": ("peanut", "tree_nut"),
+    "tree nut": ("tree_nut",),
+    "dairy": ("dairy",),
+    "milk": ("dairy",),
+    "lactose": ("dairy",),
+    "lactose intolerance": ("dairy",),
+    "lactose intolerant": ("dairy",),
+    "egg": ("egg",),
+    "gluten": ("gluten",),
+    "wheat": ("gluten",),
+    "fish": ("fish",),
+    "shellfish": ("shellfish",),
+    "seafood": ("fish", "shellfish"),
+    "soy": ("soy",),
+    "soya": ("soy",),
+    "sesame": ("sesame",),
+    "mustard": ("mustard",),
+}
+
+
+def normalize_words(text: str) -> List[str]:
+    return [singular(word) for word in re.findall(r"[a-z]+", text.lower())]
+
+
+def _key(text: str) -> str:
+    return " ".join(normalize_words(text))
+
+
+class ConstraintIndex:
+    """
+    Word-level Aho-Corasick automaton over every ingredient phrase. One scan
+    of a food name finds all phrases in it; overlapping matches resolve
+    leftmost-longest, so "peanut butter" is a peanut and not dairy.
+    Per-name results are memoized since plans repeat the same foods.
+    """
+
+    def __init__(self, category_terms=CATEGORY_TERMS, overrides=OVERRIDES, cache_size: int = 50000):
+        phrases: Dict[Tuple[str, ...], Set[str]] = {}
+        for category, terms in category_terms.items():
+            for term in terms:
+                phrases.setdefault(tuple(normalize_words(term)), set()).add(category)
+        for phrase, categories in overrides.items():
+            phrases[tuple(normalize_words(phrase))] = set(categories)
+
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[Tuple[int, frozenset]]] = [[]]
+        for phrase, categories in phrases.items():
+            node = 0
+            for word in phrase:
+                if word not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[node][word] = len(self.goto) - 1
+                node = self.goto[node][word]
+            self.output[node].append((len(phrase), frozenset(categories)))
+
+        # Breadth-first failure links, inheriting the outputs of each suffix
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for word, child in self.goto[node].items():
+                queue.append(child)
+                if node:
+                    fallback = self.fail[node]
+                    while fallback and word not in self.goto[fallback]:
+                        fallback = self.fail[fallback]
+                    self.fail[child] = self.goto[fallback].get(word, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+        self.cache_size = cache_size
+        self._scanned: Dict[str, Tuple[frozenset, str]] = {}
+
+    def matches(self, words: List[str]) -> List[Tuple[int, int, frozenset]]:
+        """``(start, end, categories)`` of every phrase found, leftmost-longest and non-overlapping."""
+        found = []
+        node = 0
+        for position, word in enumerate(words):
+            while node and word not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(word, 0)
+            for length, categories in self.output[node]:
+                found.append((position - length + 1, position + 1, categories))
+        found.sort(key=lambda match: (match[0], -match[1]))
+        chosen = []
+        covered = 0
+        for start, end, categories in found:
+            if start >= covered:
+                chosen.append((start, end, categories))
+                covered = end
+        return chosen
+
+    def scan(self, text: str) -> Tuple[frozenset, str]:
+        """Categories found in ``text`` and its normalized words as " word word " for literal checks."""
+        cached = self._scanned.get(text)
+        if cached is None:
+            if len(self._scanned) >= self.cache_size:
+                self._scanned.clear()
+            words = normalize_words(text)
+            categories = frozenset().union(*(categories for _, _, categories in self.matches(words)))
+            cached = (categories, f" {' '.join(words)} ")
+            self._scanned[text] = cached
+        return cached
+
+    def categories(self, text: str) -> frozenset:
+        return self.scan(text)[0]
+
+
+def forbidden(dietary_preferences: Optional[Iterable[str]], allergies: Optional[Iterable[str]]) -> Tuple[frozenset, Tuple[str, ...]]:
+    """
+    Categories ruled out for a user, plus allergies with no known category
+    (e.g. "strawberry") as normalized phrases to look for literally.
+    """
+    categories = set()
+    literal = []
+    for preference in dietary_preferences or []:
+        categories.update(DIET_CATEGORIES.get(_key(preference), ()))
+    for allergy in allergies or []:
+        key = _key(allergy)
+        if not key:
+            continue
+        known = ALLERGY_CATEGORIES.get(key) or ALLERGY_CATEGORIES.get(key.replace(" allergy", ""))
+        if known:
+            categories.update(known)
+        else:
+            literal.append(key)
+    return frozenset(categories), tuple(literal)
+
+
+def plan_violations(plan: dict, dietary_preferences=None, allergies=None, index: Optional["ConstraintIndex"] = None) -> List[dict]:
+    """
+    Every ``FoodItem`` in the plan that breaks the user's diet or allergies,
+    as ``{"slot", "food", "categories"}`` dicts. Empty means the plan is safe.
+    """
+    index = index or constraint_index
+    categories, literal = forbidden(dietary_preferences, allergies)
+    if not categories and not literal:
+        return []
+    violations = []
+    for slot in MEAL_SLOTS:
+        for food in plan[slot]["foods"]:
+            found, words = index.scan(food["name"])
+            hits = found & categories
+            if literal:
+                hits = hits | {phrase for phrase in literal if f" {phrase} " in words}
+            if hits:
+                violations.append({"slot": slot, "food": food["name"], "categories": sorted(hits)})
+    return violations
+
+
+def describe_violations(violations: List[dict]) -> str:
+    return "; ".join(f"{v['food']} in {v['slot']} ({', '.join(v['categories'])})" for v in violations)
+
+
+class DietaryConstraintViolation(Exception):
+    """A plan still breaks the user's diet or allergies after repair."""
+
+    def __init__(self, violations: List[dict]):
+        super().__init__(f"Meal plan breaks dietary constraints: {describe_violations(violations)}")
+        self.violations = violations
+
+
+constraint_index = ConstraintIndex()
+# Plans scanned on the generate/update paths and what happened to the violating ones
+constraint_stats = {"checked": 0, "violating": 0, "repaired": 0, "rejected": 0}
@@ -0,0 +1,200 @@
+import asyncio
+import functools
+import json
+import math
+import os
+import random
+import time
+from typing import Callable, List, Optional, Tuple
+
+import groq
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from .rate_limiter import estimate_tokens
+
+# JSON list of recorded responses: DailyPlan objects, or raw model text as strings
+FAKE_LLM_RECORDINGS = os.getenv(
+    "FAKE_LLM_RECORDINGS", os.path.join(os.path.dirname(__file__), "data", "recorded_plans.json")
+)
+# Time to first token, e.g. "fixed:0.4", "uniform:0.2:1", "normal:0.5:0.1", "lognormal:0.4:0.5", "exponential:0.5"
+FAKE_LLM_LATENCY = os.getenv("FAKE_LLM_LATENCY", "lognormal:0.4:0.5")
+# Output tokens per second after the first one; 0 returns the whole response at once
+FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "250"))
+# Share of calls answered with a 429, a timeout, or JSON the parser cannot read
+FAKE_LLM_RATE_LIMIT_RATE = float(os.getenv("FAKE_LLM_RATE_LIMIT_RATE", "0"))
+FAKE_LLM_TIMEOUT_RATE = float(os.getenv("FAKE_LLM_TIMEOUT_RATE", "0"))
+FAKE_LLM_MALFORMED_RATE = float(os.getenv("FAKE_LLM_MALFORMED_RATE", "0"))
+# Seconds a timed-out call hangs before failing (ChatGroq's own timeout)
+FAKE_LLM_TIMEOUT = float(os.getenv("FAKE_LLM_TIMEOUT", "60"))
+# Retry-After sent with a 429
+FAKE_LLM_RETRY_AFTER = float(os.getenv("FAKE_LLM_RETRY_AFTER", "2"))
+# Same seed, same sequence of latencies, faults and responses per model
+FAKE_LLM_SEED = os.getenv("FAKE_LLM_SEED")
+
+GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
+CHARS_PER_CHUNK = 32
+
+MALFORMED_KINDS = ("truncated", "trailing_comma", "single_quotes", "prose")
+
+
+def latency_distribution(spec: str) -> Callable[[random.Random], float]:
+    """Parses ``"kind:arg:arg"`` into a sampler of non-negative seconds."""
+    kind, *args = spec.split(":")
+    try:
+        args = [float(arg) for arg in args]
+        samplers = {
+            "fixed": lambda rng, value: value,
+            "uniform": lambda rng, low, high: rng.uniform(low, high),
+            "normal": lambda rng, mean, stdev: rng.gauss(mean, stdev),
+            # Parameterised by the median, so "lognormal:0.4:0.5" centres on 0.4s with a long tail
+            "lognormal": lambda rng, median, sigma: rng.lognormvariate(math.log(median), sigma),
+            "exponential": lambda rng, mean: rng.expovariate(1 / mean),
+        }
+        sample = samplers[kind]
+        sample(random.Random(0), *args)
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        raise ValueError(f"Unknown latency distribution {spec!r}")
+    return lambda rng: max(0.0, sample(rng, *args))
+
+
+@functools.lru_cache(maxsize=None)
+def load_recordings(path: str) -> Tuple[str, ...]:
+    with open(path, encoding="utf-8") as file:
+        entries = json.load(file)
+    return tuple(entry if isinstance(entry, str) else json.dumps(entry, ensure_ascii=False) for entry in entries)
+
+
+def malform(content: str, kind: str, rng: random.Random) -> str:
+    if kind == "truncated":
+        # Cut off mid-way, as when a completion hits max_tokens
+        return content[:rng.randint(len(content) // 3, len(content) - 2)]
+    if kind == "trailing_comma":
+        return content[:-1] + ",}"
+    if kind == "single_quotes":
+        return content.replace('"', "'")
+    return f"Here is your meal plan:\n{content}\nLet me know if you want any changes!"
+
+
+def rate_limit_error(retry_after: float) -> groq.RateLimitError:
+    response = httpx.Response(
+        429, headers={"retry-after": f"{retry_after:g}"}, request=httpx.Request("POST", GROQ_URL)
+    )
+    return groq.RateLimitError("Error code: 429 - Rate limit reached (fake)", response=response, body=None)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Local stand-in for ``ChatGroq`` that replays recorded responses. Each call
+    waits a time to first token drawn from ``latency``, then streams the
+    response at ``tokens_per_second``. A seeded share of calls fail the way
+    Groq does: a 429 with Retry-After, a timeout after ``timeout`` seconds,
+    or a response that is not valid JSON.
+    """
+
+    model_name: str = "fake"
+    recordings: List[str] = []
+    latency: str = FAKE_LLM_LATENCY
+    tokens_per_second: float = FAKE_LLM_TOKENS_PER_SECOND
+    rate_limit_rate: float = FAKE_LLM_RATE_LIMIT_RATE
+    timeout_rate: float = FAKE_LLM_TIMEOUT_RATE
+    malformed_rate: float = FAKE_LLM_MALFORMED_RATE
+    timeout: float = FAKE_LLM_TIMEOUT
+    retry_after: float = FAKE_LLM_RETRY_AFTER
+    seed: Optional[str] = FAKE_LLM_SEED
+    calls: int = 0
+    outcomes: dict = {}
+
+    _rng: Optional[random.Random] = PrivateAttr(default=None)
+    _sample_latency: Optional[Callable] = PrivateAttr(default=None)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-groq"
+
+    def _draw(self, messages) -> Tuple[str, float, str, dict]:
+        """Picks this call's outcome: ``(outcome, first token delay, content, usage)``."""
+        if self._rng is None:
+            # Per model, so adding a model to the list does not shift the others' sequences
+            self._rng = random.Random(None if self.seed is None else f"{self.seed}:{self.model_name}")
+            self._sample_latency = latency_distribution(self.latency)
+        rng = self._rng
+        self.calls += 1
+
+        roll = rng.random()
+        if roll < self.rate_limit_rate:
+            outcome = "rate_limited"
+        elif roll < self.rate_limit_rate + self.timeout_rate:
+            outcome = "timeout"
+        elif roll < self.rate_limit_rate + self.timeout_rate + self.malformed_rate:
+            outcome = "malformed"
+        else:
+            outcome = "ok"
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+        content = rng.choice(self.recordings or load_recordings(FAKE_LLM_RECORDINGS))
+        if outcome == "malformed":
+            content = malform(content, rng.choice(MALFORMED_KINDS), rng)
+        usage = {
+            "input_tokens": sum(estimate_tokens(str(message.content)) for message in messages),
+            "output_tokens": estimate_tokens(content),
+        }
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        return outcome, self._sample_latency(rng), content, usage
+
+    def _generation_time(self, usage: dict) -> float:
+        return usage["output_tokens"] / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _fail(self, outcome: str):
+        if outcome == "rate_limited":
+            raise rate_limit_error(self.retry_after)
+        raise groq.APITimeoutError(request=httpx.Request("POST", GROQ_URL))
+
+    def _result(self, content: str, usage: dict) -> ChatResult:
+        message = AIMessage(content=content, usage_metadata=usage, response_metadata={"model_name": self.model_name})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        outcome, first_token, content, usage = self._draw(messages)
+        if outcome in ("rate_limited", "timeout"):
+            time.sleep(self.timeout if outcome == "timeout" else first_token)
+            self._fail(outcome)
+        time.sleep(first_token + self._generation_time(usage))
+        return self._result(content, usage)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        outcome, first_token, content, usage = self._draw(messages)
+        if outcome in ("rate_limited", "timeout"):
+            await asyncio.sleep(self.timeout if outcome == "timeout" else first_token)
+            self._fail(outcome)
+        await asyncio.sleep(first_token + self._generation_time(usage))
+        return self._result(content, usage)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        outcome, first_token, content, usage = self._draw(messages)
+        if outcome in ("rate_limited", "timeout"):
+            await asyncio.sleep(self.timeout if outcome == "timeout" else first_token)
+            self._fail(outcome)
+        await asyncio.sleep(first_token)
+        chunks = [content[i:i + CHARS_PER_CHUNK] for i in range(0, len(content), CHARS_PER_CHUNK)]
+        pause = self._generation_time(usage) / len(chunks)
+        for index, chunk in enumerate(chunks):
+            if index:
+                await asyncio.sleep(pause)
+            last = index == len(chunks) - 1
+            message = AIMessageChunk(content=chunk, usage_metadata=usage if last else None)
+            generation = ChatGenerationChunk(message=message)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk, chunk=generation)
+            yield generation
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "outcomes": dict(self.outcomes)}
+
+
+def fake_model(name: str, **settings) -> FakeChatModel:
+    """A ``FakeChatModel`` named like the Groq model it replaces; ``settings`` override the env."""
+    return FakeChatModel(model_name=name, outcomes={}, **settings)
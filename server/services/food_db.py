@@ -0,0 +1,249 @@
+import csv
+import difflib
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .plan_patch import MEAL_SLOTS
+
+FOOD_TABLE_PATH = os.getenv("FOOD_TABLE_PATH", os.path.join(os.path.dirname(__file__), "data", "foods.csv"))
+# difflib similarity a misspelt food name needs to match a table entry. High on
+# purpose: at 0.85 "apple juice" matched apple and "oat milk" matched milk
+FOOD_FUZZY_CUTOFF = float(os.getenv("FOOD_FUZZY_CUTOFF", "0.92"))
+# Memoized name/portion resolutions kept before the memo is reset
+FOOD_RESOLVE_CACHE_SIZE = int(os.getenv("FOOD_RESOLVE_CACHE_SIZE", "50000"))
+
+NUTRIENTS = ("calories", "protein", "carbs", "fats")
+
+# Preparation words that do not change which table row a food maps to
+_DESCRIPTORS = {
+    "fresh", "raw", "cooked", "boiled", "steamed", "grilled", "baked", "roasted", "chopped",
+    "sliced", "diced", "plain", "organic", "homemade", "lightly", "unsalted", "of", "a", "with",
+}
+_EXPLICIT_WEIGHT = re.compile(
+    r"(\d+(?:\.\d+)?)\s*(kg|kilograms?|g|gms?|grams?|ml|millilit(?:er|re)s?|l|lit(?:er|re)s?|oz|ounces?)\b"
+)
+_COUNT = re.compile(r"(\d+(?:\.\d+)?(?:\s*/\s*\d+)?|½|¼|¾)\s*([a-z]*)")
+_UNIT_GRAMS = {"kg": 1000, "kilogram": 1000, "g": 1, "gm": 1, "gms": 1, "gram": 1, "oz": 28.35, "ounce": 28.35}
+# Volumes only become grams through a food's ml_g density: a cup of spinach is nowhere near 240 g
+_UNIT_ML = {
+    "ml": 1, "milliliter": 1, "millilitre": 1, "l": 1000, "liter": 1000, "litre": 1000,
+    "cup": 240, "tbsp": 15, "tablespoon": 15, "tsp": 5, "teaspoon": 5,
+}
+# Units that mean "one of whatever the food comes in", sized by the piece_g column
+_PIECE_SCALE = {
+    "": 1, "piece": 1, "pc": 1, "slice": 1, "whole": 1, "medium": 1, "scoop": 1, "serving": 1,
+    "egg": 1, "small": 0.75, "large": 1.25,
+}
+_FRACTIONS = {"½": 0.5, "¼": 0.25, "¾": 0.75}
+# Match kinds whose table numbers may replace the model's; a fuzzy match is only a guess
+TRUSTED_MATCHES = ("exact", "normalized")
+
+
+def singular(word: str) -> str:
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("es") and word[:-2].endswith(("ch", "sh", "to")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def normalize_food_name(name: str) -> str:
+    """Lowercased, parentheticals and preparation words dropped, singular, tokens sorted."""
+    name = re.sub(r"\(.*?\)", " ", name.lower())
+    words = re.findall(r"[a-z]+", name)
+    return " ".join(sorted(singular(word) for word in words if word not in _DESCRIPTORS))
+
+
+def _quantity(text: str) -> float:
+    if text in _FRACTIONS:
+        return _FRACTIONS[text]
+    if "/" in text:
+        numerator, denominator = text.split("/")
+        return float(numerator) / float(denominator)
+    return float(text)
+
+
+def scale_portion(portion: str, factor: float) -> str:
+    """Scales the weight in a portion ("150g (1 fillet)" -> "180g (1 fillet)"); ValueError if it has none."""
+    match = _EXPLICIT_WEIGHT.search(portion.lower())
+    if match is None:
+        raise ValueError(f"portion has no weight to scale: {portion!r}")
+    amount = float(match.group(1)) * factor
+    # Kitchen precision: whole grams/ml, one decimal for kg/l/oz
+    scaled = f"{amount:.1f}".rstrip("0").rstrip(".") if amount < 10 else str(round(amount))
+    return portion[:match.start(1)] + scaled + portion[match.end(1):]
+
+
+class FoodTable:
+    """
+    Food-composition table held as one ``(n, 4)`` float array of
+    kcal/protein/carbs/fats per gram, plus grams per piece for foods that are
+    counted ("2 eggs", "1 slice") and grams per ml for foods measured by volume,
+    with an exact, normalized and fuzzy name index.
+    """
+
+    def __init__(
+        self, names: Sequence[str], nutrients: np.ndarray, piece_grams: np.ndarray, aliases: Dict[str, int],
+        ml_grams: Optional[np.ndarray] = None,
+    ):
+        self.names = list(names)
+        self.nutrients = nutrients
+        self.piece_grams = piece_grams
+        self.ml_grams = np.full(len(self.names), np.nan) if ml_grams is None else ml_grams
+        self.exact = {name.lower(): row for name, row in aliases.items()}
+        self.normalized = {normalize_food_name(name): row for name, row in aliases.items()}
+        self._normalized_keys = list(self.normalized)
+        self._rows: Dict[str, Tuple[int, str]] = {}
+        self._resolved: Dict[Tuple[str, str], Tuple[int, float, str]] = {}
+        self.stats = {"exact": 0, "normalized": 0, "fuzzy": 0, "unknown": 0}
+
+    @classmethod
+    def from_csv(cls, path: str = FOOD_TABLE_PATH) -> "FoodTable":
+        names, values, pieces, densities, aliases = [], [], [], [], {}
+        with open(path, newline="", encoding="utf-8") as f:
+            for row, record in enumerate(csv.DictReader(f)):
+                names.append(record["name"])
+                values.append([float(record[column]) for column in ("kcal", "protein", "carbs", "fats")])
+                pieces.append(float(record["piece_g"]) if record["piece_g"] else np.nan)
+                densities.append(float(record["ml_g"]) if record.get("ml_g") else np.nan)
+                for alias in [record["name"], *filter(None, record["aliases"].split("|"))]:
+                    aliases.setdefault(alias, row)
+        # Stored per 100 g, used per gram
+        nutrients = np.asarray(values, dtype=np.float64) / 100.0
+        return cls(
+            names, nutrients, np.asarray(pieces, dtype=np.float64), aliases, np.asarray(densities, dtype=np.float64)
+        )
+
+    def lookup(self, name: str) -> Tuple[int, str]:
+        """
+        Table row for a food name, or -1, and how it matched: "exact",
+        "normalized", "fuzzy" or "unknown". Results are memoized per raw name.
+        """
+        match = self._rows.get(name)
+        if match is None:
+            if len(self._rows) >= FOOD_RESOLVE_CACHE_SIZE:
+                self._rows.clear()
+            match = self._lookup(name)
+            self._rows[name] = match
+        return match
+
+    def _lookup(self, name: str) -> Tuple[int, str]:
+        lowered = name.strip().lower()
+        if lowered in self.exact:
+            self.stats["exact"] += 1
+            return self.exact[lowered], "exact"
+        key = normalize_food_name(name)
+        if key in self.normalized:
+            self.stats["normalized"] += 1
+            return self.normalized[key], "normalized"
+        if key:
+            close = difflib.get_close_matches(key, self._normalized_keys, n=1, cutoff=FOOD_FUZZY_CUTOFF)
+            if close:
+                self.stats["fuzzy"] += 1
+                return self.normalized[close[0]], "fuzzy"
+        self.stats["unknown"] += 1
+        return -1, "unknown"
+
+    def portion_grams(self, row: int, portion: str) -> float:
+        """Grams in a free-text portion ("150g", "1 cup (240 ml)", "2 slices"); NaN if unknown."""
+        text = portion.lower()
+        # A weight anywhere wins over a volume: "1 cup (30g)"
+        volume = None
+        for match in _EXPLICIT_WEIGHT.finditer(text):
+            amount, unit = float(match.group(1)), match.group(2)
+            grams = _UNIT_GRAMS.get(singular(unit), _UNIT_GRAMS.get(unit))
+            if grams is not None:
+                return amount * grams
+            if volume is None:
+                volume = amount * _UNIT_ML.get(singular(unit), _UNIT_ML.get(unit, np.nan))
+        if volume is not None:
+            return volume * self.ml_grams[row] if row >= 0 else np.nan
+        match = _COUNT.search(text)
+        if not match:
+            return np.nan
+        count, unit = _quantity(match.group(1).replace(" ", "")), singular(match.group(2))
+        if unit in _UNIT_GRAMS:
+            return count * _UNIT_GRAMS[unit]
+        if row < 0:
+            return np.nan
+        if unit in _UNIT_ML:
+            return count * _UNIT_ML[unit] * self.ml_grams[row]
+        if unit in _PIECE_SCALE:
+            return count * _PIECE_SCALE[unit] * self.piece_grams[row]
+        return np.nan
+
+    def resolve(self, name: str, portion: str) -> Tuple[int, float, str]:
+        """Row, grams and match kind of one food."""
+        key = (name, portion)
+        resolved = self._resolved.get(key)
+        if resolved is None:
+            if len(self._resolved) >= FOOD_RESOLVE_CACHE_SIZE:
+                self._resolved.clear()
+            row, kind = self.lookup(name)
+            resolved = (row, self.portion_grams(row, portion) if row >= 0 else np.nan, kind)
+            self._resolved[key] = resolved
+        return resolved
+
+    def meal_nutrients(self, plans: Sequence[dict], trusted_only: bool = False) -> np.ndarray:
+        """
+        Computes calories/protein/carbs/fats for every meal of every plan in
+        one vectorized pass. Returns a ``(len(plans), 5, 4)`` array in
+        ``MEAL_SLOTS`` x ``NUTRIENTS`` order; meals with any food that cannot
+        be resolved are NaN, as are meals with a fuzzy match if ``trusted_only``.
+        """
+        rows: List[int] = []
+        grams: List[float] = []
+        meals: List[int] = []
+        resolve = self.resolve
+        meal = 0
+        for plan in plans:
+            for slot in MEAL_SLOTS:
+                for food in plan[slot]["foods"]:
+                    row, weight, kind = resolve(food["name"], food["portion"])
+                    rows.append(row)
+                    grams.append(weight if not trusted_only or kind in TRUSTED_MATCHES else np.nan)
+                    meals.append(meal)
+                meal += 1
+
+        rows = np.asarray(rows, dtype=np.intp)
+        grams = np.asarray(grams, dtype=np.float64)
+        meals = np.asarray(meals, dtype=np.intp)
+        # NaN grams (unknown food or portion) poison their meal's sums
+        contributions = self.nutrients[np.maximum(rows, 0)] * grams[:, None]
+        totals = np.empty((meal, len(NUTRIENTS)), dtype=np.float64)
+        for column in range(len(NUTRIENTS)):
+            totals[:, column] = np.bincount(meals, weights=contributions[:, column], minlength=meal)
+        empty = np.bincount(meals, minlength=meal) == 0
+        totals[empty] = np.nan
+        return totals.reshape(len(plans), len(MEAL_SLOTS), len(NUTRIENTS))
+
+    def recompute(self, plans: Sequence[dict]) -> List[List[str]]:
+        """
+        Overwrites the numbers of every meal whose foods all have a trusted
+        match with the table's values, in place, and recomputes
+        ``total_calories``. Returns the slots changed in each plan.
+        """
+        totals = np.rint(self.meal_nutrients(plans, trusted_only=True))
+        changed = []
+        for plan, meals in zip(plans, totals):
+            slots = []
+            for slot, values in zip(MEAL_SLOTS, meals):
+                if np.isnan(values[0]):
+                    continue
+                meal = plan[slot]
+                computed = dict(zip(NUTRIENTS, values.astype(int).tolist()))
+                if any(meal[nutrient] != computed[nutrient] for nutrient in NUTRIENTS):
+                    meal.update(computed)
+                    slots.append(slot)
+            if slots:
+                plan["total_calories"] = sum(plan[slot]["calories"] for slot in MEAL_SLOTS)
+            changed.append(slots)
+        return changed
+
+
+food_table = FoodTable.from_csv()
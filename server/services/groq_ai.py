@@ -2,16 +2,28 @@ import os
 from dotenv import load_dotenv
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.outputs import Generation
 # from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_groq import ChatGroq
-from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
-from ..schemas import DailyPlan
+from pydantic import BaseModel, Field, ValidationError
+from typing import AsyncIterator, List, Dict, Optional, Union, get_args, get_origin
+from ..schemas import DailyPlan, MealPlanPatch
+from .plan_patch import apply_meal_plan_patch
+from .nutrition import NutritionTargets, compute_targets, targets_from_user_data, weight_goal, fix_arithmetic, target_issues, nutrition_stats
+from .plan_synth import plan_synthesizer
+from .dietary_constraints import DietaryConstraintViolation, constraint_stats, describe_violations, plan_violations
+from .llm_dispatch import dispatch, dispatch_stream
+from .rate_limiter import estimate_tokens, limits_from_env, rate_limiter
+from .metrics import stage
+from .json_repair import parse_repaired, strip_reasoning
 import json
+import logging
 
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Initialize all LLM models
 # google_llm = ChatGoogleGenerativeAI(
 #     model="gemini-1.5-pro",
@@ -21,43 +33,148 @@ load_dotenv()
 #     max_retries=2,
 # )
 
-llama70_llm = ChatGroq(
-    model="llama-3.3-70b-versatile", # 6000 token
-    temperature=0.2,
-    max_tokens=4096,
-    timeout=60,
-    max_retries=2,
-)
-gemma2_llm = ChatGroq(
-    model="gemma2-9b-it",# 15000 token
-    temperature=0.2,
-    max_tokens=4096,
-    timeout=60,
-    max_retries=2,
-)
-llamaSpecdec_llm = ChatGroq(
-    model="llama-3.3-70b-specdec",# 15000 token
-    temperature=0.2,
-    max_tokens=4096,
-    timeout=60,
-    max_retries=2,
-)
-llamaVision_llm = ChatGroq(
-    model="llama-3.2-90b-vision-preview", # 7000 token
-    temperature=0.2,
-    max_tokens=4096,
-    timeout=60,
-    max_retries=2,
-)
-deepseek_llm = ChatGroq(
-    model="deepseek-r1-distill-qwen-32b", # 6000 token
-    temperature=0.2,
-    max_tokens=4096,
-    timeout=60,
-    max_retries=2,
-)
+# "fake" replays recorded responses through services/fake_llm.py instead of
+# calling Groq, for load tests and local runs without an API key
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq")
+
+if LLM_PROVIDER == "fake":
+    from .fake_llm import fake_model
+
+    llm_models = [
+        (name, fake_model(name))
+        for name in ("llama70_llm", "gemma2_llm", "llamaSpecdec_llm", "llamaVision_llm", "deepseek_llm")
+    ]
+else:
+    llama70_llm = ChatGroq(
+        model="llama-3.3-70b-versatile", # 6000 token
+        temperature=0.2,
+        max_tokens=4096,
+        timeout=60,
+        max_retries=2,
+    )
+    gemma2_llm = ChatGroq(
+        model="gemma2-9b-it",# 15000 token
+        temperature=0.2,
+        max_tokens=4096,
+        timeout=60,
+        max_retries=2,
+    )
+    llamaSpecdec_llm = ChatGroq(
+        model="llama-3.3-70b-specdec",# 15000 token
+        temperature=0.2,
+        max_tokens=4096,
+        timeout=60,
+        max_retries=2,
+    )
+    llamaVision_llm = ChatGroq(
+        model="llama-3.2-90b-vision-preview", # 7000 token
+        temperature=0.2,
+        max_tokens=4096,
+        timeout=60,
+        max_retries=2,
+    )
+    deepseek_llm = ChatGroq(
+        model="deepseek-r1-distill-qwen-32b", # 6000 token
+        temperature=0.2,
+        max_tokens=4096,
+        timeout=60,
+        max_retries=2,
+    )
+
+    # List of LLMs to try in order of preference (shared by both generators)
+    llm_models = [
+        ("llama70_llm", llama70_llm),
+        ("gemma2_llm", gemma2_llm),
+        ("llamaSpecdec_llm", llamaSpecdec_llm),
+        ("llamaVision_llm", llamaVision_llm),
+        ("deepseek_llm", deepseek_llm),
+        # ("google_llm", google_llm)
+    ]
+
+# Groq per-minute quotas for each model: (tokens, requests).
+# Override with GROQ_RATE_LIMITS="llama70_llm=6000/30,gemma2_llm=15000/30".
+model_limits = {
+    "llama70_llm": (6000, 30),
+    "gemma2_llm": (15000, 30),
+    "llamaSpecdec_llm": (15000, 30),
+    "llamaVision_llm": (7000, 15),
+    "deepseek_llm": (6000, 30),
+}
+model_limits.update(limits_from_env(os.getenv("GROQ_RATE_LIMITS", "")))
+for model_name, (tokens_per_minute, requests_per_minute) in model_limits.items():
+    rate_limiter.set_limits(model_name, tokens_per_minute, requests_per_minute)
+
+class RepairingJsonOutputParser(JsonOutputParser):
+    """
+    Parses the final output into a dict that validates against
+    ``pydantic_object``, repairing near-misses (trailing commas, truncation,
+    ``<think>`` preambles, fences, numbers as strings) locally. Only output
+    beyond repair raises, which sends the request on to the next model.
+    The final parse is timed as the request's parse stage; streams re-parse
+    the growing text at every chunk, and those partial parses are not.
+    """
+
+    def parse_result(self, result, *, partial: bool = False):
+        if partial:
+            text = result[0].text
+            if "<think" in text.lower():
+                # Nothing to show while the model is still reasoning
+                text = strip_reasoning(text)
+                if text is None:
+                    return None
+                result = [Generation(text=text)]
+            return super().parse_result(result, partial=True)
+        with stage("parse"):
+            plan, fixes = parse_repaired(result[0].text.strip(), self.pydantic_object)
+        if fixes:
+            logger.info("Repaired model output: %s", ", ".join(fixes))
+        return plan
+
+
+parser = RepairingJsonOutputParser(pydantic_object=DailyPlan)
+
+# "full" embeds LangChain's JSON-schema dump of DailyPlan; "compact" sends a
+# terse type sketch of the same structure for a fraction of the prompt tokens
+SCHEMA_INSTRUCTIONS = os.getenv("SCHEMA_INSTRUCTIONS", "full")
 
-parser = JsonOutputParser(pydantic_object=DailyPlan)
+
+def _compact_type(annotation, models: dict) -> str:
+    origin = get_origin(annotation)
+    if origin in (list, List):
+        return f"[{_compact_type(get_args(annotation)[0], models)}]"
+    if origin is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        return f"{_compact_type(args[0], models)}|null"
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        models.setdefault(annotation.__name__, annotation)
+        return annotation.__name__
+    return {int: "int", float: "number", str: "str", bool: "bool"}.get(annotation, "any")
+
+
+def compact_format_instructions(model) -> str:
+    """One line per model, e.g. ``Meal = {"name": str, "foods": [FoodItem], ...}``."""
+    models = {model.__name__: model}
+    lines = []
+    # Nested models are appended to ``models`` while it is being walked
+    index = 0
+    while index < len(models):
+        name, current = list(models.items())[index]
+        fields = ", ".join(
+            f'"{field}": {_compact_type(info.annotation, models)}'
+            for field, info in current.model_fields.items()
+        )
+        lines.append(f"{name} = {{{fields}}}")
+        index += 1
+    return (
+        f"Return only one JSON object shaped like {model.__name__} below, with no markdown fences "
+        "or commentary. All fields are required; |null fields may be null.\n" + "\n".join(lines)
+    )
+
+
+if SCHEMA_INSTRUCTIONS == "compact":
+    format_instructions = compact_format_instructions(DailyPlan)
+else:
+    format_instructions = parser.get_format_instructions()
 
 prompt = PromptTemplate(
     template="""You are a professional nutritionist AI assistant. Based on the user details below, generate a daily meal plan that is balanced, nutritious, and tailored to their specific needs.
@@ -67,18 +184,136 @@ prompt = PromptTemplate(
 {query}
 
 Remember to:
-1. Calculate BMR and TDEE based on the provided information
-2. Adjust calories appropriately for the user's weight goals
-3. Balance macronutrients properly for the user's activity level
+1. Use the pre-calculated Nutrition Targets when given instead of recalculating BMR and TDEE
+2. Make total_calories exactly the sum of the meal calories
+3. Keep the day's macronutrients within the target ranges
 4. Provide realistic portion sizes in grams
 5. Make meals practical and easy to prepare
 """,
     input_variables=["query"],
-    partial_variables={"format_instructions": parser.get_format_instructions()},
+    partial_variables={"format_instructions": format_instructions},
 )
 
-async def meal_plan_generator(
+# Prompt template for updating meal plans
+update_prompt = PromptTemplate(
+    template="""You are a professional nutritionist AI assistant. A user already has a meal plan and wants to make changes to it based on their prompt. Update the existing meal plan according to their request while considering their personal data.
+
+{format_instructions}
+
+### User Data
+- Current Weight: {weight}
+- Target Weight: {target_weight} (Goal: {weight_goal})
+- Height: {height}
+- Gender: {gender}
+- Daily Physical Activity Level: {daily_physical_activity}
+{dietary_preferences_str}
+{allergies_str}
+{nutrition_targets}
+### Previous Meal Plan
+```json
+{previous_meal_plan}
+```
+
+### User Update Request
+{user_prompt}
+
+### Update Instructions:
+1. Analyze the user prompt and make only the requested changes to the meal plan.
+2. IMPORTANT: Consider the user's personal data when making changes, especially:
+   - Their dietary preferences (must be strictly followed)
+   - Their allergies (must be strictly avoided)
+   - Their weight goals (adjust calories appropriately)
+   - Their activity level (ensure adequate nutrition)
+3. If the user asks for "veg only" or "vegetarian only", ensure EVERY meal contains ONLY vegetarian foods while maintaining appropriate calorie and nutrient levels.
+4. If the user asks for "non-veg only", ensure EVERY meal includes non-vegetarian protein sources while maintaining appropriate calorie and nutrient levels.
+5. If adding new foods, each must have name, portion size, and emoji.
+6. Maintain the exact JSON structure - do not add/remove keys from objects.
+7. For array elements like 'foods', you may add or remove items while keeping the structure.
+8. If the user prompt is not meaningful or clear, return the previous meal plan unchanged.
+9. Ensure all calories and macronutrient numbers remain realistic for the user's profile.
+10. Update the notes field if appropriate based on the changes made.
+11. Make sure the total calorie count and macronutrient distribution aligns with the user's physical requirements.
+""",
+    input_variables=["previous_meal_plan", "user_prompt", "weight", "target_weight", 
+                    "weight_goal", "height", "gender", "daily_physical_activity", 
+                    "dietary_preferences_str", "allergies_str", "nutrition_targets"],
+    partial_variables={"format_instructions": format_instructions},
+)
+
+patch_parser = RepairingJsonOutputParser(pydantic_object=MealPlanPatch)
+
+if SCHEMA_INSTRUCTIONS == "compact":
+    patch_format_instructions = compact_format_instructions(MealPlanPatch)
+else:
+    patch_format_instructions = patch_parser.get_format_instructions()
+
+# Prompt template for patch-style updates: the model returns only what changes
+patch_prompt = PromptTemplate(
+    template="""You are a professional nutritionist AI assistant. A user already has a meal plan and wants to change part of it. Reply with a patch that contains ONLY the parts of the plan that change.
+
+{format_instructions}
+
+### User Data
+- Current Weight: {weight}
+- Target Weight: {target_weight} (Goal: {weight_goal})
+- Height: {height}
+- Gender: {gender}
+- Daily Physical Activity Level: {daily_physical_activity}
+{dietary_preferences_str}
+{allergies_str}
+{nutrition_targets}
+### Current Meal Plan
+```json
+{previous_meal_plan}
+```
+
+### User Update Request
+{user_prompt}
+
+### Patch Instructions:
+1. Include a meal (breakfast, morning_snack, lunch, afternoon_snack, dinner) only if the request changes it, and then give the complete replacement meal with all its foods, calories and macronutrients.
+2. Leave every unchanged meal out. Never repeat a meal that stays the same.
+3. Replacement meals must strictly follow the user's dietary preferences and avoid all of their allergies.
+4. Keep each replacement meal's calories close to the meal it replaces unless the request asks otherwise.
+5. Include hydration or notes only if they should change.
+6. Do not include total_calories; it is recalculated from the meals.
+7. If the user prompt is not meaningful or clear, return an empty object {{}}.
+""",
+    input_variables=update_prompt.input_variables,
+    partial_variables={"format_instructions": patch_format_instructions},
+)
+
+# Fixed part of each prompt, in tokens, so per-call cost estimates only measure the inputs
+PROMPT_OVERHEAD = estimate_tokens(prompt.format(query=""))
+UPDATE_PROMPT_OVERHEAD = estimate_tokens(update_prompt.format(**{name: "" for name in update_prompt.input_variables}))
+PATCH_PROMPT_OVERHEAD = estimate_tokens(patch_prompt.format(**{name: "" for name in patch_prompt.input_variables}))
+
+# prompt | model | parser runnables, built once per (prompt, model)
+_chains = {}
+
+
+_templates = {
+    "generate": (prompt, parser),
+    "update": (update_prompt, parser),
+    "patch": (patch_prompt, patch_parser),
+}
+
+
+def chain_for(prompt_name: str, model_name: str, model):
+    cached = _chains.get((prompt_name, model_name))
+    # The model list can be swapped at runtime (benchmarks, tests), so check identity too
+    if cached is None or cached[0] is not model:
+        template, output_parser = _templates[prompt_name]
+        cached = (model, template | model | output_parser)
+        _chains[(prompt_name, model_name)] = cached
+    return cached[1]
+
+
+def update_cost(inputs: dict, overhead: int = UPDATE_PROMPT_OVERHEAD) -> int:
+    return overhead + sum(estimate_tokens(str(value)) for value in inputs.values())
 
+
+def build_meal_plan_query(
     age: float,
     weight: float,
     target_weight: float,
@@ -86,22 +321,19 @@ async def meal_plan_generator(
     gender: str,
     daily_physical_activity: str,
     dietary_preferences: Optional[List[str]] = None,
-    allergies: Optional[List[str]] = None
-):
-    # Calculate weight difference to determine goal
-    weight_difference = target_weight - weight
-    weight_goal = "maintenance"
-    if weight_difference < -1:
-        weight_goal = "weight loss"
-    elif weight_difference > 1:
-        weight_goal = "weight gain"
-    
+    allergies: Optional[List[str]] = None,
+    targets: Optional[NutritionTargets] = None,
+    variety: Optional[str] = None
+) -> str:
+    if targets is None:
+        targets = compute_targets(age, weight, target_weight, height, gender, daily_physical_activity)
+
     # Build the query
     query = f"""
 ### User Details
 - Age: {age} years
 - Current Weight: {weight} kg
-- Target Weight: {target_weight} kg (Goal: {weight_goal})
+- Target Weight: {target_weight} kg (Goal: {weight_goal(weight, target_weight)})
 - Height: {height} cm
 - Gender: {gender}
 - Daily Physical Activity Level: {daily_physical_activity}
@@ -113,6 +345,12 @@ async def meal_plan_generator(
     if allergies:
         query += f"- Food Allergies: {', '.join(allergies)}\n"
 
+    if targets is not None:
+        query += targets.prompt_section()
+
+    if variety:
+        query += variety
+
     query += f"""
 ### Requirements
     **important**
@@ -122,65 +360,176 @@ async def meal_plan_generator(
         
     - For each meal and snack, include specific foods with portion sizes in grams.
     - Include calorie and macronutrient breakdown for each meal
-    - Calculate appropriate daily caloric intake based on user's stats and goals:
+"""
+    if targets is not None:
+        query += """    - Size the portions so the day lands on the Nutrition Targets above
+"""
+    else:
+        query += """    - Calculate appropriate daily caloric intake based on user's stats and goals:
     - For weight loss: 300-500 calorie deficit
     - For weight gain: 300-500 calorie surplus
     - For maintenance: balanced calories
     - Ensure adequate protein (1.6-2.2g per kg of body weight for active individuals)
-    - Focus on whole, unprocessed foods with appropriate variety
+"""
+    query += f"""    - Focus on whole, unprocessed foods with appropriate variety
     - Include daily hydration recommendations
     - Include a short Personalized user-specific note at the end of the meal plan.
 """
+    return query
 
-    # Define a list of LLMs to try in order of preference
-    llm_models = [
-        ("llama70_llm", llama70_llm),
-        ("gemma2_llm", gemma2_llm),
-        ("llamaSpecdec_llm", llamaSpecdec_llm),
-        ("llamaVision_llm", llamaVision_llm),
-        ("deepseek_llm", deepseek_llm),
-        # ("google_llm", google_llm)
-    ]
-    
-    last_exception = None
-    
-    # Try each LLM in sequence until one succeeds
-    for model_name, model in llm_models:
-        try:
-            print(f"Trying {model_name}...")
-            chain = prompt | model | parser
-            result = chain.invoke({"query": query})
-            print(f"Successfully generated meal plan using {model_name}")
-            return result
-        except Exception as e:
-            print(f"Error with {model_name}: {e}")
-            last_exception = e
-            continue
-    
-    # If all models fail, raise the last exception
-    if last_exception:
-        print("All LLM models failed")
-        raise last_exception
-    
-    return None
 
+async def meal_plan_generator(
 
-async def updated_meal_plan_generator(
-    user_prompt: str,
-    previous_meal_plan: DailyPlan,
-    user_data: dict
+    age: float,
+    weight: float,
+    target_weight: float,
+    height: float,
+    gender: str,
+    daily_physical_activity: str,
+    dietary_preferences: Optional[List[str]] = None,
+    allergies: Optional[List[str]] = None,
+    dispatch_policy: Optional[str] = None,
+    variety: Optional[str] = None,
+    synthesize: bool = True
 ):
     """
-    Updates a previous meal plan based on user's prompt and personal data.
-    
-    Args:
-        user_prompt (str): The user's request for changes to the meal plan
-        previous_meal_plan (DailyPlan): The existing meal plan to modify
-        user_data (dict): Dictionary containing user's health and dietary information
-        
-    Returns:
-        DailyPlan: Updated meal plan based on user's prompt and data
+    ``variety`` is an extra prompt section (see ``weekly_plan.variety_section``);
+    ``synthesize=False`` skips the meal library, for callers that tried it already.
+    """
+    targets = compute_targets(age, weight, target_weight, height, gender, daily_physical_activity)
+
+    # Common profiles are served from the meal library without an LLM call
+    if synthesize:
+        synthesized = plan_synthesizer.synthesize(targets, weight, dietary_preferences, allergies)
+        if synthesized is not None and plan_synthesizer.mode == "first":
+            logger.info("Served meal plan from the meal library")
+            return synthesized
+
+    with stage("prompt_build"):
+        query = build_meal_plan_query(
+            age, weight, target_weight, height, gender,
+            daily_physical_activity, dietary_preferences, allergies, targets, variety
+        )
+
+    async def run(model_name, model, config):
+        chain = chain_for("generate", model_name, model)
+        return await chain.ainvoke({"query": query}, config=config)
+
+    cost = PROMPT_OVERHEAD + estimate_tokens(query)
+
+    # Walk the fallback list using the configured dispatch policy
+    result = await dispatch(llm_models, run, policy=dispatch_policy, cost=cost)
+
+    user_data = {
+        "age": age,
+        "weight": weight,
+        "targetWeight": target_weight,
+        "height": height,
+        "gender": gender,
+        "daily_physical_activity": daily_physical_activity,
+        "dietary_preferences": dietary_preferences or [],
+        "allergies": allergies or [],
+    }
+    result = await checked_meal_plan(result, targets, user_data, dispatch_policy)
+    result = await safe_meal_plan(result, user_data, dispatch_policy)
+    if result is not None:
+        plan_synthesizer.library.add_plan(result)
+    return result
+
+
+async def safe_meal_plan(plan, user_data: dict, dispatch_policy: Optional[str] = None):
+    """
+    Scans every food in the plan against the user's diet and allergies.
+    Offending foods get one patch call to swap them out; a plan that still
+    violates raises ``DietaryConstraintViolation`` so it is never returned
+    or stored.
     """
+    if not isinstance(plan, dict):
+        return plan
+    try:
+        plan = DailyPlan.model_validate(plan).model_dump()
+    except ValidationError:
+        return plan
+
+    dietary_preferences = user_data.get("dietary_preferences")
+    allergies = user_data.get("allergies")
+    constraint_stats["checked"] += 1
+    violations = plan_violations(plan, dietary_preferences, allergies)
+    if not violations:
+        return plan
+
+    constraint_stats["violating"] += 1
+    logger.warning("Meal plan breaks dietary constraints, repairing: %s", describe_violations(violations))
+    repair_prompt = (
+        "Replace these foods, which break the user's dietary preferences or allergies, with compliant "
+        "foods of similar calories and macronutrients: " + describe_violations(violations) + "."
+    )
+    try:
+        with stage("prompt_build"):
+            inputs = build_update_request(repair_prompt, DailyPlan.model_validate(plan), user_data)
+        repaired = await _patch_meal_plan(inputs, plan, dispatch_policy)
+    except Exception as e:
+        logger.warning("Meal plan constraint repair failed: %s", e)
+        repaired = plan
+
+    remaining = plan_violations(repaired, dietary_preferences, allergies)
+    if remaining:
+        constraint_stats["rejected"] += 1
+        raise DietaryConstraintViolation(remaining)
+    constraint_stats["repaired"] += 1
+    fix_arithmetic(repaired)
+    return repaired
+
+
+async def checked_meal_plan(plan, targets: Optional[NutritionTargets], user_data: dict, dispatch_policy: Optional[str] = None):
+    """
+    Validates a generated plan against the local nutrition targets.
+
+    Arithmetic slips (meal calories vs. macros, total vs. meal sum) are fixed
+    in place. If the day still misses the calorie or macro targets, one patch
+    call asks the model to resize only the offending meals, which is far
+    cheaper than regenerating the plan. Failures of the repair keep the
+    locally fixed plan rather than failing the request.
+    """
+    if plan is None or targets is None:
+        return plan
+    try:
+        plan = DailyPlan.model_validate(plan).model_dump()
+    except ValidationError:
+        return plan
+
+    nutrition_stats.validated += 1
+    fixes = fix_arithmetic(plan)
+    if fixes:
+        nutrition_stats.arithmetic_fixes += 1
+        logger.info("Fixed meal plan arithmetic: %s", "; ".join(fixes))
+
+    issues = target_issues(plan, targets)
+    if not issues:
+        return plan
+
+    nutrition_stats.repairs_attempted += 1
+    repair_prompt = (
+        "Resize portions (swap foods only if needed) in as few meals as possible so the day meets "
+        "the Nutrition Targets: " + "; ".join(issues) + "."
+    )
+    try:
+        with stage("prompt_build"):
+            inputs = build_update_request(repair_prompt, DailyPlan.model_validate(plan), user_data)
+        repaired = await _patch_meal_plan(inputs, plan, dispatch_policy)
+    except Exception as e:
+        logger.warning("Meal plan repair failed: %s", e)
+        return plan
+
+    fix_arithmetic(repaired)
+    remaining = target_issues(repaired, targets)
+    if not remaining:
+        nutrition_stats.repairs_succeeded += 1
+    return repaired if len(remaining) <= len(issues) else plan
+
+
+def build_update_request(user_prompt: str, previous_meal_plan: DailyPlan, user_data: dict):
+    """Returns the inputs to format ``update_prompt`` with."""
     # Extract user data with safety checks
     weight = user_data.get("weight")
     target_weight = user_data.get("targetWeight", user_data.get("target_weight"))  # Try both key formats
@@ -190,19 +539,9 @@ async def updated_meal_plan_generator(
     dietary_preferences = user_data.get("dietary_preferences", [])
     allergies = user_data.get("allergies", [])
     
-    # Calculate weight goal with safety checks
-    weight_goal = "maintenance"
-    if weight is not None and target_weight is not None:
-        try:
-            weight_difference = float(target_weight) - float(weight)
-            if weight_difference < -1:
-                weight_goal = "weight loss"
-            elif weight_difference > 1:
-                weight_goal = "weight gain"
-        except (TypeError, ValueError):
-            # If conversion fails, default to maintenance
-            print("Warning: Could not calculate weight difference, defaulting to maintenance")
-    
+    goal = weight_goal(weight, target_weight)
+    targets = targets_from_user_data(user_data)
+
     # Convert empty values to appropriate defaults for the prompt
     weight = weight or "Not specified"
     target_weight = target_weight or "Not specified"
@@ -210,51 +549,6 @@ async def updated_meal_plan_generator(
     gender = gender or "Not specified"
     daily_physical_activity = daily_physical_activity or "Not specified"
     
-    # Define the prompt template for updating meal plans
-    update_prompt = PromptTemplate(
-        template="""You are a professional nutritionist AI assistant. A user already has a meal plan and wants to make changes to it based on their prompt. Update the existing meal plan according to their request while considering their personal data.
-
-{format_instructions}
-
-### User Data
-- Current Weight: {weight}
-- Target Weight: {target_weight} (Goal: {weight_goal})
-- Height: {height}
-- Gender: {gender}
-- Daily Physical Activity Level: {daily_physical_activity}
-{dietary_preferences_str}
-{allergies_str}
-
-### Previous Meal Plan
-```json
-{previous_meal_plan}
-```
-
-### User Update Request
-{user_prompt}
-
-### Update Instructions:
-1. Analyze the user prompt and make only the requested changes to the meal plan.
-2. IMPORTANT: Consider the user's personal data when making changes, especially:
-   - Their dietary preferences (must be strictly followed)
-   - Their allergies (must be strictly avoided)
-   - Their weight goals (adjust calories appropriately)
-   - Their activity level (ensure adequate nutrition)
-3. If the user asks for "veg only" or "vegetarian only", ensure EVERY meal contains ONLY vegetarian foods while maintaining appropriate calorie and nutrient levels.
-4. If the user asks for "non-veg only", ensure EVERY meal includes non-vegetarian protein sources while maintaining appropriate calorie and nutrient levels.
-5. If adding new foods, each must have name, portion size, and emoji.
-6. Maintain the exact JSON structure - do not add/remove keys from objects.
-7. For array elements like 'foods', you may add or remove items while keeping the structure.
-8. If the user prompt is not meaningful or clear, return the previous meal plan unchanged.
-9. Ensure all calories and macronutrient numbers remain realistic for the user's profile.
-10. Update the notes field if appropriate based on the changes made.
-11. Make sure the total calorie count and macronutrient distribution aligns with the user's physical requirements.
-""",
-        input_variables=["previous_meal_plan", "user_prompt", "weight", "target_weight", 
-                        "weight_goal", "height", "gender", "daily_physical_activity", 
-                        "dietary_preferences_str", "allergies_str"],
-        partial_variables={"format_instructions": parser.get_format_instructions()},
-    )
 
     previous_meal_plan_json = previous_meal_plan.model_dump_json()
     
@@ -262,45 +556,146 @@ async def updated_meal_plan_generator(
     dietary_preferences_str = f"- Dietary Preferences: {', '.join(dietary_preferences)}" if dietary_preferences else "- Dietary Preferences: None specified"
     allergies_str = f"- Food Allergies: {', '.join(allergies)}" if allergies else "- Food Allergies: None specified"
     
-    # Define a list of LLMs to try in order of preference
-    llm_models = [
-        ("llama70_llm", llama70_llm),
-        ("gemma2_llm", gemma2_llm),
-        ("llamaSpecdec_llm", llamaSpecdec_llm),
-        ("llamaVision_llm", llamaVision_llm),
-        ("deepseek_llm", deepseek_llm),
-    ]
-    
-    last_exception = None
-    
-    # Try each LLM in sequence until one succeeds
-    for model_name, model in llm_models:
-        try:
-            print(f"Trying {model_name} for meal plan update...")
-            chain = update_prompt | model | parser
-            result = chain.invoke({
-                "previous_meal_plan": previous_meal_plan_json,
-                "user_prompt": user_prompt,
-                "weight": weight,
-                "target_weight": target_weight,
-                "weight_goal": weight_goal,
-                "height": height,
-                "gender": gender,
-                "daily_physical_activity": daily_physical_activity,
-                "dietary_preferences_str": dietary_preferences_str,
-                "allergies_str": allergies_str
-            })
-            print(f"Successfully updated meal plan using {model_name}")
-            return result
-        except Exception as e:
-            print(f"Error with {model_name}: {e}")
-            last_exception = e
-            continue
-    
-    # If all models fail, raise the last exception
-    if last_exception:
-        print("All LLM models failed to update meal plan")
-        raise last_exception
+    inputs = {
+        "previous_meal_plan": previous_meal_plan_json,
+        "user_prompt": user_prompt,
+        "weight": weight,
+        "target_weight": target_weight,
+        "weight_goal": goal,
+        "height": height,
+        "gender": gender,
+        "daily_physical_activity": daily_physical_activity,
+        "dietary_preferences_str": dietary_preferences_str,
+        "allergies_str": allergies_str,
+        "nutrition_targets": targets.prompt_section() if targets else ""
+    }
+    return inputs
+
+
+async def meal_plan_stream(
+    age: float,
+    weight: float,
+    target_weight: float,
+    height: float,
+    gender: str,
+    daily_physical_activity: str,
+    dietary_preferences: Optional[List[str]] = None,
+    allergies: Optional[List[str]] = None
+) -> AsyncIterator[dict]:
+    """Same as ``meal_plan_generator`` but yields the partially parsed plan as it streams."""
+    with stage("prompt_build"):
+        query = build_meal_plan_query(
+            age, weight, target_weight, height, gender,
+            daily_physical_activity, dietary_preferences, allergies
+        )
+
+    async def stream(model_name, model, config):
+        chain = chain_for("generate", model_name, model)
+        async for partial in chain.astream({"query": query}, config=config):
+            yield partial
+
+    cost = PROMPT_OVERHEAD + estimate_tokens(query)
+    async for partial in dispatch_stream(llm_models, stream, cost=cost):
+        yield partial
+
+
+async def updated_meal_plan_generator(
+    user_prompt: str,
+    previous_meal_plan: DailyPlan,
+    user_data: dict,
+    dispatch_policy: Optional[str] = None
+):
+    """
+    Updates a previous meal plan based on user's prompt and personal data.
     
+    Args:
+        user_prompt (str): The user's request for changes to the meal plan
+        previous_meal_plan (DailyPlan): The existing meal plan to modify
+        user_data (dict): Dictionary containing user's health and dietary information
+        dispatch_policy (str): Overrides LLM_DISPATCH_POLICY ("sequential", "hedged" or "race")
+        
+    Returns:
+        DailyPlan: Updated meal plan based on user's prompt and data
+    """
+    with stage("prompt_build"):
+        inputs = build_update_request(user_prompt, previous_meal_plan, user_data)
+
+    async def run(model_name, model, config):
+        chain = chain_for("update", model_name, model)
+        return await chain.ainvoke(inputs, config=config)
+
+    cost = update_cost(inputs)
+
+    result = await dispatch(llm_models, run, policy=dispatch_policy, cost=cost)
+
     # Return original meal plan as fallback
-    return previous_meal_plan
\ No newline at end of file
+    if result is None:
+        return previous_meal_plan
+    try:
+        result = DailyPlan.model_validate(result).model_dump()
+    except ValidationError:
+        return result
+    fix_arithmetic(result)
+    return await safe_meal_plan(result, user_data, dispatch_policy)
+
+
+async def patched_meal_plan_generator(
+    user_prompt: str,
+    previous_meal_plan: DailyPlan,
+    user_data: dict,
+    dispatch_policy: Optional[str] = None
+):
+    """
+    Updates a meal plan by asking the model for a patch instead of the whole plan.
+
+    Args:
+        user_prompt (str): The user's request for changes to the meal plan
+        previous_meal_plan (DailyPlan): The plan the patch is applied to
+        user_data (dict): Dictionary containing user's health and dietary information
+        dispatch_policy (str): Overrides LLM_DISPATCH_POLICY ("sequential", "hedged" or "race")
+
+    Returns:
+        dict: The previous plan with the changed meals swapped in and totals recomputed
+    """
+    with stage("prompt_build"):
+        inputs = build_update_request(user_prompt, previous_meal_plan, user_data)
+    result = await _patch_meal_plan(inputs, previous_meal_plan.model_dump(), dispatch_policy)
+    # The user may have asked to move off the targets, so only the arithmetic is enforced
+    fix_arithmetic(result)
+    # ...but never off their diet or allergies
+    return await safe_meal_plan(result, user_data, dispatch_policy)
+
+
+async def _patch_meal_plan(inputs: dict, previous: dict, dispatch_policy: Optional[str] = None) -> dict:
+    async def run(model_name, model, config):
+        chain = chain_for("patch", model_name, model)
+        patch = await chain.ainvoke(inputs, config=config)
+        # Apply inside the attempt so a malformed patch counts against this model
+        return apply_meal_plan_patch(previous, patch)
+
+    cost = update_cost(inputs, PATCH_PROMPT_OVERHEAD)
+
+    result = await dispatch(llm_models, run, policy=dispatch_policy, cost=cost)
+
+    if result is None:
+        return previous
+    return result
+
+
+async def updated_meal_plan_stream(
+    user_prompt: str,
+    previous_meal_plan: DailyPlan,
+    user_data: dict
+) -> AsyncIterator[dict]:
+    """Same as ``updated_meal_plan_generator`` but yields the partially parsed plan as it streams."""
+    with stage("prompt_build"):
+        inputs = build_update_request(user_prompt, previous_meal_plan, user_data)
+
+    async def stream(model_name, model, config):
+        chain = chain_for("update", model_name, model)
+        async for partial in chain.astream(inputs, config=config):
+            yield partial
+
+    cost = update_cost(inputs)
+    async for partial in dispatch_stream(llm_models, stream, cost=cost):
+        yield partial
@@ -0,0 +1,67 @@
+import asyncio
+import itertools
+import logging
+import os
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Jobs executed at the same time by this worker process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+
+# Lower runs first: a user waiting on an edit beats a fresh generation
+PRIORITY_UPDATE = 0
+PRIORITY_GENERATE = 1
+
+
+class JobQueue:
+    """Bounded pool of asyncio workers pulling job ids off a priority queue."""
+
+    def __init__(self, handler: Callable[[str], Awaitable], workers: int = JOB_WORKERS):
+        self.handler = handler
+        self.workers = workers
+        self.queue: Optional[asyncio.PriorityQueue] = None
+        self.tasks: List[asyncio.Task] = []
+        self.sequence = itertools.count()
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        self.queue = asyncio.PriorityQueue()
+        self.tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def submit(self, job_id: str, priority: int = PRIORITY_GENERATE):
+        if self.queue is None:
+            self.start()
+        # The sequence number keeps FIFO order within a priority
+        self.queue.put_nowait((priority, next(self.sequence), job_id))
+
+    async def _work(self):
+        while True:
+            _, _, job_id = await self.queue.get()
+            self.running += 1
+            try:
+                await self.handler(job_id)
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.exception("Job %s crashed: %s", job_id, e)
+            finally:
+                self.running -= 1
+                self.queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "backlog": 0 if self.queue is None else self.queue.qsize(),
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
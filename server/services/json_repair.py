@@ -0,0 +1,207 @@
+import ast
+import json
+import re
+from typing import List, Optional, Tuple, Type, Union, get_args, get_origin
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.utils.json import parse_partial_json
+from pydantic import BaseModel, ValidationError
+
+from .metrics import Counter, registry
+
+# deepseek-r1 thinks out loud before answering
+REASONING_RE = re.compile(r"<think>.*?</think>", re.DOTALL | re.IGNORECASE)
+FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL | re.IGNORECASE)
+NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+repair_outcomes = registry.register(Counter(
+    "llm_output_repairs_total",
+    "LLM responses that needed repair, by outcome (repaired saves a model call, unrecoverable falls back)",
+    ("outcome",),
+))
+repair_fixes = registry.register(Counter(
+    "llm_output_repair_fixes_total", "Repairs applied to LLM responses, by kind", ("fix",),
+))
+
+
+class RepairStats:
+    def __init__(self):
+        self.parsed = 0
+        self.clean = 0
+        self.repaired = 0
+        self.unrecoverable = 0
+        self.fixes = {}
+
+    def record(self, fixes: List[str], ok: bool):
+        self.parsed += 1
+        if ok and not fixes:
+            self.clean += 1
+            return
+        if ok:
+            self.repaired += 1
+        else:
+            self.unrecoverable += 1
+        repair_outcomes.inc(outcome="repaired" if ok else "unrecoverable")
+        for fix in fixes:
+            self.fixes[fix] = self.fixes.get(fix, 0) + 1
+            repair_fixes.inc(fix=fix)
+
+    def snapshot(self) -> dict:
+        attempted = self.repaired + self.unrecoverable
+        return {
+            **{key: value for key, value in vars(self).items() if key != "fixes"},
+            "fixes": dict(self.fixes),
+            "repair_success_rate": round(self.repaired / attempted, 3) if attempted else None,
+        }
+
+
+repair_stats = RepairStats()
+
+
+def strip_reasoning(text: str) -> Optional[str]:
+    """Drops ``<think>`` blocks; None while one is still open (nothing to parse yet)."""
+    text = REASONING_RE.sub("", text)
+    if re.search(r"<think>", text, re.IGNORECASE):
+        return None
+    return text
+
+
+def drop_trailing_commas(text: str) -> str:
+    """Removes commas right before ``}`` or ``]``, leaving string contents alone."""
+    out = []
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "}]":
+            # Walk back over whitespace to a dangling comma
+            index = len(out) - 1
+            while index >= 0 and out[index].isspace():
+                index -= 1
+            if index >= 0 and out[index] == ",":
+                del out[index]
+        out.append(char)
+    return "".join(out)
+
+
+def extract_json(text: str, fixes: List[str]) -> Union[dict, list, None]:
+    """
+    Best-effort JSON out of a model response, appending the name of each
+    repair it needed to ``fixes``. Returns None if nothing parses.
+    """
+    cleaned = strip_reasoning(text)
+    if cleaned is None:
+        return None
+    if cleaned != text:
+        fixes.append("reasoning")
+    if "```" in cleaned:
+        fixes.append("fences")
+        cleaned = FENCE_RE.search(cleaned).group(1)
+    start = cleaned.find("{")
+    if start < 0:
+        return None
+    if cleaned[:start].strip():
+        fixes.append("prose")
+    candidate = cleaned[start:].strip()
+
+    decoder = json.JSONDecoder()
+    for fix, repaired in ((None, candidate), ("trailing_commas", drop_trailing_commas(candidate))):
+        try:
+            value, end = decoder.raw_decode(repaired)
+        except json.JSONDecodeError:
+            continue
+        if fix:
+            fixes.append(fix)
+        if end < len(repaired):
+            fixes.append("prose")
+        return value
+
+    # Python-literal style: single quotes, True/None
+    try:
+        value = ast.literal_eval(candidate)
+        if isinstance(value, (dict, list)):
+            fixes.append("quotes")
+            return value
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        pass
+
+    # Cut off mid-object: close the open strings, arrays and objects
+    value = parse_partial_json(drop_trailing_commas(candidate))
+    if value is not None:
+        fixes.append("truncated")
+    return value
+
+
+def _allows_none(annotation) -> bool:
+    return get_origin(annotation) is Union and type(None) in get_args(annotation)
+
+
+def coerce(value, annotation, fixes: List[str]):
+    """
+    Fits ``value`` to ``annotation`` where the model was sloppy: numbers sent
+    as strings ("560 kcal"), fractional ints, and missing fields that may be
+    null. Anything else is left for validation to reject.
+    """
+    if get_origin(annotation) is Union:
+        if value is None:
+            return None
+        annotation = next(arg for arg in get_args(annotation) if arg is not type(None))
+    origin = get_origin(annotation)
+    if origin in (list, List) and isinstance(value, list):
+        item = get_args(annotation)[0]
+        return [coerce(entry, item, fixes) for entry in value]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel) and isinstance(value, dict):
+        value = dict(value)
+        for name, field in annotation.model_fields.items():
+            if name in value:
+                value[name] = coerce(value[name], field.annotation, fixes)
+            elif field.is_required() and _allows_none(field.annotation):
+                fixes.append("filled")
+                value[name] = None
+        return value
+    if annotation in (int, float) and isinstance(value, str):
+        match = NUMBER_RE.search(value.replace(",", ""))
+        if match:
+            fixes.append("coerced")
+            number = float(match.group())
+            return round(number) if annotation is int else number
+    if annotation is int and isinstance(value, float) and not value.is_integer():
+        fixes.append("coerced")
+        return round(value)
+    return value
+
+
+def parse_repaired(text: str, model: Type[BaseModel]) -> Tuple[dict, List[str]]:
+    """
+    Parses a model response into a dict that validates against ``model``,
+    repairing what it can: reasoning blocks, markdown fences, surrounding
+    prose, trailing commas, single quotes, truncation, numbers as strings and
+    missing nullable fields. Returns the dict and the repairs it took; raises
+    ``OutputParserException`` when the response is beyond repair.
+    """
+    fixes: List[str] = []
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError:
+        value = extract_json(text, fixes)
+    if value is None:
+        repair_stats.record(fixes, ok=False)
+        raise OutputParserException("No JSON object in the model output", llm_output=text)
+
+    value = coerce(value, model, fixes)
+    # Each repair is counted once per response
+    fixes = list(dict.fromkeys(fixes))
+    try:
+        model.model_validate(value)
+    except ValidationError as e:
+        repair_stats.record(fixes, ok=False)
+        raise OutputParserException(f"Model output does not match {model.__name__}: {e}", llm_output=text)
+    repair_stats.record(fixes, ok=True)
+    return value, fixes
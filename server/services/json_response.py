@@ -0,0 +1,40 @@
+from typing import Any, Optional, Union
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    ``JSONResponse`` encoded by orjson, several times faster than the stdlib
+    on nested plans and long user lists. For routes that build their own
+    response; returning one also skips FastAPI's ``jsonable_encoder`` walk.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+
+def dumps(value: Any) -> bytes:
+    return orjson.dumps(value)
+
+
+def plan_document(email: str, meal_plan: Union[str, bytes], version: Optional[int]) -> bytes:
+    """
+    A ``UserMealPlanSchema`` body. ``meal_plan`` may be the stored JSON text
+    as read from the database: every write validates the plan against
+    ``DailyPlan`` first, so it is spliced in as is instead of being decoded,
+    re-validated and encoded again.
+    """
+    if isinstance(meal_plan, str):
+        meal_plan = meal_plan.encode()
+    return b'{"email":%b,"meal_plan":%b,"version":%b}' % (orjson.dumps(email), meal_plan, orjson.dumps(version))
+
+
+def plan_response(user_meal_plan) -> ORJSONResponse:
+    """A saved ``UserMealPlan`` row as the response body, skipping the generic ORM encoding."""
+    return ORJSONResponse({
+        "email": user_meal_plan.email,
+        "meal_plan": user_meal_plan.meal_plan,
+        "version": user_meal_plan.version,
+    })
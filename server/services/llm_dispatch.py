@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from .model_health import health_registry
+from .metrics import record_llm_attempt
+from .rate_limiter import RateLimitExceeded, TokenUsageCallback, rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# How the fallback list is walked:
+#   sequential - try one model at a time, next one only after a failure
+#   hedged     - also start the next model once the current one has been
+#                running longer than its observed p95 latency
+#   race       - start every model at once, first valid result wins
+DISPATCH_POLICY = os.getenv("LLM_DISPATCH_POLICY", "hedged")
+
+# Hedge delay used until a model has enough latency samples for a p95
+HEDGE_DELAY_DEFAULT = float(os.getenv("LLM_HEDGE_DELAY", "10"))
+HEDGE_DELAY_MIN = float(os.getenv("LLM_HEDGE_DELAY_MIN", "2"))
+HEDGE_MIN_SAMPLES = 5
+
+# Overall budget for one plan generation across every model tried
+REQUEST_DEADLINE = float(os.getenv("LLM_REQUEST_DEADLINE", "90"))
+
+POLICIES = ("sequential", "hedged", "race")
+
+
+def hedge_delay(model_name: str, policy: str) -> Optional[float]:
+    """Seconds to wait on ``model_name`` before also starting the next model."""
+    if policy == "race":
+        return 0
+    if policy == "sequential":
+        return None
+    p95 = health_registry.get(model_name).p95(HEDGE_MIN_SAMPLES)
+    if p95 is None:
+        return HEDGE_DELAY_DEFAULT
+    return max(HEDGE_DELAY_MIN, p95)
+
+
+def _ordered(models):
+    queue = health_registry.ordered(models)
+    if models and not queue:
+        # Every model is half-open with its one trial call already out
+        raise RateLimitExceeded(health_registry.trial_wait([name for name, _ in models]))
+    return queue
+
+
+async def _attempt(model_name, model, run, reservation, trial):
+    logger.info("Trying %s", model_name)
+    usage = TokenUsageCallback()
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        result = await run(model_name, model, {"callbacks": [usage]})
+        outcome = "ok"
+    except asyncio.CancelledError:
+        # Lost a hedge or race, or the deadline passed
+        outcome = "cancelled"
+        raise
+    except Exception as e:
+        health_registry.record_failure(model_name, e)
+        raise
+    finally:
+        if trial:
+            health_registry.end_trial(model_name)
+        rate_limiter.settle(reservation, usage.total_tokens, usage.output_tokens)
+        record_llm_attempt(model_name, time.perf_counter() - start, outcome, usage.input_tokens, usage.output_tokens)
+    health_registry.record_success(model_name, time.perf_counter() - start)
+    logger.info("Generated meal plan with %s", model_name)
+    return result
+
+
+async def _dispatch(models, run, policy, cost):
+    # Healthy, fast models first; open circuits are skipped entirely
+    queue = _ordered(models)
+    running: Dict[asyncio.Task, str] = {}
+    last_exception = None
+    next_launch_at = None
+    # Half-open models another request's trial call got to first
+    busy: List[str] = []
+
+    def launch() -> bool:
+        """Starts the best queued model that has token headroom (rerouting past the rest)."""
+        nonlocal next_launch_at
+        busy.extend(name for name, _ in queue if health_registry.busy(name))
+        queue[:] = [entry for entry in queue if entry[0] not in busy]
+        for index, (model_name, model) in enumerate(queue):
+            reservation = rate_limiter.try_reserve(model_name, cost)
+            if reservation is None:
+                continue
+            queue.pop(index)
+            trial = health_registry.start_call(model_name)
+            task = asyncio.create_task(_attempt(model_name, model, run, reservation, trial))
+            running[task] = model_name
+            delay = hedge_delay(model_name, policy)
+            next_launch_at = None if delay is None else time.monotonic() + delay
+            return True
+        if not queue:
+            next_launch_at = None
+            return False
+        # Nobody has headroom right now, look again once the soonest bucket refills
+        wait = min(rate_limiter.wait_time(name, cost) for name, _ in queue)
+        next_launch_at = None if wait == math.inf else time.monotonic() + wait
+        return False
+
+    async def launch_or_queue():
+        while queue and not launch():
+            await rate_limiter.wait_for_headroom([name for name, _ in queue], cost)
+
+    try:
+        await launch_or_queue()
+        while running:
+            # Race mode starts everything up front
+            while queue and next_launch_at is not None and next_launch_at <= time.monotonic():
+                if not launch():
+                    break
+
+            timeout = None
+            if queue and next_launch_at is not None:
+                timeout = max(0, next_launch_at - time.monotonic())
+            done, _ = await asyncio.wait(
+                running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+
+            failed = False
+            for task in done:
+                model_name = running.pop(task)
+                if task.exception() is None:
+                    return task.result()
+                logger.warning("Error with %s: %s", model_name, task.exception())
+                last_exception = task.exception()
+                failed = True
+
+            # A failure hands over to the next model straight away
+            if failed and queue:
+                if running:
+                    launch()
+                else:
+                    await launch_or_queue()
+    finally:
+        # Cancel the losers (or everything, if the deadline hit)
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+    if last_exception:
+        logger.error("All LLM models failed")
+        raise last_exception
+    if busy:
+        raise RateLimitExceeded(health_registry.trial_wait(busy))
+    return None
+
+
+async def dispatch(
+    models: List[Tuple[str, object]],
+    run: Callable[[str, object, dict], Awaitable],
+    policy: Optional[str] = None,
+    deadline: Optional[float] = None,
+    cost: int = 0,
+):
+    """
+    Runs ``run(model_name, model)`` over the fallback list and returns the first success.
+
+    Args:
+        models (list): ``(model_name, model)`` pairs in order of preference
+        run (callable): Coroutine function ``run(model_name, model, config)`` that calls
+            one model (passing ``config`` to ``ainvoke``) and returns the parsed result
+        policy (str): One of ``POLICIES``; defaults to ``LLM_DISPATCH_POLICY``
+        deadline (float): Overall seconds allowed; defaults to ``LLM_REQUEST_DEADLINE``
+        cost (int): Estimated prompt tokens; each model's budget reserves them plus its expected completion
+
+    Returns:
+        The result of the first model that succeeds. Losing calls are cancelled.
+        Raises the last model error if every model fails, ``RateLimitExceeded``
+        if no model frees up token headroom in time or every model left is
+        half-open with its trial call out, or ``TimeoutError`` once the
+        deadline passes.
+    """
+    policy = policy or DISPATCH_POLICY
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown LLM dispatch policy: {policy}")
+    deadline = REQUEST_DEADLINE if deadline is None else deadline
+    try:
+        return await asyncio.wait_for(_dispatch(models, run, policy, cost), timeout=deadline)
+    except asyncio.TimeoutError:
+        logger.warning("LLM dispatch exceeded the %ss deadline", deadline)
+        raise TimeoutError(f"Meal plan generation exceeded the {deadline}s deadline")
+
+
+async def dispatch_stream(
+    models: List[Tuple[str, object]],
+    stream: Callable[[str, object, dict], AsyncIterator],
+    deadline: Optional[float] = None,
+    cost: int = 0,
+) -> AsyncIterator:
+    """
+    Streaming counterpart of ``dispatch``. Models are tried one at a time in
+    health order; a model that fails before yielding anything hands over to
+    the next one, but once output has reached the caller a failure is raised.
+    """
+    deadline = REQUEST_DEADLINE if deadline is None else deadline
+    expires_at = time.monotonic() + deadline
+    queue = _ordered(models)
+    last_exception = None
+    busy: List[str] = []
+
+    async def within_deadline(awaitable):
+        try:
+            return await asyncio.wait_for(awaitable, timeout=max(0, expires_at - time.monotonic()))
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Meal plan generation exceeded the {deadline}s deadline")
+
+    while queue:
+        busy.extend(name for name, _ in queue if health_registry.busy(name))
+        queue = [entry for entry in queue if entry[0] not in busy]
+        if not queue:
+            break
+        reservation = None
+        for index, (model_name, model) in enumerate(queue):
+            reservation = rate_limiter.try_reserve(model_name, cost)
+            if reservation is not None:
+                queue.pop(index)
+                break
+        if reservation is None:
+            await within_deadline(rate_limiter.wait_for_headroom([name for name, _ in queue], cost))
+            continue
+
+        logger.info("Streaming from %s", model_name)
+        trial = health_registry.start_call(model_name)
+        usage = TokenUsageCallback()
+        start = time.perf_counter()
+        started = False
+        outcome = "cancelled"
+        chunks = stream(model_name, model, {"callbacks": [usage]}).__aiter__()
+        try:
+            while True:
+                # Bounded per chunk, so a model that stalls mid-stream cannot outlive the deadline
+                try:
+                    item = await within_deadline(chunks.__anext__())
+                except StopAsyncIteration:
+                    break
+                started = True
+                yield item
+            outcome = "ok"
+        except TimeoutError:
+            # As in dispatch, running out of time cancels the model rather than counting against it
+            logger.warning("LLM stream exceeded the %ss deadline", deadline)
+            raise
+        except Exception as e:
+            outcome = "error"
+            health_registry.record_failure(model_name, e)
+            logger.warning("Error with %s: %s", model_name, e)
+            if started:
+                raise
+            last_exception = e
+            continue
+        finally:
+            # Closes the model's HTTP stream if the deadline or the caller cut it short
+            aclose = getattr(chunks, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            if trial:
+                health_registry.end_trial(model_name)
+            rate_limiter.settle(reservation, usage.total_tokens, usage.output_tokens)
+            record_llm_attempt(model_name, time.perf_counter() - start, outcome, usage.input_tokens, usage.output_tokens)
+        health_registry.record_success(model_name, time.perf_counter() - start)
+        return
+
+    if last_exception:
+        logger.error("All LLM models failed")
+        raise last_exception
+    if busy:
+        raise RateLimitExceeded(health_registry.trial_wait(busy))
@@ -0,0 +1,305 @@
+import asyncio
+import bisect
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi.routing import APIRoute
+from starlette.datastructures import MutableHeaders
+
+# Requests slower than this are logged at INFO with their stage breakdown, the rest at DEBUG
+REQUEST_LOG_SLOW_MS = float(os.getenv("REQUEST_LOG_SLOW_MS", "1000"))
+
+# Seconds: sub-millisecond statements up to a slow walk down the LLM fallback list
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+request_log = logging.getLogger("server.requests")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        # Statement timings arrive from threadpool threads
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _label_text(self, key: tuple, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()])
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self.values.items())
+        return [f"{self.name}{self._label_text(key)} {_number(value)}" for key, value in values]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # key -> [per-bucket counts (last one is +Inf), sum, count]
+        self.values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self.values.items()]
+        lines = []
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket
+                le = bound if isinstance(bound, str) else _number(bound)
+                lines.append(f"{self.name}_bucket{self._label_text(key, (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._label_text(key)} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Read when scraped: ``read()`` returns ``(labels, value)`` pairs, or a single number."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self.read = read
+
+    def samples(self) -> List[str]:
+        values = self.read()
+        if isinstance(values, (int, float)):
+            values = [({}, values)]
+        return [f"{self.name}{self._label_text(self._key(labels))} {_number(value)}" for labels, value in values]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        # Re-registering (a reloaded module) keeps the first instance's samples
+        return self.metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route template and status", ("method", "route", "status"),
+))
+http_request_seconds = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency, until the last body byte", ("method", "route"),
+))
+stage_seconds = registry.register(Histogram(
+    "stage_duration_seconds",
+    "Time per request stage: prompt_build, llm_attempt, parse, db_read, db_write, serialize",
+    ("stage",),
+))
+llm_attempts = registry.register(Counter(
+    "llm_attempts_total", "LLM calls by model and outcome (ok, error, cancelled)", ("model", "outcome"),
+))
+llm_attempt_seconds = registry.register(Histogram(
+    "llm_attempt_duration_seconds", "Latency of each LLM call", ("model", "outcome"),
+))
+llm_tokens = registry.register(Counter(
+    "llm_tokens_total", "Tokens the models reported, by direction (input, output)", ("model", "direction"),
+))
+
+
+class RequestTrace:
+    """Stage timings of one request, for its log line and Server-Timing header."""
+
+    def __init__(self):
+        self.stages: Dict[str, List[float]] = {}
+        self.llm: List[dict] = []
+        # perf_counter() when the endpoint returned, set by TimedRoute
+        self.endpoint_returned: Optional[float] = None
+
+    def add(self, stage: str, seconds: float):
+        entry = self.stages.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, (seconds, _) in self.stages.items())
+
+    def summary(self) -> dict:
+        return {
+            "stages": {stage: {"ms": round(seconds * 1000, 2), "count": count} for stage, (seconds, count) in self.stages.items()},
+            "llm": self.llm,
+        }
+
+
+_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+def record_stage(name: str, seconds: float):
+    stage_seconds.observe(seconds, stage=name)
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def record_llm_attempt(model: str, seconds: float, outcome: str, input_tokens: Optional[int] = None, output_tokens: Optional[int] = None):
+    llm_attempts.inc(model=model, outcome=outcome)
+    llm_attempt_seconds.observe(seconds, model=model, outcome=outcome)
+    if input_tokens:
+        llm_tokens.inc(input_tokens, model=model, direction="input")
+    if output_tokens:
+        llm_tokens.inc(output_tokens, model=model, direction="output")
+    record_stage("llm_attempt", seconds)
+    trace = _trace.get()
+    if trace is not None:
+        trace.llm.append({
+            "model": model, "ms": round(seconds * 1000, 1), "outcome": outcome,
+            "input_tokens": input_tokens, "output_tokens": output_tokens,
+        })
+
+
+def _mark_return():
+    trace = _trace.get()
+    if trace is not None:
+        trace.endpoint_returned = time.perf_counter()
+
+
+def _marks_return(endpoint):
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def marked(*args, **kwargs):
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                _mark_return()
+    else:
+        @functools.wraps(endpoint)
+        def marked(*args, **kwargs):
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                _mark_return()
+    return marked
+
+
+class TimedRoute(APIRoute):
+    """
+    Route class that notes when the endpoint returns. What follows until the
+    response starts is FastAPI validating and encoding the return value,
+    recorded as the serialize stage. Timing it here rather than in a response
+    class keeps FastAPI's fast path, which skips the response class's
+    ``render`` for routes with a response model.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _marks_return(endpoint), **kwargs)
+
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request, labelled by its route template (not the raw
+    path, which carries emails), collects the stages it went through, adds
+    them as a ``Server-Timing`` header and logs them as one JSON line.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        token = _trace.set(trace)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if trace.endpoint_returned is not None:
+                    record_stage("serialize", time.perf_counter() - trace.endpoint_returned)
+                # Covers what ran before the headers; a streamed body's stages only reach the log
+                if trace.stages:
+                    MutableHeaders(scope=message).append("Server-Timing", trace.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_requests.inc(method=scope["method"], route=route, status=status)
+            http_request_seconds.observe(elapsed, method=scope["method"], route=route)
+            level = logging.INFO if elapsed * 1000 >= REQUEST_LOG_SLOW_MS else logging.DEBUG
+            if request_log.isEnabledFor(level):
+                request_log.log(level, json.dumps({
+                    "method": scope["method"], "route": route, "status": status,
+                    "ms": round(elapsed * 1000, 1), **trace.summary(),
+                }))
+            _trace.reset(token)
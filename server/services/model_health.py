@@ -0,0 +1,220 @@
+import os
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import groq
+
+# Consecutive failures (or error rate over the recent window) that open a circuit
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+CIRCUIT_ERROR_RATE = float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))
+# Seconds an open circuit waits before going half-open and letting traffic
+# through again. Each failure while half-open doubles the wait, up to
+# CIRCUIT_MAX_COOLDOWN.
+CIRCUIT_COOLDOWN = float(os.getenv("CIRCUIT_COOLDOWN", "30"))
+CIRCUIT_MAX_COOLDOWN = float(os.getenv("CIRCUIT_MAX_COOLDOWN", "900"))
+
+EWMA_ALPHA = 0.3
+WINDOW = 20
+# Latency assumed for a model that has not answered yet, so proven models sort first
+UNKNOWN_LATENCY = float(os.getenv("LLM_HEDGE_DELAY", "10"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Groq error codes meaning the model is gone for good rather than having a bad moment
+_FATAL_CODES = ("model_decommissioned", "model_not_found")
+
+
+def _error_code(error: Exception) -> Optional[str]:
+    body = getattr(error, "body", None)
+    if isinstance(body, dict):
+        body = body.get("error", body)
+    return body.get("code") if isinstance(body, dict) else None
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    return isinstance(error, groq.RateLimitError) or getattr(error, "status_code", None) == 429
+
+
+def _is_fatal(error: Exception) -> bool:
+    # Judged by type and error code only: a message that merely mentions "404" is not fatal
+    return isinstance(error, groq.NotFoundError) or _error_code(error) in _FATAL_CODES
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ModelHealth:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.successes = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.consecutive_failures = 0
+        self.latency_ewma: Optional[float] = None
+        self.latencies = deque(maxlen=200)
+        self.outcomes = deque(maxlen=WINDOW)
+        self.cooldown = CIRCUIT_COOLDOWN
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        # A half-open circuit lets a single trial call through; set while it is out
+        self.trial = False
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def p95(self, min_samples: int = 1) -> Optional[float]:
+        if len(self.latencies) < min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def _open(self, cooldown: float, now: float):
+        self.state = OPEN
+        self.opened_at = now
+        self.cooldown = min(cooldown, CIRCUIT_MAX_COOLDOWN)
+
+    def retry_in(self, now: float) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - now)
+
+    def available(self, now: float) -> bool:
+        """
+        Whether a request may be sent now; an expired open circuit becomes
+        half-open, which admits one trial call at a time.
+        """
+        if self.state == OPEN and self.retry_in(now) == 0:
+            self.state = HALF_OPEN
+        return self.state == CLOSED or (self.state == HALF_OPEN and not self.trial)
+
+    @property
+    def trial_out(self) -> bool:
+        return self.state == HALF_OPEN and self.trial
+
+    def record_success(self, latency: float):
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.outcomes.append(True)
+        self.latencies.append(latency)
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency_ewma
+        self.state = CLOSED
+        self.cooldown = CIRCUIT_COOLDOWN
+
+    def record_failure(self, error: Exception, now: float):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.outcomes.append(False)
+        self.last_error = f"{type(error).__name__}: {error}"[:300]
+
+        if _is_rate_limit(error):
+            self.rate_limited += 1
+            # Back off for as long as Groq asked us to
+            self._open(_retry_after(error) or CIRCUIT_COOLDOWN, now)
+        elif _is_fatal(error):
+            self._open(CIRCUIT_MAX_COOLDOWN, now)
+        elif self.state == HALF_OPEN:
+            self._open(self.cooldown * 2, now)
+        elif self.consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD or (
+            len(self.outcomes) >= WINDOW // 4 and self.error_rate >= CIRCUIT_ERROR_RATE
+        ):
+            self._open(CIRCUIT_COOLDOWN, now)
+
+    def snapshot(self, now: float) -> dict:
+        return {
+            "model": self.name,
+            "state": self.state,
+            "successes": self.successes,
+            "failures": self.failures,
+            "rate_limited": self.rate_limited,
+            "error_rate": round(self.error_rate, 3),
+            "latency_ewma": None if self.latency_ewma is None else round(self.latency_ewma, 3),
+            "latency_p95": None if not self.latencies else round(self.p95(), 3),
+            "retry_in": round(self.retry_in(now), 1),
+            "trial": self.trial,
+            "last_error": self.last_error,
+        }
+
+
+class HealthRegistry:
+    """In-process health scoreboard shared by every request in this worker."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.models: Dict[str, ModelHealth] = {}
+
+    def get(self, name: str) -> ModelHealth:
+        if name not in self.models:
+            self.models[name] = ModelHealth(name)
+        return self.models[name]
+
+    def ordered(self, models: List[Tuple[str, object]]) -> List[Tuple[str, object]]:
+        """
+        Reorders the fallback list: healthy models by latency EWMA, then
+        half-open or flaky ones. Models whose circuit is open, or half-open
+        with its trial call already out, are dropped; if that leaves nothing,
+        the open model closest to its retry is kept as a trial so a full
+        outage of the pool does not outlive the outage itself.
+        """
+        now = self.clock()
+        ranked = []
+        for position, (name, model) in enumerate(models):
+            health = self.get(name)
+            if not health.available(now):
+                continue
+            flaky = health.state != CLOSED or health.error_rate >= CIRCUIT_ERROR_RATE / 2
+            latency = health.latency_ewma if health.latency_ewma is not None else UNKNOWN_LATENCY
+            ranked.append(((flaky, latency, position), (name, model)))
+        if not ranked:
+            waiting = [entry for entry in models if not self.get(entry[0]).trial_out]
+            if waiting:
+                return [min(waiting, key=lambda entry: self.get(entry[0]).retry_in(now))]
+        return [entry for _, entry in sorted(ranked, key=lambda item: item[0])]
+
+    def busy(self, name: str) -> bool:
+        """Whether ``name`` is half-open with its one trial call in flight."""
+        return self.get(name).trial_out
+
+    def start_call(self, name: str) -> bool:
+        """Records a call to ``name`` going out; True if it is a half-open circuit's trial."""
+        health = self.get(name)
+        health.available(self.clock())
+        if health.state != HALF_OPEN:
+            return False
+        health.trial = True
+        return True
+
+    def end_trial(self, name: str):
+        self.get(name).trial = False
+
+    def trial_wait(self, names: List[str]) -> float:
+        """Rough seconds until one of the busy trial calls to ``names`` is back."""
+        return min(self.get(name).p95() or UNKNOWN_LATENCY for name in names)
+
+    def record_success(self, name: str, latency: float):
+        self.get(name).record_success(latency)
+
+    def record_failure(self, name: str, error: Exception):
+        self.get(name).record_failure(error, self.clock())
+
+    def snapshot(self) -> List[dict]:
+        now = self.clock()
+        return [health.snapshot(now) for health in self.models.values()]
+
+
+health_registry = HealthRegistry()
@@ -0,0 +1,171 @@
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from .plan_patch import MEAL_SLOTS
+from .food_db import food_table
+
+# Share of the calorie target a plan may miss by before it needs a repair
+CALORIE_TOLERANCE = float(os.getenv("CALORIE_TOLERANCE", "0.1"))
+# Replace the model's numbers with the food table's for meals whose foods all match it exactly
+FOOD_TABLE_RECOMPUTE = os.getenv("FOOD_TABLE_RECOMPUTE", "1") == "1"
+
+# Keyword -> multiplier, checked in order so "very active" wins over "active"
+ACTIVITY_MULTIPLIERS = (
+    ("sedentary", 1.2),
+    ("extra", 1.9),
+    ("extremely", 1.9),
+    ("very", 1.725),
+    ("light", 1.375),
+    ("moderate", 1.55),
+    ("active", 1.725),
+)
+DEFAULT_ACTIVITY_MULTIPLIER = 1.55
+
+# Daily calorie adjustment for each goal (middle of the 300-500 kcal band)
+GOAL_ADJUSTMENTS = {"weight loss": -400, "weight gain": 400, "maintenance": 0}
+
+# Protein in g per kg of body weight, fat as a share of calories
+PROTEIN_PER_KG = (1.6, 2.2)
+FAT_SHARE = (0.20, 0.35)
+
+
+@dataclass
+class NutritionTargets:
+    goal: str
+    bmr: int
+    tdee: int
+    calories: int
+    protein: Tuple[int, int]
+    carbs: Tuple[int, int]
+    fats: Tuple[int, int]
+
+    def prompt_section(self) -> str:
+        return f"""
+### Nutrition Targets (pre-calculated, use these numbers as given)
+- BMR: {self.bmr} kcal, TDEE: {self.tdee} kcal
+- Daily calorie target ({self.goal}): {self.calories} kcal; total_calories must equal the sum of the meals
+- Protein: {self.protein[0]}-{self.protein[1]} g, Carbs: {self.carbs[0]}-{self.carbs[1]} g, Fats: {self.fats[0]}-{self.fats[1]} g
+"""
+
+
+def weight_goal(weight, target_weight) -> str:
+    """Goal label from current and target weight; maintenance within 1 kg or if unknown."""
+    try:
+        weight_difference = float(target_weight) - float(weight)
+    except (TypeError, ValueError):
+        return "maintenance"
+    if weight_difference < -1:
+        return "weight loss"
+    if weight_difference > 1:
+        return "weight gain"
+    return "maintenance"
+
+
+def activity_multiplier(daily_physical_activity: Optional[str]) -> float:
+    level = (daily_physical_activity or "").lower()
+    for keyword, multiplier in ACTIVITY_MULTIPLIERS:
+        if keyword in level:
+            return multiplier
+    return DEFAULT_ACTIVITY_MULTIPLIER
+
+
+def mifflin_st_jeor(weight: float, height: float, age: float, gender: Optional[str]) -> float:
+    base = 10 * weight + 6.25 * height - 5 * age
+    gender = (gender or "").strip().lower()
+    if gender.startswith("m"):
+        return base + 5
+    if gender.startswith("f"):
+        return base - 161
+    # Unspecified: midpoint of the two equations
+    return base - 78
+
+
+def compute_targets(age, weight, target_weight, height, gender, daily_physical_activity) -> Optional[NutritionTargets]:
+    """BMR, TDEE, goal calories and macro ranges; ``None`` if a required stat is missing."""
+    try:
+        age, weight, height = float(age), float(weight), float(height)
+    except (TypeError, ValueError):
+        return None
+
+    goal = weight_goal(weight, target_weight)
+    bmr = mifflin_st_jeor(weight, height, age, gender)
+    tdee = bmr * activity_multiplier(daily_physical_activity)
+    # Never prescribe less than the BMR
+    calories = max(bmr, tdee + GOAL_ADJUSTMENTS[goal])
+
+    protein = (PROTEIN_PER_KG[0] * weight, PROTEIN_PER_KG[1] * weight)
+    fats = (FAT_SHARE[0] * calories / 9, FAT_SHARE[1] * calories / 9)
+    carbs = (
+        max(0.0, (calories - protein[1] * 4 - fats[1] * 9) / 4),
+        max(0.0, (calories - protein[0] * 4 - fats[0] * 9) / 4),
+    )
+    return NutritionTargets(
+        goal=goal,
+        bmr=round(bmr),
+        tdee=round(tdee),
+        calories=round(calories),
+        protein=(round(protein[0]), round(protein[1])),
+        carbs=(round(carbs[0]), round(carbs[1])),
+        fats=(round(fats[0]), round(fats[1])),
+    )
+
+
+def targets_from_user_data(user_data: dict) -> Optional[NutritionTargets]:
+    """``compute_targets`` for the ``userDataFrom`` dicts the update flow passes around."""
+    return compute_targets(
+        user_data.get("age"),
+        user_data.get("weight"),
+        user_data.get("targetWeight", user_data.get("target_weight")),
+        user_data.get("height"),
+        user_data.get("gender"),
+        user_data.get("daily_physical_activity"),
+    )
+
+
+def fix_arithmetic(plan: dict) -> List[str]:
+    """
+    Repairs what can be recomputed locally, in place: meals whose foods all
+    match the food table exactly (or after normalization) get the table's
+    numbers, other meals keep the model's, and the total is made the sum of
+    the meals. Returns a description of each fix.
+    """
+    fixes = []
+    recomputed = food_table.recompute([plan])[0] if FOOD_TABLE_RECOMPUTE else []
+    for slot in recomputed:
+        fixes.append(f"{slot} recomputed from the food table")
+    total = sum(plan[slot]["calories"] for slot in MEAL_SLOTS)
+    if plan["total_calories"] != total:
+        fixes.append(f"total_calories {plan['total_calories']} -> {total}")
+        plan["total_calories"] = total
+    return fixes
+
+
+def target_issues(plan: dict, targets: NutritionTargets) -> List[str]:
+    """What keeps the plan from meeting the targets, phrased as instructions for a repair prompt."""
+    issues = []
+    low, high = targets.calories * (1 - CALORIE_TOLERANCE), targets.calories * (1 + CALORIE_TOLERANCE)
+    if not low <= plan["total_calories"] <= high:
+        issues.append(
+            f"total calories are {plan['total_calories']} kcal but must be within {round(low)}-{round(high)} kcal"
+        )
+    for macro in ("protein", "carbs", "fats"):
+        amount = sum(plan[slot][macro] for slot in MEAL_SLOTS)
+        minimum, maximum = getattr(targets, macro)
+        if not minimum <= amount <= maximum:
+            issues.append(f"{macro} totals {amount} g but must be within {minimum}-{maximum} g")
+    return issues
+
+
+class NutritionStats:
+    def __init__(self):
+        self.validated = 0
+        self.arithmetic_fixes = 0
+        self.repairs_attempted = 0
+        self.repairs_succeeded = 0
+
+    def snapshot(self) -> dict:
+        return dict(vars(self))
+
+
+nutrition_stats = NutritionStats()
@@ -0,0 +1,133 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+# scrypt cost: N (CPU/memory, a power of two), r (block size), p (parallelism).
+# The defaults take ~70 ms and 16 MiB per hash on one core.
+PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+# Threads hashing at once, one per CPU this process may use: scrypt releases
+# the GIL, so they run on real cores, and more threads than cores would only
+# queue behind each other. On a single core the pool does not add throughput;
+# it keeps the event loop answering other requests while logins hash.
+# 0 hashes inline on the event loop, only useful to measure what the pool buys.
+_CPUS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(_CPUS)))
+# Hashes queued or running before new ones are refused instead of piling up
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "256"))
+
+_SCHEME = "scrypt"
+_SALT_BYTES = 16
+_KEY_BYTES = 32
+
+
+class PasswordHasherBusy(Exception):
+    """Too many hashes pending; the caller should retry shortly."""
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # OpenSSL needs 128 * n * r bytes plus headroom
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 2 ** 20, dklen=_KEY_BYTES)
+
+
+def hash_password(password: str, n: int = PASSWORD_SCRYPT_N, r: int = PASSWORD_SCRYPT_R, p: int = PASSWORD_SCRYPT_P) -> str:
+    """``scrypt$n$r$p$salt$key``: the parameters travel with the hash, so costs can change later."""
+    salt = secrets.token_bytes(_SALT_BYTES)
+    return f"{_SCHEME}${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+
+
+def is_hashed(stored: str) -> bool:
+    return stored.startswith(f"{_SCHEME}$")
+
+
+def verify_password(password: str, stored: str) -> Tuple[bool, bool]:
+    """
+    Returns ``(matches, needs_rehash)``. Anything that is not one of our
+    hashes is a plaintext password from before hashing; it still verifies,
+    in constant time, and always needs a rehash. So does a hash made with
+    other cost parameters than the current ones.
+    """
+    if not is_hashed(stored):
+        return hmac.compare_digest(stored.encode(), password.encode()), True
+    _, n, r, p, salt, key = stored.split("$")
+    n, r, p = int(n), int(r), int(p)
+    matches = hmac.compare_digest(_scrypt(password, _unb64(salt), n, r, p), _unb64(key))
+    return matches, (n, r, p) != (PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+
+
+class PasswordHasher:
+    """Runs hashing and verification on a bounded thread pool, off the event loop."""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor: Optional[ThreadPoolExecutor] = (
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash") if workers > 0 else None
+        )
+        self.pending = 0
+        self.hashes = 0
+        self.verifications = 0
+        self.upgrades = 0
+        self.rejected = 0
+        # Queued plus hashing, as the caller sees it
+        self.wait_seconds = 0.0
+        # Verified against when the email is unknown, so a miss costs the same as a wrong password
+        self._decoy: Optional[str] = None
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusy(f"{self.pending} password hashes already pending")
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            if self.executor is None:
+                return fn(*args)
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+            self.wait_seconds += time.perf_counter() - started
+
+    async def hash(self, password: str) -> str:
+        self.hashes += 1
+        return await self._run(hash_password, password)
+
+    async def verify(self, password: str, stored: Optional[str]) -> Tuple[bool, bool]:
+        self.verifications += 1
+        if stored is None:
+            if self._decoy is None:
+                self._decoy = await self._run(hash_password, secrets.token_hex(8))
+            await self._run(verify_password, password, self._decoy)
+            return False, False
+        return await self._run(verify_password, password, stored)
+
+    def stats(self) -> dict:
+        operations = self.hashes + self.verifications
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "hashes": self.hashes,
+            "verifications": self.verifications,
+            "upgrades": self.upgrades,
+            "rejected": self.rejected,
+            "avg_ms": round(self.wait_seconds / operations * 1000, 2) if operations else 0.0,
+            "cost": {"n": PASSWORD_SCRYPT_N, "r": PASSWORD_SCRYPT_R, "p": PASSWORD_SCRYPT_P},
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,202 @@
+import copy
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from sqlmodel import Session, delete
+from starlette.concurrency import run_in_threadpool
+
+from ..models import MealPlanCache
+from .single_flight import SingleFlight
+
+# Entries kept in the in-process LRU and how long any cached plan stays valid
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "1024"))
+PLAN_CACHE_TTL = float(os.getenv("PLAN_CACHE_TTL", str(7 * 24 * 3600)))
+# "memory" for the LRU only, "postgres" to back it with the MealPlanCache table
+PLAN_CACHE_BACKEND = os.getenv("PLAN_CACHE_BACKEND", "memory")
+# Profiles that land in the same buckets share a plan, e.g. "age=5,weight=2"
+PLAN_CACHE_BUCKETS = os.getenv("PLAN_CACHE_BUCKETS", "age=5,weight=2,targetWeight=2,height=5")
+# Rows written to the second tier between sweeps of expired entries
+_SWEEP_EVERY = 500
+
+
+def _parse_buckets(value: str) -> Dict[str, float]:
+    buckets = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        field, _, size = item.partition("=")
+        buckets[field.strip()] = float(size)
+    return buckets
+
+
+def _bucket(value: float, size: float) -> float:
+    if not size:
+        return value
+    return round(round(value / size) * size, 2)
+
+
+def _normalize_list(values) -> list:
+    return sorted({value.strip().lower() for value in values or [] if value and value.strip()})
+
+
+def cache_key(requestBody, buckets: Optional[Dict[str, float]] = None) -> str:
+    """Canonical key for a ``promptInput``: bucketed numbers, lower-cased text, sorted lists."""
+    buckets = _parse_buckets(PLAN_CACHE_BUCKETS) if buckets is None else buckets
+    normalized = {
+        "age": _bucket(requestBody.age, buckets.get("age", 0)),
+        "weight": _bucket(requestBody.weight, buckets.get("weight", 0)),
+        "targetWeight": _bucket(requestBody.targetWeight, buckets.get("targetWeight", 0)),
+        "height": _bucket(requestBody.height, buckets.get("height", 0)),
+        "gender": requestBody.gender.strip().lower(),
+        "daily_physical_activity": requestBody.daily_physical_activity.strip().lower(),
+        "dietary_preferences": _normalize_list(requestBody.dietary_preferences),
+        "allergies": _normalize_list(requestBody.allergies),
+    }
+    encoded = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class MemoryBackend:
+    """LRU with TTL and a maximum entry count."""
+
+    def __init__(self, max_entries: int = PLAN_CACHE_SIZE, ttl: float = PLAN_CACHE_TTL, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        created_at, plan = entry
+        if self.clock() - created_at > self.ttl:
+            del self.entries[key]
+            self.evictions += 1
+            return None
+        self.entries.move_to_end(key)
+        return plan
+
+    def set(self, key: str, plan: dict, created_at: Optional[float] = None):
+        self.entries[key] = (created_at or self.clock(), plan)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+
+class PostgresBackend:
+    """Second tier shared by every worker, stored in the MealPlanCache table."""
+
+    def __init__(self, engine, ttl: float = PLAN_CACHE_TTL, clock=time.time):
+        self.engine = engine
+        self.ttl = ttl
+        self.clock = clock
+        self.writes = 0
+
+    def get(self, key: str) -> Optional[tuple]:
+        with Session(self.engine) as session:
+            entry = session.get(MealPlanCache, key)
+            if entry is None:
+                return None
+            if self.clock() - entry.created_at > self.ttl:
+                session.delete(entry)
+                session.commit()
+                return None
+            return entry.created_at, entry.meal_plan
+
+    def set(self, key: str, plan: dict):
+        with Session(self.engine) as session:
+            session.merge(MealPlanCache(key=key, meal_plan=plan, created_at=self.clock()))
+            self.writes += 1
+            if self.writes % _SWEEP_EVERY == 0:
+                expired = MealPlanCache.created_at < self.clock() - self.ttl
+                session.exec(delete(MealPlanCache).where(expired))
+            session.commit()
+
+
+class PlanCache:
+    def __init__(self, memory: MemoryBackend, second_tier: Optional[PostgresBackend] = None):
+        self.memory = memory
+        self.second_tier = second_tier
+        self.hits = 0
+        self.second_tier_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.flights = SingleFlight()
+
+    async def get(self, key: str) -> Optional[dict]:
+        plan = self.memory.get(key)
+        if plan is not None:
+            self.hits += 1
+            return copy.deepcopy(plan)
+        if self.second_tier is not None:
+            entry = await run_in_threadpool(self.second_tier.get, key)
+            if entry is not None:
+                created_at, plan = entry
+                # Promote, keeping the original age so the TTL still counts from generation
+                self.memory.set(key, plan, created_at)
+                self.second_tier_hits += 1
+                return copy.deepcopy(plan)
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, plan: dict):
+        self.memory.set(key, copy.deepcopy(plan))
+        if self.second_tier is not None:
+            await run_in_threadpool(self.second_tier.set, key, plan)
+
+    async def get_or_generate(self, requestBody, generate: Callable[[], Awaitable[dict]], fresh: bool = False) -> dict:
+        """
+        Returns the cached plan for this profile, or generates and caches one.
+
+        Args:
+            requestBody (promptInput): The user's profile
+            generate (callable): Coroutine function producing a new plan on a miss
+            fresh (bool): Skip the lookup (the new plan still refreshes the cache)
+        """
+        key = cache_key(requestBody)
+        if fresh:
+            self.bypassed += 1
+        else:
+            plan = await self.get(key)
+            if plan is not None:
+                return plan
+
+        async def generate_and_store():
+            plan = await generate()
+            if plan is not None:
+                await self.set(key, plan)
+            return plan
+
+        # Identical profiles arriving together share one LLM call
+        plan = await self.flights.do(key, generate_and_store)
+        return copy.deepcopy(plan)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.second_tier_hits + self.misses
+        return {
+            "backend": "memory" if self.second_tier is None else "memory+postgres",
+            "entries": len(self.memory.entries),
+            "max_entries": self.memory.max_entries,
+            "hits": self.hits,
+            "second_tier_hits": self.second_tier_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.memory.evictions,
+            "coalesced": self.flights.followers,
+            "hit_rate": round((self.hits + self.second_tier_hits) / lookups, 3) if lookups else 0.0,
+        }
+
+
+def _second_tier() -> Optional[PostgresBackend]:
+    if PLAN_CACHE_BACKEND != "postgres":
+        return None
+    from ..db import engine
+    return PostgresBackend(engine)
+
+
+plan_cache = PlanCache(MemoryBackend(), _second_tier())
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import os
+import time
+from typing import List, Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import delete, select
+
+from ..models import MealPlanVersion, UserMealPlan
+
+logger = logging.getLogger(__name__)
+
+# Versions kept per user once compacted, oldest dropped first (0 keeps them all)
+PLAN_HISTORY_LIMIT = int(os.getenv("PLAN_HISTORY_LIMIT", "50"))
+# Compaction turns every Nth version into a snapshot, bounding how many deltas a read replays
+PLAN_SNAPSHOT_EVERY = int(os.getenv("PLAN_SNAPSHOT_EVERY", "10"))
+# Seconds between compaction runs (0 disables the schedule)
+PLAN_COMPACT_INTERVAL = float(os.getenv("PLAN_COMPACT_INTERVAL", "3600"))
+# Attempts at appending a version when concurrent saves keep taking the next number
+SAVE_ATTEMPTS = 5
+
+
+class PlanVersionNotFound(Exception):
+    pass
+
+
+def plan_delta(previous: dict, plan: dict) -> dict:
+    """Top-level keys of ``plan`` whose value differs from ``previous``."""
+    return {key: value for key, value in plan.items() if previous.get(key) != value}
+
+
+async def save_plan_version(session, email: str, plan: dict, source: str) -> UserMealPlan:
+    """
+    Appends ``plan`` as the user's next version and points ``UserMealPlan``
+    at it, in one transaction. The first version is a snapshot, later ones
+    store only what changed. Two saves racing for the same version number
+    collide on the (email, version) unique constraint; the loser reloads and
+    appends after the winner instead of overwriting it.
+    """
+    for attempt in range(SAVE_ATTEMPTS):
+        current = await session.get(UserMealPlan, email, populate_existing=True)
+        if current is None:
+            version, kind, payload = 1, "snapshot", plan
+            current = UserMealPlan(email=email, meal_plan=plan, version=1)
+            session.add(current)
+        else:
+            version, kind, payload = current.version + 1, "delta", plan_delta(current.meal_plan, plan)
+            current.meal_plan = plan
+            current.version = version
+        session.add(MealPlanVersion(
+            email=email, version=version, kind=kind, payload=payload, source=source, created_at=time.time(),
+        ))
+        try:
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            if attempt == SAVE_ATTEMPTS - 1:
+                raise
+            continue
+        # No refresh: a concurrent save may already have moved the row past the version written here
+        return current
+
+
+async def plan_history(session, email: str, limit: int = 20, before: Optional[int] = None) -> List[dict]:
+    """Newest-first version summaries, ``limit`` of them below ``before`` if given."""
+    statement = select(MealPlanVersion).where(MealPlanVersion.email == email)
+    if before is not None:
+        statement = statement.where(MealPlanVersion.version < before)
+    versions = (await session.exec(statement.order_by(MealPlanVersion.version.desc()).limit(limit))).all()
+    return [
+        {
+            "version": entry.version,
+            "kind": entry.kind,
+            "source": entry.source,
+            "created_at": entry.created_at,
+            "changed": sorted(entry.payload),
+        }
+        for entry in versions
+    ]
+
+
+async def plan_at_version(session, email: str, version: int) -> dict:
+    """Rebuilds a version from the nearest snapshot at or before it plus the deltas after that."""
+    snapshot = (await session.exec(
+        select(func.max(MealPlanVersion.version)).where(
+            MealPlanVersion.email == email,
+            MealPlanVersion.kind == "snapshot",
+            MealPlanVersion.version <= version,
+        )
+    )).one()
+    if snapshot is None:
+        raise PlanVersionNotFound(f"No version {version} for {email}")
+    chain = (await session.exec(
+        select(MealPlanVersion)
+        .where(MealPlanVersion.email == email, MealPlanVersion.version >= snapshot, MealPlanVersion.version <= version)
+        .order_by(MealPlanVersion.version)
+    )).all()
+    if chain[-1].version != version:
+        raise PlanVersionNotFound(f"No version {version} for {email}")
+    plan = {}
+    for entry in chain:
+        plan.update(entry.payload)
+    return plan
+
+
+async def rollback_plan(session, email: str, version: int) -> UserMealPlan:
+    """Makes an old version current again by appending it as a new version; history is never rewritten."""
+    plan = await plan_at_version(session, email, version)
+    return await save_plan_version(session, email, plan, f"rollback:{version}")
+
+
+async def compact_history(session, email: str) -> dict:
+    """
+    Rewrites every PLAN_SNAPSHOT_EVERY-th version of a user as a snapshot
+    and drops versions beyond PLAN_HISTORY_LIMIT, the oldest kept one
+    becoming a snapshot so the chain still starts from a whole plan.
+    """
+    versions = (await session.exec(
+        select(MealPlanVersion).where(MealPlanVersion.email == email).order_by(MealPlanVersion.version)
+    )).all()
+    dropped = len(versions) - PLAN_HISTORY_LIMIT if PLAN_HISTORY_LIMIT and len(versions) > PLAN_HISTORY_LIMIT else 0
+    snapshotted = 0
+    plan = {}
+    since_snapshot = 0
+    for index, entry in enumerate(versions):
+        if entry.kind == "snapshot":
+            plan = dict(entry.payload)
+            since_snapshot = 0
+            continue
+        plan.update(entry.payload)
+        since_snapshot += 1
+        # Versions about to be dropped are not worth rewriting
+        if index == dropped or (index > dropped and since_snapshot >= PLAN_SNAPSHOT_EVERY):
+            entry.kind, entry.payload = "snapshot", dict(plan)
+            session.add(entry)
+            snapshotted += 1
+            since_snapshot = 0
+    if dropped:
+        await session.exec(delete(MealPlanVersion).where(
+            MealPlanVersion.email == email, MealPlanVersion.version < versions[dropped].version,
+        ))
+    await session.commit()
+    return {"snapshotted": snapshotted, "dropped": dropped}
+
+
+async def compact_all(session) -> dict:
+    """Compacts the users whose history is over the limit or has a long run of deltas."""
+    latest_snapshot = func.max(case((MealPlanVersion.kind == "snapshot", MealPlanVersion.version)))
+    overdue = func.max(MealPlanVersion.version) - latest_snapshot >= PLAN_SNAPSHOT_EVERY
+    if PLAN_HISTORY_LIMIT:
+        overdue = overdue | (func.count() > PLAN_HISTORY_LIMIT)
+    emails = (await session.exec(select(MealPlanVersion.email).group_by(MealPlanVersion.email).having(overdue))).all()
+    totals = {"users": len(emails), "snapshotted": 0, "dropped": 0}
+    for email in emails:
+        result = await compact_history(session, email)
+        totals["snapshotted"] += result["snapshotted"]
+        totals["dropped"] += result["dropped"]
+    return totals
+
+
+class HistoryCompactor:
+    """Runs ``compact_all`` every PLAN_COMPACT_INTERVAL seconds in the background."""
+
+    def __init__(self, interval: float = PLAN_COMPACT_INTERVAL):
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+        self.last_run: Optional[dict] = None
+
+    def start(self):
+        if self.interval > 0:
+            self.task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def run_once(self) -> dict:
+        from ..db import session_scope
+
+        started = time.perf_counter()
+        async with session_scope() as session:
+            result = await compact_all(session)
+        self.last_run = dict(result, seconds=round(time.perf_counter() - started, 3), finished_at=time.time())
+        return self.last_run
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.exception("Plan history compaction failed: %s", e)
+
+
+history_compactor = HistoryCompactor()
@@ -0,0 +1,30 @@
+import copy
+from typing import Optional
+
+from ..schemas import DailyPlan, Meal, MealPlanPatch
+
+MEAL_SLOTS = ("breakfast", "morning_snack", "lunch", "afternoon_snack", "dinner")
+
+
+def recompute_total_calories(plan: dict) -> dict:
+    plan["total_calories"] = sum(int(plan[slot]["calories"]) for slot in MEAL_SLOTS)
+    return plan
+
+
+def apply_meal_plan_patch(previous: dict, patch: Optional[dict]) -> dict:
+    """
+    Applies a ``MealPlanPatch`` to a stored plan: replaced meals are swapped
+    in whole, hydration/notes overwritten if present, and ``total_calories``
+    recomputed from the meals. Returns a new, validated plan dict.
+    """
+    patch = MealPlanPatch.model_validate(patch or {})
+    plan = copy.deepcopy(previous)
+    for slot in MEAL_SLOTS:
+        meal: Optional[Meal] = getattr(patch, slot)
+        if meal is not None:
+            plan[slot] = meal.model_dump()
+    if patch.hydration is not None:
+        plan["hydration"] = patch.hydration
+    if patch.notes is not None:
+        plan["notes"] = patch.notes
+    return DailyPlan.model_validate(recompute_total_calories(plan)).model_dump()
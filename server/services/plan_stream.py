@@ -0,0 +1,63 @@
+import json
+import time
+from typing import AsyncIterator, Optional
+
+from pydantic import ValidationError
+
+from ..schemas import DailyPlan, Meal
+
+MEAL_SLOTS = ("breakfast", "morning_snack", "lunch", "afternoon_snack", "dinner")
+
+
+def _validated_meal(value) -> Optional[dict]:
+    try:
+        return Meal.model_validate(value).model_dump()
+    except ValidationError:
+        return None
+
+
+async def meal_events(partials: AsyncIterator[dict]) -> AsyncIterator[dict]:
+    """
+    Turns a stream of partially parsed ``DailyPlan`` dicts into events.
+
+    A meal counts as complete once the model has moved on to a later key
+    (or the stream ends) and it validates against ``schemas.Meal``; each one
+    is emitted once as ``{"event": "meal", "slot": ..., "meal": ...}``.
+    The last event is ``{"event": "plan", "meal_plan": ...}`` with the whole
+    plan validated against ``DailyPlan``.
+    """
+    emitted = set()
+    plan = {}
+    async for partial in partials:
+        if not isinstance(partial, dict):
+            continue
+        plan = partial
+        keys = list(partial.keys())
+        for slot in MEAL_SLOTS:
+            if slot in emitted or slot not in partial:
+                continue
+            # Objects stream key by key, so a later key means this meal is closed
+            if keys.index(slot) == len(keys) - 1:
+                continue
+            meal = _validated_meal(partial[slot])
+            if meal is not None:
+                emitted.add(slot)
+                yield {"event": "meal", "slot": slot, "meal": meal}
+
+    for slot in MEAL_SLOTS:
+        if slot not in emitted and slot in plan:
+            meal = _validated_meal(plan[slot])
+            if meal is not None:
+                emitted.add(slot)
+                yield {"event": "meal", "slot": slot, "meal": meal}
+
+    yield {"event": "plan", "meal_plan": DailyPlan.model_validate(plan).model_dump()}
+
+
+def encode_event(event: dict, started: float, sse: bool = False) -> bytes:
+    """Serializes one event as an NDJSON line, or an SSE frame when ``sse`` is set."""
+    event = {**event, "elapsed_ms": round((time.perf_counter() - started) * 1000)}
+    data = json.dumps(event, ensure_ascii=False)
+    if sse:
+        return f"event: {event['event']}\ndata: {data}\n\n".encode()
+    return (data + "\n").encode()
@@ -0,0 +1,317 @@
+import asyncio
+import copy
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from pydantic import ValidationError
+from sqlmodel import Session, select
+
+from ..models import MealPlanVersion, UserMealPlan
+from ..schemas import DailyPlan
+from .food_db import scale_portion
+from .dietary_constraints import constraint_index, forbidden
+from .nutrition import CALORIE_TOLERANCE, NutritionTargets, target_issues
+from .plan_patch import MEAL_SLOTS
+
+# "off", "shadow" (synthesize and count hits but still call the LLM) or "first"
+# (serve the synthesized plan when it meets the targets, else call the LLM).
+# Serving synthesized plans is opt-in; shadow only measures what "first" would hit
+PLAN_SYNTH_MODE = os.getenv("PLAN_SYNTH_MODE", "shadow")
+# Distinct meals remembered per slot, oldest dropped first
+PLAN_SYNTH_LIBRARY_SIZE = int(os.getenv("PLAN_SYNTH_LIBRARY_SIZE", "500"))
+# A slot needs this many allowed meals before synthesis is attempted
+PLAN_SYNTH_MIN_CHOICES = int(os.getenv("PLAN_SYNTH_MIN_CHOICES", "3"))
+# Portion multipliers tried for every meal whose foods all have a weight
+PORTION_SCALES = (0.8, 0.9, 1.0, 1.1, 1.2)
+# Best candidates per slot kept for the selection, after scaling
+MAX_CANDIDATES = 60
+# Calorie resolution of the selection, in kcal
+CALORIE_BIN = 10
+
+MACROS = ("protein", "carbs", "fats")
+
+def _meal_constraints(meal: dict) -> tuple:
+    """Union of the constraint categories of a meal's foods, and their normalized words."""
+    scanned = [constraint_index.scan(food["name"]) for food in meal["foods"]]
+    return frozenset().union(*(categories for categories, _ in scanned)), "".join(words for _, words in scanned)
+
+
+def _scalable(meal: dict) -> bool:
+    try:
+        for food in meal["foods"]:
+            scale_portion(food["portion"], 1.0)
+    except ValueError:
+        return False
+    return True
+
+
+def _scaled(meal: dict, factor: float) -> dict:
+    if factor == 1.0:
+        return meal
+    foods = [dict(food, portion=scale_portion(food["portion"], factor)) for food in meal["foods"]]
+    scaled = dict(meal, foods=foods)
+    for nutrient in ("calories", *MACROS):
+        scaled[nutrient] = round(meal[nutrient] * factor)
+    return scaled
+
+
+class MealLibrary:
+    """
+    Distinct meals seen in stored plans, per slot. Each entry keeps its
+    constraint categories and words for filtering, its calories/macros as an
+    array and whether its portions can be rescaled.
+    """
+
+    def __init__(self, max_meals: int = PLAN_SYNTH_LIBRARY_SIZE):
+        self.max_meals = max_meals
+        self.meals: Dict[str, "OrderedDict[str, tuple]"] = {slot: OrderedDict() for slot in MEAL_SLOTS}
+        # (slot, forbidden categories, literal allergies) -> filtered entries and their stacked arrays, until the next add
+        self._allowed: Dict[tuple, tuple] = {}
+
+    def add_plan(self, plan: dict):
+        try:
+            plan = DailyPlan.model_validate(plan).model_dump()
+        except ValidationError:
+            return
+        for slot in MEAL_SLOTS:
+            meal = plan[slot]
+            signature = json.dumps([meal["name"], meal["foods"]], sort_keys=True)
+            meals = self.meals[slot]
+            nutrients = np.array([meal["calories"], *(meal[macro] for macro in MACROS)], dtype=float)
+            meals[signature] = (meal, _meal_constraints(meal), nutrients, _scalable(meal))
+            meals.move_to_end(signature)
+            while len(meals) > self.max_meals:
+                meals.popitem(last=False)
+        self._allowed.clear()
+
+    def _read(self, engine) -> int:
+        # Each plan adds at most one meal per slot, so max_meals plans can fill the library
+        statement = (
+            select(UserMealPlan.meal_plan)
+            .join(
+                MealPlanVersion,
+                (MealPlanVersion.email == UserMealPlan.email) & (MealPlanVersion.version == UserMealPlan.version),
+                isouter=True,
+            )
+            .order_by(MealPlanVersion.created_at.desc().nulls_last())
+            .limit(self.max_meals)
+        )
+        with Session(engine) as session:
+            plans = session.exec(statement).all()
+        # Oldest first, so the newest meals are the last to be evicted
+        for plan in reversed(plans):
+            self.add_plan(plan)
+        return len(plans)
+
+    async def load(self, engine) -> int:
+        """
+        Seeds the library from the most recently saved plans, up to its
+        capacity; returns the number of plans read. Reading and validating
+        happen on a worker thread, into a separate library that is merged in
+        at the end, so meals added meanwhile stay the newest.
+        """
+        loaded = MealLibrary(self.max_meals)
+        count = await asyncio.to_thread(loaded._read, engine)
+        for slot, meals in loaded.meals.items():
+            for signature, entry in self.meals[slot].items():
+                meals[signature] = entry
+                meals.move_to_end(signature)
+            while len(meals) > self.max_meals:
+                meals.popitem(last=False)
+            self.meals[slot] = meals
+        self._allowed.clear()
+        return count
+
+    def allowed(self, slot: str, categories: frozenset, literal: tuple) -> tuple:
+        """
+        Entries of ``slot`` compatible with ``dietary_constraints.forbidden``'s
+        result, their (n, 4) nutrients and scalable flags.
+        """
+        key = (slot, categories, literal)
+        cached = self._allowed.get(key)
+        if cached is None:
+            entries = [
+                entry for entry in self.meals[slot].values()
+                if not entry[1][0] & categories and not any(f" {phrase} " in entry[1][1] for phrase in literal)
+            ]
+            nutrients = np.stack([entry[2] for entry in entries]) if entries else np.empty((0, 4))
+            scalable = np.array([entry[3] for entry in entries], dtype=bool)
+            cached = (entries, nutrients, scalable)
+            self._allowed[key] = cached
+        return cached
+
+    def size(self) -> dict:
+        return {slot: len(meals) for slot, meals in self.meals.items()}
+
+
+class PlanSynthesizer:
+    """
+    Builds a ``DailyPlan`` from library meals without calling the LLM.
+
+    Picking one (optionally rescaled) meal per slot so the day lands on the
+    calorie target is a multiple-choice knapsack; it is solved exactly by
+    dynamic programming over 10 kcal bins, where each candidate costs how far
+    its macro split is from the target split. Single-slot swaps then pull the
+    macro totals into range, and the plan is served only if it passes
+    ``nutrition.target_issues``.
+    """
+
+    def __init__(self, library: MealLibrary, mode: str = PLAN_SYNTH_MODE):
+        self.library = library
+        self.mode = mode
+        self.attempts = 0
+        self.hits = 0
+        self.misses: Dict[str, int] = {}
+
+    def _miss(self, reason: str) -> None:
+        self.misses[reason] = self.misses.get(reason, 0) + 1
+
+    def synthesize(
+        self,
+        targets: Optional[NutritionTargets],
+        weight: float,
+        dietary_preferences: Optional[List[str]] = None,
+        allergies: Optional[List[str]] = None,
+        exclude: Optional[set] = None,
+    ) -> Optional[dict]:
+        """``exclude``: meal names not to pick, e.g. those already on other days of a week."""
+        if self.mode == "off":
+            return None
+        self.attempts += 1
+        if targets is None:
+            self._miss("no_targets")
+            return None
+
+        categories, literal = forbidden(dietary_preferences, allergies)
+        midpoint = np.array([sum(getattr(targets, macro)) / 2 for macro in MACROS])
+        scales = np.array(PORTION_SCALES)
+        candidates = []
+        for slot in MEAL_SLOTS:
+            entries, base, scalable = self.library.allowed(slot, categories, literal)
+            if exclude:
+                keep = np.array([entry[0]["name"] not in exclude for entry in entries], dtype=bool)
+                entries, base, scalable = [entry for entry, kept in zip(entries, keep) if kept], base[keep], scalable[keep]
+            if len(entries) < PLAN_SYNTH_MIN_CHOICES:
+                self._miss("library_too_small")
+                return None
+            # (meals, scales, 4): every meal at every portion scale in one array
+            nutrients = base[:, None, :] * scales[None, :, None]
+            # How far each option's macro split is from the target split, whatever its size
+            with np.errstate(divide="ignore", invalid="ignore"):
+                split = nutrients[..., 1:] * (targets.calories / nutrients[..., :1])
+            penalty = np.sum(((split - midpoint) / np.maximum(midpoint, 1)) ** 2, axis=-1)
+            unusable = ~scalable[:, None] & (scales != 1.0)[None, :]
+            penalty[unusable | ~(nutrients[..., 0] > 0)] = np.inf
+            best = np.argsort(penalty, axis=None)[:MAX_CANDIDATES]
+            best = best[np.isfinite(penalty.flat[best])]
+            meal_index, scale_index = np.unravel_index(best, penalty.shape)
+            values = np.rint(nutrients[meal_index, scale_index])
+            candidates.append((entries, meal_index, scale_index, values, penalty.flat[best]))
+
+        picks = self._select([(values[:, 0], penalties) for _, _, _, values, penalties in candidates], targets)
+        if picks is None:
+            self._miss("no_combination")
+            return None
+        picks = self._improve(picks, [values for _, _, _, values, _ in candidates], targets)
+        # Only the chosen meals get their portions rewritten
+        chosen = [
+            _scaled(entries[meal_index[pick]][0], PORTION_SCALES[scale_index[pick]])
+            for (entries, meal_index, scale_index, _, _), pick in zip(candidates, picks)
+        ]
+
+        plan = {
+            "total_calories": sum(meal["calories"] for meal in chosen),
+            **{slot: copy.deepcopy(meal) for slot, meal in zip(MEAL_SLOTS, chosen)},
+            "hydration": f"Aim for about {round(float(weight) * 0.035, 1)} litres of water across the day, more on active days.",
+            "notes": f"Built around your {targets.calories} kcal {targets.goal} target.",
+        }
+        if target_issues(plan, targets):
+            self._miss("off_target")
+            return None
+        self.hits += 1
+        return DailyPlan.model_validate(plan).model_dump()
+
+    def _select(self, candidates: List[tuple], targets: NutritionTargets) -> Optional[List[int]]:
+        """Index of the chosen option per slot, given each slot's (calories, penalties) arrays."""
+        low = int(np.ceil(targets.calories * (1 - CALORIE_TOLERANCE) / CALORIE_BIN))
+        high = int(targets.calories * (1 + CALORIE_TOLERANCE) // CALORIE_BIN)
+        cost = np.full(high + 1, np.inf)
+        cost[0] = 0.0
+        choices = []
+        widths = [np.rint(calories / CALORIE_BIN).astype(int) for calories, _ in candidates]
+        for (_, penalties), slot_widths in zip(candidates, widths):
+            best = np.full(high + 1, np.inf)
+            choice = np.full(high + 1, -1)
+            for index, (penalty, width) in enumerate(zip(penalties.tolist(), slot_widths.tolist())):
+                if width > high:
+                    continue
+                shifted = cost[:high + 1 - width] + penalty
+                better = shifted < best[width:]
+                best[width:][better] = shifted[better]
+                choice[width:][better] = index
+            cost = best
+            choices.append(choice)
+
+        # Prefer landing near the target itself, not just inside the tolerance
+        bins = np.arange(high + 1)
+        total = cost + ((bins * CALORIE_BIN - targets.calories) / targets.calories) ** 2 * 10
+        total[:low] = np.inf
+        end = int(np.argmin(total))
+        if not np.isfinite(total[end]):
+            return None
+
+        picks = []
+        for slot_widths, choice in zip(reversed(widths), reversed(choices)):
+            pick = int(choice[end])
+            picks.append(pick)
+            end -= int(slot_widths[pick])
+        return picks[::-1]
+
+    def _improve(self, picks: List[int], values: List[np.ndarray], targets: NutritionTargets) -> List[int]:
+        """
+        The knapsack only steers the macro split, so follow it with a few
+        passes of single-slot swaps that shrink how far the day's calories and
+        macro totals fall outside their ranges.
+        """
+        bounds = np.array([
+            [targets.calories * (1 - CALORIE_TOLERANCE), targets.calories * (1 + CALORIE_TOLERANCE)],
+            *(getattr(targets, macro) for macro in MACROS),
+        ])
+        scale = bounds.mean(axis=1)
+
+        def violation(totals: np.ndarray) -> np.ndarray:
+            below = np.maximum(bounds[:, 0] - totals, 0)
+            above = np.maximum(totals - bounds[:, 1], 0)
+            return np.sum((below + above) / scale, axis=-1)
+
+        picks = list(picks)
+        total = sum(slot_values[pick] for slot_values, pick in zip(values, picks))
+        for _ in range(3):
+            if violation(total) == 0:
+                break
+            for slot, slot_values in enumerate(values):
+                # Day totals with this slot's meal swapped for each of its candidates
+                options = total - slot_values[picks[slot]] + slot_values
+                best = int(np.argmin(violation(options)))
+                if violation(options[best]) < violation(total):
+                    picks[slot] = best
+                    total = options[best]
+        return picks
+
+    def stats(self) -> dict:
+        misses = sum(self.misses.values())
+        return {
+            "mode": self.mode,
+            "library": self.library.size(),
+            "attempts": self.attempts,
+            "hits": self.hits,
+            "misses": misses,
+            "miss_reasons": dict(self.misses),
+            "hit_rate": round(self.hits / self.attempts, 3) if self.attempts else 0.0,
+        }
+
+
+plan_synthesizer = PlanSynthesizer(MealLibrary())
@@ -0,0 +1,96 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+# "1" starts sampling the event loop at startup; otherwise switch it on through /diagnostics/profiler
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"
+# Seconds between samples
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.005"))
+# Shortest interval allowed; at zero or below the sampling thread would spin and starve the loop it samples
+PROFILER_MIN_INTERVAL = 0.001
+# Distinct stacks kept; rarer ones beyond this are folded into one "(other)" entry
+PROFILER_MAX_STACKS = int(os.getenv("PROFILER_MAX_STACKS", "20000"))
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler. A daemon thread reads the Python stack of
+    the target thread (the event loop by default, or every thread) each
+    ``interval`` seconds and counts identical stacks. Results come out in the
+    collapsed format flamegraph.pl and speedscope read:
+    ``outer (file:line);inner (file:line) count``.
+    """
+
+    def __init__(self, interval: float = PROFILER_INTERVAL, max_stacks: int = PROFILER_MAX_STACKS):
+        self.interval = max(PROFILER_MIN_INTERVAL, interval)
+        self.max_stacks = max_stacks
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.sampled_seconds = 0.0
+        self.target: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: Optional[float] = None, all_threads: bool = False):
+        """Samples the calling thread (call it from the event loop), or every thread."""
+        if self.running:
+            return
+        self.interval = max(PROFILER_MIN_INTERVAL, interval or self.interval)
+        self.target = None if all_threads else threading.get_ident()
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self.sampled_seconds += time.time() - self.started_at
+
+    def reset(self):
+        self.stacks.clear()
+        self.samples = 0
+        self.sampled_seconds = 0.0
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me or (self.target is not None and thread_id != self.target):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                if key not in self.stacks and len(self.stacks) >= self.max_stacks:
+                    key = "(other)"
+                self.stacks[key] += 1
+            self.samples += 1
+
+    def collapsed(self, limit: Optional[int] = None) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common(limit))
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "threads": "all" if self.target is None else "event-loop",
+            "samples": self.samples,
+            "distinct_stacks": len(self.stacks),
+            "sampled_seconds": round(self.sampled_seconds + (time.time() - self.started_at if self.running else 0), 1),
+        }
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+# How long a request may queue for token headroom before it is turned away
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "20"))
+# How many requests may queue at once before new ones are turned away
+RATE_LIMIT_MAX_QUEUE = int(os.getenv("RATE_LIMIT_MAX_QUEUE", "100"))
+
+# Completion tokens reserved per call until a model has reported COMPLETION_MIN_SAMPLES
+# outputs; after that the p95 of its observed outputs is reserved instead
+COMPLETION_ESTIMATE = int(os.getenv("LLM_COMPLETION_ESTIMATE", "1500"))
+COMPLETION_MIN_SAMPLES = 5
+
+# Rough prompt-size estimate: ~4 characters per token for English text
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def limits_from_env(value: str) -> Dict[str, tuple]:
+    """Parses ``"model=tokens/requests,..."`` into ``{model: (tokens, requests)}``."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, quota = item.partition("=")
+        tokens, _, requests = quota.partition("/")
+        limits[name.strip()] = (int(tokens), int(requests or 30))
+    return limits
+
+
+class RateLimitExceeded(Exception):
+    """No model has headroom within the allowed wait; carries the suggested Retry-After."""
+
+    def __init__(self, retry_after: float):
+        # A request that fits no model's budget gets a generic one-minute hint
+        self.retry_after = 60 if retry_after == math.inf else max(1, math.ceil(retry_after))
+        super().__init__(f"LLM capacity exhausted, retry after {self.retry_after}s")
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, per_minute: float, clock=time.monotonic):
+        self.capacity = capacity
+        self.rate = per_minute / 60
+        self.clock = clock
+        self.level = capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` can be taken; ``inf`` if it never fits."""
+        if amount > self.capacity:
+            return math.inf
+        self._refill()
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        # May go negative when a call used more than it reserved; later calls wait it off
+        self._refill()
+        self.level -= amount
+
+    def give_back(self, amount: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class ModelBudget:
+    """Tokens-per-minute and requests-per-minute buckets for one Groq model."""
+
+    def __init__(self, tokens_per_minute: int, requests_per_minute: int, clock=time.monotonic):
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute, clock)
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute, clock)
+        self.completions = deque(maxlen=200)
+
+    def completion_estimate(self) -> int:
+        if len(self.completions) < COMPLETION_MIN_SAMPLES:
+            return COMPLETION_ESTIMATE
+        ordered = sorted(self.completions)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def cost(self, prompt_tokens: int) -> float:
+        """
+        Tokens to reserve for a call: the prompt plus the expected completion,
+        capped at the bucket so a model with a small quota is still usable.
+        ``inf`` when the prompt alone exceeds the quota.
+        """
+        if prompt_tokens >= self.tokens.capacity:
+            return math.inf
+        return min(self.tokens.capacity, prompt_tokens + self.completion_estimate())
+
+    def wait_time(self, prompt_tokens: int) -> float:
+        return max(self.tokens.wait_time(self.cost(prompt_tokens)), self.requests.wait_time(1))
+
+
+class Reservation:
+    def __init__(self, model_name: str, tokens: int):
+        self.model_name = model_name
+        self.tokens = tokens
+
+
+class RateLimiter:
+    def __init__(self, clock=time.monotonic, sleep=asyncio.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.budgets: Dict[str, ModelBudget] = {}
+        self.waiting = 0
+        self.rejected = 0
+
+    def set_limits(self, model_name: str, tokens_per_minute: int, requests_per_minute: int):
+        self.budgets[model_name] = ModelBudget(tokens_per_minute, requests_per_minute, self.clock)
+
+    def wait_time(self, model_name: str, prompt_tokens: int) -> float:
+        budget = self.budgets.get(model_name)
+        return 0.0 if budget is None else budget.wait_time(prompt_tokens)
+
+    def try_reserve(self, model_name: str, prompt_tokens: int) -> Optional[Reservation]:
+        budget = self.budgets.get(model_name)
+        if budget is None:
+            return Reservation(model_name, prompt_tokens)
+        cost = budget.cost(prompt_tokens)
+        if cost == math.inf:
+            logger.warning(
+                "Skipping %s: a %d-token prompt can never fit its %d tokens/minute quota",
+                model_name, prompt_tokens, budget.tokens.capacity,
+            )
+            return None
+        if budget.wait_time(prompt_tokens) > 0:
+            return None
+        budget.tokens.take(cost)
+        budget.requests.take(1)
+        return Reservation(model_name, cost)
+
+    def settle(self, reservation: Reservation, used_tokens: Optional[int], output_tokens: Optional[int] = None):
+        """
+        Refunds the part of the reservation the call did not use, or charges
+        what it used beyond it, and records the completion size for later
+        estimates.
+        """
+        budget = self.budgets.get(reservation.model_name)
+        if budget is None:
+            return
+        if output_tokens is not None:
+            budget.completions.append(output_tokens)
+        if used_tokens is None:
+            return
+        if used_tokens < reservation.tokens:
+            budget.tokens.give_back(reservation.tokens - used_tokens)
+        elif used_tokens > reservation.tokens:
+            budget.tokens.take(used_tokens - reservation.tokens)
+
+    async def wait_for_headroom(self, model_names: List[str], tokens: int):
+        """
+        Queues until one of ``model_names`` could take a ``tokens`` prompt.
+
+        Raises ``RateLimitExceeded`` straight away when the queue is full or
+        the shortest wait is longer than ``RATE_LIMIT_MAX_WAIT``.
+        """
+        waited = 0.0
+        if self.waiting >= RATE_LIMIT_MAX_QUEUE:
+            self.rejected += 1
+            raise RateLimitExceeded(min(self.wait_time(name, tokens) for name in model_names))
+        self.waiting += 1
+        try:
+            while True:
+                wait = min(self.wait_time(name, tokens) for name in model_names)
+                if wait == 0:
+                    return
+                if waited + wait > RATE_LIMIT_MAX_WAIT:
+                    self.rejected += 1
+                    raise RateLimitExceeded(wait)
+                await self.sleep(wait)
+                waited += wait
+        finally:
+            self.waiting -= 1
+
+    def snapshot(self) -> dict:
+        models = {}
+        for name, budget in self.budgets.items():
+            budget.tokens._refill()
+            budget.requests._refill()
+            models[name] = {
+                "tokens_available": int(budget.tokens.level),
+                "tokens_per_minute": int(budget.tokens.capacity),
+                "requests_available": int(budget.requests.level),
+                "requests_per_minute": int(budget.requests.capacity),
+                "completion_estimate": budget.completion_estimate(),
+            }
+        return {"waiting": self.waiting, "rejected": self.rejected, "models": models}
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Captures the token usage Groq reports so a reservation can be settled."""
+
+    def __init__(self):
+        self.total_tokens: Optional[int] = None
+        self.input_tokens: Optional[int] = None
+        self.output_tokens: Optional[int] = None
+
+    def on_llm_end(self, response: Any, **kwargs: Any):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        total = usage.get("total_tokens")
+        self.input_tokens = usage.get("prompt_tokens")
+        self.output_tokens = usage.get("completion_tokens")
+        if response.generations and response.generations[0]:
+            message = getattr(response.generations[0][0], "message", None)
+            metadata = getattr(message, "usage_metadata", None) or {}
+            total = metadata.get("total_tokens") if total is None else total
+            self.input_tokens = metadata.get("input_tokens") if self.input_tokens is None else self.input_tokens
+            self.output_tokens = metadata.get("output_tokens") if self.output_tokens is None else self.output_tokens
+        self.total_tokens = total
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,116 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Serialized plans kept in memory, least recently read dropped first
+PLAN_RESPONSE_CACHE_SIZE = int(os.getenv("PLAN_RESPONSE_CACHE_SIZE", "10000"))
+# Seconds a cached plan is served without re-reading its version. A save on
+# this worker invalidates it at once; one on another worker shows within this
+PLAN_VERSION_TTL = float(os.getenv("PLAN_VERSION_TTL", "1"))
+
+
+class CachedResponse:
+    __slots__ = ("version", "body", "etag", "checked_at")
+
+    def __init__(self, version: int, body: bytes, checked_at: float):
+        self.version = version
+        self.body = body
+        # When the version was last known to match the database
+        self.checked_at = checked_at
+        # Strong validator: any change to the bytes changes it
+        self.etag = f'"{version}-{hashlib.sha256(body).hexdigest()[:16]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """``If-None-Match`` check; the header may list several tags or be ``*``."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match uses the weak comparison, so W/"x" matches "x"
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+class ResponseCache:
+    """
+    LRU of response bytes per email, stamped with the plan version they
+    render. Saves on this worker ``invalidate`` their entry; saves on other
+    workers do not reach it, so an entry is trusted without a database read
+    (``recent``) only for ``version_ttl`` seconds after its version was last
+    checked. After that readers pass the version stored in the database and
+    an entry for any other version is dropped, whichever worker wrote it.
+    """
+
+    def __init__(self, max_entries: int = PLAN_RESPONSE_CACHE_SIZE, version_ttl: float = PLAN_VERSION_TTL,
+                 clock=time.monotonic):
+        self.max_entries = max_entries
+        self.version_ttl = version_ttl
+        self.clock = clock
+        self.entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.not_modified = 0
+        self.invalidations = 0
+        # Bumped by every invalidation; see ``put``
+        self.epoch = 0
+
+    def recent(self, email: str) -> Optional[CachedResponse]:
+        """The cached response if its version was checked within ``version_ttl``; no miss is counted."""
+        entry = self.entries.get(email)
+        if entry is None or self.clock() - entry.checked_at >= self.version_ttl:
+            return None
+        self.entries.move_to_end(email)
+        self.hits += 1
+        return entry
+
+    def get(self, email: str, version: int) -> Optional[CachedResponse]:
+        entry = self.entries.get(email)
+        if entry is not None and entry.version != version:
+            # Saved since, possibly by another worker
+            del self.entries[email]
+            self.stale += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        entry.checked_at = self.clock()
+        self.entries.move_to_end(email)
+        self.hits += 1
+        return entry
+
+    def put(self, email: str, version: int, body: bytes, epoch: Optional[int] = None) -> CachedResponse:
+        """
+        Caches ``body``. Pass the ``epoch`` read before loading the plan: if a
+        write invalidated anything since, the body may predate it and is
+        returned without being cached.
+        """
+        entry = CachedResponse(version, body, self.clock())
+        if epoch is not None and epoch != self.epoch:
+            return entry
+        self.entries[email] = entry
+        self.entries.move_to_end(email)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, email: str):
+        self.epoch += 1
+        if self.entries.pop(email, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "not_modified": self.not_modified,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+plan_responses = ResponseCache()
@@ -0,0 +1,33 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller (the leader)
+    runs the work, everyone arriving while it is in flight awaits the same result.
+    """
+
+    def __init__(self):
+        self.calls: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        task = self.calls.get(key)
+        if task is None:
+            self.leaders += 1
+            # Run as its own task so a disconnecting leader does not cancel its followers
+            task = asyncio.ensure_future(fn())
+            self.calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.followers += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self.calls), "leaders": self.leaders, "followers": self.followers}
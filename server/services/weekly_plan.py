@@ -0,0 +1,174 @@
+import asyncio
+import os
+import time
+from typing import Dict, Iterable, List, Tuple, get_args
+
+from sqlmodel import select
+
+from ..models import WeeklyPlanDay
+from ..schemas import Weekday
+from .groq_ai import meal_plan_generator
+from .nutrition import compute_targets
+from .plan_patch import MEAL_SLOTS
+from .plan_synth import plan_synthesizer
+
+WEEKDAYS = get_args(Weekday)
+# Day generations in flight at once, shared by every weekly request. Each day
+# still reserves its tokens with the rate limiter, so a week fans out only as
+# far as the models' token budgets allow.
+WEEKLY_PLAN_CONCURRENCY = int(os.getenv("WEEKLY_PLAN_CONCURRENCY", "7"))
+# Days generated together cannot see each other's meals, so after they are
+# back the ones repeating another day's meal are regenerated, this many times
+WEEKLY_PLAN_REPEAT_ROUNDS = int(os.getenv("WEEKLY_PLAN_REPEAT_ROUNDS", "1"))
+
+# Each day leans on its own cuisine, so days generated at the same time still differ
+DAY_THEMES = {
+    "monday": "Mediterranean dishes",
+    "tuesday": "Indian dishes",
+    "wednesday": "East Asian dishes",
+    "thursday": "Mexican dishes",
+    "friday": "Middle Eastern dishes",
+    "saturday": "Italian dishes",
+    "sunday": "home-style comfort dishes",
+}
+
+day_slots = asyncio.Semaphore(WEEKLY_PLAN_CONCURRENCY)
+
+# Each day is counted once, by where its plan came from; days_regenerated counts repeat-pass retries
+weekly_stats = {
+    "weeks": 0, "days_generated": 0, "days_synthesized": 0, "days_reused": 0, "days_failed": 0,
+    "days_regenerated": 0, "repeated_meals": 0,
+}
+
+
+def meal_names(plans: Iterable[dict]) -> set:
+    return {plan[slot]["name"] for plan in plans for slot in MEAL_SLOTS}
+
+
+def repeated_meals(plans: Iterable[dict]) -> int:
+    """Meal names that appear on more than one day."""
+    seen, repeated = set(), set()
+    for plan in plans:
+        names = {plan[slot]["name"] for slot in MEAL_SLOTS}
+        repeated |= seen & names
+        seen |= names
+    return len(repeated)
+
+
+def repeating_days(plans: Dict[str, dict], days: List[str], taken: set) -> List[str]:
+    """Days, in order, with a meal already in ``taken`` or on an earlier one of ``days``."""
+    taken = set(taken)
+    repeating = []
+    for day in days:
+        names = meal_names([plans[day]])
+        if names & taken:
+            repeating.append(day)
+        else:
+            taken |= names
+    return repeating
+
+
+def variety_section(day: str, avoid: set) -> str:
+    section = f"""
+### Weekly Variety
+- This is the {day.capitalize()} plan of a weekly meal plan; lean its meals towards {DAY_THEMES[day]} where the dietary preferences allow.
+"""
+    if avoid:
+        section += f"- Other days already have these meals, so do not repeat them: {', '.join(sorted(avoid))}\n"
+    return section
+
+
+async def load_week(session, email: str) -> Dict[str, dict]:
+    rows = (await session.exec(select(WeeklyPlanDay).where(WeeklyPlanDay.email == email))).all()
+    return {row.day: row.meal_plan for row in rows}
+
+
+async def save_days(session, email: str, plans: Dict[str, dict]):
+    now = time.time()
+    for day, plan in plans.items():
+        await session.merge(WeeklyPlanDay(email=email, day=day, meal_plan=plan, updated_at=now))
+    await session.commit()
+
+
+async def generate_week(requestBody, days: List[str], reused: Dict[str, dict]) -> Tuple[Dict[str, dict], Dict[str, Exception]]:
+    """
+    Generates ``days`` for the ``promptInput`` profile, next to the ``reused``
+    days, and returns the new plans and the errors of days that failed.
+
+    The meal library is tried first, one day after another, each excluding
+    the meals already picked for the week; it needs no LLM call, so this takes
+    milliseconds. The remaining days go to the LLM concurrently, each told its
+    cuisine and which meals the week already has. Those prompts cannot list
+    the meals of days generated alongside them, so afterwards days repeating
+    an earlier day's meal are regenerated (``WEEKLY_PLAN_REPEAT_ROUNDS``
+    times) against the rest of the week; repeats left after that are kept
+    and counted in ``repeated_meals``.
+    """
+    weekly_stats["weeks"] += 1
+    weekly_stats["days_reused"] += len(reused)
+    avoid = meal_names(reused.values())
+    plans = {}
+
+    if plan_synthesizer.mode == "first":
+        targets = compute_targets(
+            requestBody.age, requestBody.weight, requestBody.targetWeight, requestBody.height,
+            requestBody.gender, requestBody.daily_physical_activity,
+        )
+        for day in days:
+            plan = plan_synthesizer.synthesize(
+                targets, requestBody.weight, requestBody.dietary_preferences, requestBody.allergies, exclude=avoid
+            )
+            if plan is None:
+                # Fewer meals are left for every later day, so they would miss too
+                break
+            plans[day] = plan
+            avoid |= meal_names([plan])
+        weekly_stats["days_synthesized"] += len(plans)
+
+    pending = [day for day in days if day not in plans]
+
+    async def generate(day: str, variety: str):
+        async with day_slots:
+            return await meal_plan_generator(
+                requestBody.age,
+                requestBody.weight,
+                requestBody.targetWeight,
+                requestBody.height,
+                requestBody.gender,
+                requestBody.daily_physical_activity,
+                requestBody.dietary_preferences,
+                requestBody.allergies,
+                variety=variety,
+                synthesize=False,
+            )
+
+    results = await asyncio.gather(
+        *(generate(day, variety_section(day, avoid)) for day in pending), return_exceptions=True
+    )
+    failures = {}
+    for day, result in zip(pending, results):
+        if isinstance(result, Exception):
+            failures[day] = result
+        elif result is None:
+            failures[day] = RuntimeError("Meal plan generation failed")
+        else:
+            plans[day] = result
+    generated = [day for day in pending if day in plans]
+
+    for _ in range(WEEKLY_PLAN_REPEAT_ROUNDS):
+        repeating = repeating_days(plans, generated, avoid)
+        if not repeating:
+            break
+        kept = avoid | meal_names(plans[day] for day in generated if day not in repeating)
+        results = await asyncio.gather(
+            *(generate(day, variety_section(day, kept)) for day in repeating), return_exceptions=True
+        )
+        for day, result in zip(repeating, results):
+            # A failed retry keeps the first plan: a repeated meal beats a missing day
+            if result is not None and not isinstance(result, Exception):
+                plans[day] = result
+        weekly_stats["days_regenerated"] += len(repeating)
+
+    weekly_stats["days_generated"] += len(generated)
+    weekly_stats["days_failed"] += len(failures)
+    return plans, failures
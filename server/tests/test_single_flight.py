@@ -0,0 +1,38 @@
+import asyncio
+import copy
+
+from ..benchmarks._harness import PROFILE, SAMPLE_PLAN, use_sqlite
+from ..controllers import mealList
+from ..schemas import promptInput
+
+CALLERS = 20
+EMAIL = "user0@bench.local"
+
+
+def test_concurrent_identical_generations_make_one_upstream_call(monkeypatch):
+    use_sqlite(users=1)
+    calls = []
+
+    async def generator(*args):
+        calls.append(args)
+        # Long enough for every caller to join the flight
+        await asyncio.sleep(0.2)
+        return copy.deepcopy(SAMPLE_PLAN)
+
+    monkeypatch.setattr(mealList, "meal_plan_generator", generator)
+    requestBody = promptInput(**PROFILE)
+
+    async def burst():
+        return await asyncio.gather(*(
+            mealList.generateDailyMealPlan(EMAIL, requestBody, fresh=True) for _ in range(CALLERS)
+        ))
+
+    results = asyncio.run(burst())
+
+    assert len(calls) == 1
+    assert {result.version for result in results} == {1}
+    assert all(result.meal_plan == results[0].meal_plan for result in results)
+    # Each caller gets its own copy, so one mutating its result cannot change another's
+    assert len({id(result) for result in results}) == CALLERS
+    assert len({id(result.meal_plan) for result in results}) == CALLERS
+    assert mealList.mealPlanFlights.stats()["in_flight"] == 0